@@ -21,6 +21,32 @@ try:
 except Exception as err:
     print(f"[TG BOT] start skipped: {err}")
 
+# === Фоновая перекодировка: тайлы чанков tiles_json -> tiles_blob, пути героев path_json -> RLE (WORLD_TILES_MIGRATE=0 — выключить) ===
+try:
+    if os.getenv("WORLD_TILES_MIGRATE", "1") != "0":
+        from world_models import start_tiles_migration
+        start_tiles_migration(app)
+except Exception as err:
+    print(f"[WorldTiles] migration start skipped: {err}")
+
+# === Write-behind состояния героев: периодический сброс + сброс при выходе (WORLD_STATE_WRITE_BEHIND=0 — выключить) ===
+try:
+    from services_world import start_state_flusher
+    start_state_flusher(app)
+except Exception as err:
+    print(f"[WorldState] flusher start skipped: {err}")
+
+# === Индекс построек/оверрайдов в памяти (WORLD_OVERLAY_INDEX=0 — выключить) ===
+try:
+    import world_overlay_index
+    if world_overlay_index.ENABLED:
+        from world_models import ensure_world_models
+        with app.app_context():
+            ensure_world_models()
+            world_overlay_index.load()
+except Exception as err:
+    print(f"[WorldIndex] preload skipped: {err}")
+
 # === Включаем perf_monitor ОДИН РАЗ, когда доступен app_context ===
 try:
     import perf_monitor
@@ -32,7 +32,7 @@ def _get_req_ctx() -> Dict[str, Any]:
 # -------------------- spans --------------------
 @contextmanager
 def span(kind: str, name: str, extra: Optional[Dict[str,Any]] = None):
-    _get_req_ctx()  # ensure ctx exists
+    sql0 = _get_req_ctx()["sql_count"]  # ensure ctx exists
     t0 = _now()
     err = None
     try:
@@ -42,7 +42,9 @@ def span(kind: str, name: str, extra: Optional[Dict[str,Any]] = None):
         raise
     finally:
         dt_ms = (_now() - t0) * 1000.0
-        rec = {"type": kind, "name": name, "dur_ms": round(dt_ms, 2), "rid": _get_req_ctx()["id"]}
+        ctx = _get_req_ctx()
+        rec = {"type": kind, "name": name, "dur_ms": round(dt_ms, 2), "rid": ctx["id"],
+               "sql_count": ctx["sql_count"] - sql0}  # запросов внутри спана (для сравнения до/после)
         if extra:
             rec.update(extra)
         if err:
@@ -80,7 +82,7 @@ def _wrap_services_world():
     except Exception:
         return
     for fname in [
-        "get_world_state", "get_patch_view",
+        "get_world_state", "project_world_state", "get_patch_view",
         "set_destination", "stop_hero", "set_speed",
         "build_here", "rest_here", "wake_up", "camp_start", "camp_leave",
         "_advance", "_patch",
@@ -10,7 +10,7 @@ from flask import (
 )
 
 from world_models import db, ensure_world_models, WorldOverride, WorldBuilding, WorldChunk
-from services_world import get_patch_view
+from services_world import get_patch_view, materialize_chunk, bump_overlay_version, state_cache_metrics, route_cache_metrics, plan_job_metrics
 
 bp = Blueprint("admin", __name__, url_prefix="/admin")
 
@@ -87,6 +87,17 @@ def tile_versions_json():
     return jsonify({"ok": True, "versions": _scan_tile_versions()})
 
 
+# Метрики world-кешей: write-behind состояния героев, кеш маршрутов (попадания, сэкономленное время),
+# фоновое планирование дальних маршрутов
+@bp.get("/world_metrics")
+def world_metrics():
+    guard = _require_admin()
+    if guard is not None:
+        return guard
+    return jsonify({"ok": True, "state_cache": state_cache_metrics(), "route_cache": route_cache_metrics(),
+                    "plan_jobs": plan_job_metrics()})
+
+
 # Патч карты вокруг произвольной точки — для бесконечной прокрутки
 @bp.get("/patch")
 def api_patch():
@@ -130,6 +141,7 @@ def api_set_tile():
         row = WorldOverride(x=x, y=y, tile_id=tile_id, reason=reason, author_id="admin", created_at=time.time())
         db.session.add(row)
     db.session.commit()
+    bump_overlay_version(x, y)
     return jsonify({"ok": True, "message": f"Tile at ({x},{y}) -> {tile_id}"})
 
 
@@ -149,6 +161,7 @@ def api_clear_tile():
     if row:
         db.session.delete(row)
         db.session.commit()
+        bump_overlay_version(x, y)
         return jsonify({"ok": True, "message": "override removed"})
     return jsonify({"ok": True, "message": "nothing to remove"})
 
@@ -175,6 +188,7 @@ def api_set_building():
     else:
         db.session.add(WorldBuilding(x=x, y=y, kind=kind, owner_id="admin", data_json="{}", created_at=time.time()))
     db.session.commit()
+    bump_overlay_version(x, y)
     return jsonify({"ok": True})
 
 
@@ -194,6 +208,7 @@ def api_del_building():
     if existing:
         db.session.delete(existing)
         db.session.commit()
+        bump_overlay_version(x, y)
         return jsonify({"ok": True, "message": "building removed"})
     return jsonify({"ok": True, "message": "nothing to remove"})
 
@@ -220,17 +235,13 @@ def api_set_climate():
     cy = (y // CHUNK_SIZE) if y >= 0 else -((abs(y) + CHUNK_SIZE - 1) // CHUNK_SIZE)
     row = WorldChunk.query.filter_by(cx=cx, cy=cy).first()
     if not row:
-        # форс-генерация патчем
-        get_patch_view(x, y)
-        row = WorldChunk.query.filter_by(cx=cx, cy=cy).first()
+        # форс-создание строки (в delta-режиме — пустой, климат берётся из сида)
+        row = materialize_chunk(cx, cy)
     if not row:
         return jsonify({"ok": False, "message": "chunk not found"}), 404
 
     import json as _json
-    try:
-        clim = _json.loads(row.climate_json or "{}")
-    except Exception:
-        clim = {}
+    clim = row.climate_dict()
     clim["temp"] = max(0.0, min(1.0, temp))
     clim["moist"] = max(0.0, min(1.0, moist))
     clim["forest_density"] = max(0.0, min(1.0, forest))
@@ -1,13 +1,21 @@
 import os, time
-from flask import Blueprint, render_template, jsonify, request, redirect, url_for, current_app
+from flask import Blueprint, Response, render_template, jsonify, request, redirect, url_for, current_app
 from helpers import current_user
 from services_world import (
     ensure_world_models,
-    get_world_state, set_destination, stop_hero, set_speed, build_here,
-    rest_here, wake_up, camp_start, camp_leave, get_patch_view
+    get_world_state, project_world_state, set_destination, stop_hero, set_speed, build_here,
+    rest_here, wake_up, camp_start, camp_leave, get_patch_view, get_chunk_views, pack_patch,
+    plan_job_status
 )
 from gathering_tables import serialize_modes, DEFAULT_MODE_KEY
 
+try:
+    import msgpack  # опционально: бинарный ответ для state/patch
+    MSGPACK_OK = True
+except Exception:
+    msgpack = None
+    MSGPACK_OK = False
+
 bp = Blueprint("world", __name__, url_prefix="/world")  # <-- ВАЖНО: __name__
 
 
@@ -50,6 +58,37 @@ def tile_versions_json():
     return jsonify({"ok": True, "versions": _scan_tile_versions()})
 
 
+def _patch_base():
+    """База дельта-патча клиента: "ox,oy,v" из JSON-тела или ?base=; None — старый клиент."""
+    data = request.get_json(silent=True) if request.method == "POST" else None
+    if isinstance(data, dict) and "base" in data:
+        return data.get("base") or ""
+    return request.args.get("base")
+
+
+def _wire_format() -> str:
+    """
+    "json" (по умолчанию, прежняя форма) / "packed" (палитра + base64 uint8) / "msgpack" (packed + bytes).
+    Выбор: ?fmt=packed|msgpack, заголовок X-Patch-Format или Accept: application/x-msgpack.
+    """
+    f = (request.args.get("fmt") or request.headers.get("X-Patch-Format") or "").strip().lower()
+    if not f and "application/x-msgpack" in (request.headers.get("Accept") or ""):
+        f = "msgpack"
+    if f == "msgpack" and not MSGPACK_OK:
+        f = "packed"
+    return f if f in ("packed", "msgpack") else "json"
+
+
+def _respond(data: dict):
+    fmt = _wire_format()
+    if fmt == "json" or not isinstance(data.get("patch"), dict):
+        return jsonify(data)
+    data = dict(data, patch=pack_patch(data["patch"], binary=(fmt == "msgpack")))
+    if fmt == "msgpack":
+        return Response(msgpack.packb(data, use_bin_type=True), mimetype="application/x-msgpack")
+    return jsonify(data)
+
+
 # --- STATE (POST основной) ---
 @bp.post("/state")
 def api_state():
@@ -58,14 +97,21 @@ def api_state():
         return jsonify({"ok": False, "message": "no_user"}), 401
     ensure_world_models()
     uid = getattr(u, "id", u)   # строго передаём id, а не объект
-    return jsonify(get_world_state(uid))
+    return _respond(get_world_state(uid, patch_base=_patch_base()))
 
 
-# --- GET-алиас на тот же контроллер ---
+# --- GET: только чтение (проекция на «сейчас» без записи в БД) ---
 @bp.get("/state")
 def api_state_get():
-    # используем тот же код, чтобы не дублировать логику
-    return api_state()
+    u = current_user()
+    if not u:
+        return jsonify({"ok": False, "message": "no_user"}), 401
+    ensure_world_models()
+    uid = getattr(u, "id", u)
+    resp = _respond(project_world_state(uid, patch_base=_patch_base()))
+    resp.headers["Cache-Control"] = "private, max-age=1"
+    resp.headers["Vary"] = "Accept, X-Patch-Format"
+    return resp
 
 
 @bp.post("/set_dest")
@@ -84,6 +130,16 @@ def api_set_dest():
     return jsonify(res), (200 if res.get("ok") else 400)
 
 
+@bp.get("/plan_job")
+def api_plan_job():
+    u = current_user()
+    if not u:
+        return jsonify({"ok": False, "message": "no_user"}), 401
+    uid = getattr(u, "id", u)
+    res = plan_job_status(uid, request.args.get("id", ""))
+    return jsonify(res), (200 if res.get("ok") else 404)
+
+
 @bp.post("/stop")
 def api_stop():
     u = current_user()
@@ -163,4 +219,30 @@ def api_patch():
     except Exception:
         return jsonify({"ok": False, "message": "cx/cy required"}), 400
     # Патч общий (просмотр карты), user_id не требуется
-    return jsonify(get_patch_view(cx, cy))
+    return _respond(get_patch_view(cx, cy, patch_base=_patch_base()))
+
+
+# --- ЧАНКИ ЦЕЛИКОМ: /world/chunks?c=cx,cy;cx,cy... (ETag + If-None-Match/304) ---
+@bp.get("/chunks")
+def api_chunks():
+    u = current_user()
+    if not u:  # каждый чанк — генерация/SELECT: анонимам не даём
+        return jsonify({"ok": False, "message": "no_user"}), 401
+    try:
+        coords = [tuple(int(v) for v in part.split(",")) for part in (request.args.get("c") or "").split(";") if part.strip()]
+        if not coords or any(len(c) != 2 for c in coords):
+            raise ValueError
+    except Exception:
+        return jsonify({"ok": False, "message": "c=cx,cy;cx,cy... required"}), 400
+    known = request.if_none_match.as_set()  # строгие ETag-и: и всей пачки, и отдельных чанков
+    data = get_chunk_views(coords, known)
+    if data["etag"] in known:
+        resp = Response(status=304)
+    else:
+        resp = jsonify(data)
+    resp.set_etag(data["etag"])
+    if resp.status_code == 200 and any(c.get("same") for c in data["chunks"]):
+        resp.headers["Cache-Control"] = "no-store"  # неполное тело (часть чанков без тайлов) не кешируем
+    else:
+        resp.headers["Cache-Control"] = "private, no-cache"  # хранить можно, но перед использованием — ревалидация
+    return resp
@@ -1,16 +1,26 @@
-import time, json, heapq, math
+import time, json, heapq, math, os, zlib, base64, threading, bisect, operator
+from array import array
+from itertools import accumulate
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
 from dataclasses import dataclass, field
 from typing import Dict, Any, List, Tuple, Optional
 
+from sqlalchemy import event, bindparam, and_, or_, inspect as sa_inspect
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value, flag_modified
 
 from models import db
-from world_models import ensure_world_models, WorldState, WorldChunk, WorldBuilding, WorldOverride
+from perf_logger import log as perf_log
+from world_models import ensure_world_models, tiles_columns, insert_chunk_rows, WorldState, WorldChunk, WorldBuilding, WorldOverride
 from world_tiles import *  # константы тайлов + is_passable, tile_speed, tile_fatigue_mul, tile_rest_mul, tile_env_fatigue_mul
 import world_tiles as W     # публичные утилиты для UI: env_levels, и доступ к тем же функциям
-from world_gen import generate_chunk
-from world_weather import pick_weather_for_chunk
-from world_biome_evolver import evolve_tile_ephemeral  # ЭФЕМЕРНАЯ смена биомов (снег/болото/сухость)
+from world_gen import baseline_chunk
+from world_chunk_codec import pack_grid
+import world_overlay_index as overlay_index  # in-memory индекс построек/оверрайдов по чанкам
+from world_weather import pick_weather_for_chunk, pick_weather_for_chunks
+from world_biome_evolver import evolve_tile_ephemeral, evolve_tiles_ephemeral  # ЭФЕМЕРНАЯ смена биомов (снег/болото/сухость)
 from world_biome_persist import evolve_chunk_persistent  # ПЕРМАНЕНТНАЯ эволюция биомов
 from world_tuning import (
     bucket_seconds,
@@ -122,6 +132,11 @@ _VIEW_PHASE_STEPS = 2
 # Ограничение частоты перманентной эволюции для одного чанка (подчиняется ускорению)
 _EVOLVE_MIN_PERIOD_SEC = evolve_min_period_seconds()
 
+# Хранение чанков: "full" — строка на каждый посещённый чанк (как раньше),
+# "delta" — только изменённые (эволюция/админка); нетронутое берётся из сида (world_gen.baseline_chunk)
+_CHUNK_STORAGE = (os.getenv("WORLD_CHUNK_STORAGE", "full").strip().lower() or "full")
+_DELTA_CHUNKS = _CHUNK_STORAGE == "delta"
+
 
 # — окно видимой области и запас подрисовки —
 _VIEW_W = 15
@@ -143,10 +158,122 @@ class _TileCtx:
     tiles_by_chunk: Dict[Tuple[int,int], List[List[str]]] = field(default_factory=dict)
     climate_by_chunk: Dict[Tuple[int,int], Dict[str,float]] = field(default_factory=dict)
     weather_by_chunk: Dict[Tuple[int,int], Dict[str,Any]] = field(default_factory=dict)
+    # урбанизация для погоды — своя у каждого чанка (_influence_of_chunk), а не у прямоугольника
+    # запроса: одна модель у вида (патч, /world/chunks) и у логики (герой, профиль маршрута,
+    # планировщик), иначе одна и та же клетка стоила бы по-разному в зависимости от камеры/маршрута
+    chunk_influence: bool = False
+    influence_by_chunk: Dict[Tuple[int,int], float] = field(default_factory=dict)
+
+
+# ---- снимок мира на один запрос (get_world_state) ----
+# Постройки/оверрайды объединённого прямоугольника запроса — одним SELECT-ом каждое,
+# строки чанков (с запасом в кольцо префетча) — одним диапазонным SELECT-ом; всё лениво.
+# Постройки — кортежи, а не ORM-объекты: их не «протухает» commit; строки чанков
+# после commit перечитываются тем же одним запросом (иначе refresh по строке на каждую).
+# Вне покрытия снимка хелперы ходят в БД как раньше.
+_SnapBuilding = namedtuple("_SnapBuilding", "id x y kind owner_id data_json")
+_SnapOverride = namedtuple("_SnapOverride", "x y tile_id")
+
+class _WorldSnapshot:
+    def __init__(self, x0:int, y0:int, x1:int, y1:int):
+        self.rect = (x0, y0, x1, y1)
+        self.crect = (x0 // CHUNK_SIZE - 1, y0 // CHUNK_SIZE - 1, x1 // CHUNK_SIZE + 1, y1 // CHUNK_SIZE + 1)
+        self._blds: Optional[Dict[Tuple[int,int], _SnapBuilding]] = None
+        self._ovrs: Optional[Dict[Tuple[int,int], _SnapOverride]] = None
+        self._chunks: Optional[Dict[Tuple[int,int], WorldChunk]] = None
+
+    def covers(self, x0:int, y0:int, x1:int, y1:int) -> bool:
+        r = self.rect
+        return r[0] <= x0 and r[1] <= y0 and x1 <= r[2] and y1 <= r[3]
+
+    def covers_chunk(self, cx:int, cy:int) -> bool:
+        r = self.crect
+        return r[0] <= cx <= r[2] and r[1] <= cy <= r[3]
+
+    def _load_overlays(self):
+        x0, y0, x1, y1 = self.rect
+        q = db.session.query(
+            WorldBuilding.id, WorldBuilding.x, WorldBuilding.y,
+            WorldBuilding.kind, WorldBuilding.owner_id, WorldBuilding.data_json
+        ).filter(
+            WorldBuilding.x >= x0, WorldBuilding.x <= x1,
+            WorldBuilding.y >= y0, WorldBuilding.y <= y1
+        )
+        self._blds = {(b[1], b[2]): _SnapBuilding(*b) for b in q.all()}
+        q = db.session.query(WorldOverride.x, WorldOverride.y, WorldOverride.tile_id).filter(
+            WorldOverride.x >= x0, WorldOverride.x <= x1,
+            WorldOverride.y >= y0, WorldOverride.y <= y1
+        )
+        self._ovrs = {(o[0], o[1]): _SnapOverride(*o) for o in q.all()}
+
+    def buildings_in(self, x0:int, y0:int, x1:int, y1:int) -> List[_SnapBuilding]:
+        if self._blds is None:
+            self._load_overlays()
+        return [b for (x, y), b in self._blds.items() if x0 <= x <= x1 and y0 <= y <= y1]
+
+    def overlay_maps(self, x0:int, y0:int, x1:int, y1:int):
+        if self._blds is None:
+            self._load_overlays()
+        bmap = {k: b.kind for k, b in self._blds.items() if x0 <= k[0] <= x1 and y0 <= k[1] <= y1}
+        omap = {k: o.tile_id for k, o in self._ovrs.items() if x0 <= k[0] <= x1 and y0 <= k[1] <= y1}
+        return bmap, omap
+
+    def building_at(self, x:int, y:int) -> Optional[_SnapBuilding]:
+        if self._blds is None:
+            self._load_overlays()
+        return self._blds.get((x, y))
+
+    def override_at(self, x:int, y:int) -> Optional[_SnapOverride]:
+        if self._ovrs is None:
+            self._load_overlays()
+        return self._ovrs.get((x, y))
+
+    def chunk(self, cx:int, cy:int) -> Optional[WorldChunk]:
+        if self._chunks is None:
+            c0x, c0y, c1x, c1y = self.crect
+            q = WorldChunk.query.filter(
+                WorldChunk.cx >= c0x, WorldChunk.cx <= c1x,
+                WorldChunk.cy >= c0y, WorldChunk.cy <= c1y
+            )
+            self._chunks = {(r.cx, r.cy): r for r in q.all()}
+        return self._chunks.get((cx, cy))
+
+    def add_chunk(self, row: WorldChunk):
+        if self._chunks is not None:
+            self._chunks[(row.cx, row.cy)] = row
+
+    def expire_chunks(self):
+        self._chunks = None
+
+
+_SNAP_TLS = threading.local()
+
+def _snapshot() -> Optional[_WorldSnapshot]:
+    return getattr(_SNAP_TLS, "cur", None)
+
+@contextmanager
+def _world_snapshot(x0:int, y0:int, x1:int, y1:int):
+    prev = _snapshot()
+    _SNAP_TLS.cur = _WorldSnapshot(x0, y0, x1, y1)
+    try:
+        yield _SNAP_TLS.cur
+    finally:
+        _SNAP_TLS.cur = prev
+
+@event.listens_for(Session, "after_commit")
+def _snapshot_after_commit(session):
+    snap = _snapshot()
+    if snap is not None:
+        snap.expire_chunks()
 
 
 def _rect_overlay_maps(x0:int,y0:int,x1:int,y1:int):
-    """Собирает все постройки/оверрайды в прямоугольнике единым запросом."""
+    """Собирает все постройки/оверрайды в прямоугольнике (индекс → снимок → единый запрос)."""
+    if overlay_index.ENABLED:
+        return overlay_index.overlay_maps(x0, y0, x1, y1)
+    snap = _snapshot()
+    if snap is not None and snap.covers(x0, y0, x1, y1):
+        return snap.overlay_maps(x0, y0, x1, y1)
     blds = WorldBuilding.query.filter(
         WorldBuilding.x >= x0, WorldBuilding.x <= x1,
         WorldBuilding.y >= y0, WorldBuilding.y <= y1
@@ -161,21 +288,35 @@ def _rect_overlay_maps(x0:int,y0:int,x1:int,y1:int):
 
 
 def _get_chunk(cx:int, cy:int) -> Optional[WorldChunk]:
+    snap = _snapshot()
+    if snap is not None and snap.covers_chunk(cx, cy):
+        return snap.chunk(cx, cy)
     return WorldChunk.query.filter_by(cx=cx, cy=cy).first()
 
+def _new_chunk_row(cx:int, cy:int) -> WorldChunk:
+    """Строка чанка (ещё не в сессии). В delta-режиме — пустая: тайлы/климат берутся из сида."""
+    if _DELTA_CHUNKS:
+        # нетронутый чанк считаем «только что эволюционировавшим»: иначе первый тик
+        # проинтегрировал бы экологию с эпохи (last_evolve_ts=0) и мутировал бы почти любой чанк
+        now = _now()
+        return WorldChunk(cx=cx, cy=cy, size=CHUNK_SIZE, tiles_json="", climate_json="",
+                          created_at=now, last_evolve_ts=now - evolve_min_period_seconds())
+    tiles, climate = baseline_chunk(cx, cy, CHUNK_SIZE)  # LRU генератора: повторная генерация не нужна
+    row = WorldChunk(
+        cx=cx, cy=cy, size=CHUNK_SIZE,
+        climate_json=json.dumps(climate, separators=(",", ":")),
+        created_at=_now(), last_evolve_ts=0.0
+    )
+    row.set_tiles_matrix(tiles)
+    return row
+
 def _ensure_chunk(cx:int, cy:int) -> WorldChunk:
     """Идёмпотентное создание чанка с защитой от гонки вставки."""
     row = _get_chunk(cx, cy)
     if row:
         return row
 
-    tiles, climate = generate_chunk(cx, cy, CHUNK_SIZE)
-    row = WorldChunk(
-        cx=cx, cy=cy, size=CHUNK_SIZE,
-        tiles_json=json.dumps(tiles, separators=(",", ":")),
-        climate_json=json.dumps(climate, separators=(",", ":")),
-        created_at=_now()
-    )
+    row = _new_chunk_row(cx, cy)
     db.session.add(row)
     try:
         db.session.commit()
@@ -183,36 +324,109 @@ def _ensure_chunk(cx:int, cy:int) -> WorldChunk:
         db.session.rollback()
         row = _get_chunk(cx, cy)
         if not row:
-            row = WorldChunk(
-                cx=cx, cy=cy, size=CHUNK_SIZE,
-                tiles_json=json.dumps(tiles, separators=(",", ":")),
-                climate_json=json.dumps(climate, separators=(",", ":")),
-                created_at=_now()
-            )
+            row = _new_chunk_row(cx, cy)
             db.session.add(row); db.session.commit()
+    snap = _snapshot()
+    if snap is not None:
+        snap.add_chunk(row)
     return row
 
+def materialize_chunk(cx:int, cy:int) -> WorldChunk:
+    """Публичная обёртка: гарантированно получить строку чанка (нужно, например, для правки климата)."""
+    return _ensure_chunk(cx, cy)
+
+# ---- чтение без записи (поиск пути, превью) ----
+# Внутри _readonly_chunks() отсутствующий чанк не INSERT-ится: тайлы/климат — из LRU генератора
+# (строка-времянка вне сессии). Неудачный поиск не оставляет шлейфа новых строк, а задержка
+# поиска не включает коммиты SQLite. WORLD_PERSIST_READ_CHUNKS=1 — такие чанки всё же
+# сохраняются, но позже и пачкой (persist_queued_chunks из фонового потока сброса).
+_RO_TLS = threading.local()
+_PERSIST_READS = os.getenv("WORLD_PERSIST_READ_CHUNKS", "0").strip() == "1"
+_PERSIST_Q: "OrderedDict[Tuple[int,int], None]" = OrderedDict()
+_PERSIST_Q_MAX = 4096
+CHUNK_READ_STATS = {"transient": 0, "queued": 0, "persisted": 0}
+
+@contextmanager
+def _readonly_chunks():
+    prev = getattr(_RO_TLS, "on", False)
+    _RO_TLS.on = True
+    try:
+        yield
+    finally:
+        _RO_TLS.on = prev
+
+def persist_queued_chunks(limit: int = 256) -> int:
+    """Пачкой вставить чанки, прочитанные в режиме «без записи» (конфликт (cx,cy) — пропуск)."""
+    keys = []
+    while _PERSIST_Q and len(keys) < limit:
+        keys.append(_PERSIST_Q.popitem(last=False)[0])
+    if not keys:
+        return 0
+    now = _now()
+    rows = []
+    for cx, cy in keys:
+        tiles, climate = baseline_chunk(cx, cy, CHUNK_SIZE)
+        rows.append({"cx": cx, "cy": cy, "size": CHUNK_SIZE, **tiles_columns(tiles),
+                     "climate_json": json.dumps(climate, separators=(",", ":")),
+                     "created_at": now, "eco_json": None, "last_evolve_ts": 0.0})
+    n = insert_chunk_rows(rows)
+    CHUNK_READ_STATS["persisted"] += n
+    return n
+
+def _chunk_for_read(cx:int, cy:int) -> WorldChunk:
+    """Строка для чтения. В delta-режиме и в _readonly_chunks() НЕ создаёт запись: нет строки — временная из сида."""
+    readonly = getattr(_RO_TLS, "on", False)
+    if not _DELTA_CHUNKS and not readonly:
+        return _ensure_chunk(cx, cy)
+    row = _get_chunk(cx, cy)
+    if row is not None:
+        return row
+    if not _DELTA_CHUNKS:
+        CHUNK_READ_STATS["transient"] += 1
+        if _PERSIST_READS and (cx, cy) not in _PERSIST_Q and len(_PERSIST_Q) < _PERSIST_Q_MAX:
+            _PERSIST_Q[(cx, cy)] = None
+            CHUNK_READ_STATS["queued"] += 1
+    return _new_chunk_row(cx, cy)
+
 
 # ---- L2 TTL-кеш на процесс ----
+# LRU-кеши модуля (OrderedDict: патчи, скины, сетки цены, порталы HPA*, компоненты, маршруты,
+# профили, история видов) читают и вытесняют одновременно потоки запросов и пул планировщика:
+# get + move_to_end и вставка + вытеснение — под одной блокировкой (сам расчёт — вне её).
+_CACHE_LOCK = threading.RLock()
 _TILE_CACHE: Dict[Tuple[int,int], Tuple[float, List[List[str]]]] = {}
 _CLIMATE_CACHE: Dict[Tuple[int,int], Tuple[float, Dict[str,float]]] = {}
 _CACHE_TTL = 15.0
 
+# версия тайлов чанка (crc сохранённых тайлов; 0 — нетронутый) — часть ключа кеша скинов
+_TILE_VER: Dict[Tuple[int,int], int] = {}
+
 def _invalidate_chunk_cache(cx:int, cy:int):
     """Сбрасываем кэши, если чанк реально мутировал, чтобы сразу увидеть изменения."""
     _TILE_CACHE.pop((cx, cy), None)
+    _TILE_VER.pop((cx, cy), None)
+    _skin_cache_drop_chunk(cx, cy)
+    _bump_chunk_overlay(cx, cy)
     # климат мы не меняем при перманентной эволюции — обычно не трогаем:
     # _CLIMATE_CACHE.pop((cx, cy), None)
 
+def _chunk_tiles_version(row: WorldChunk) -> int:
+    if row.tiles_blob:
+        return zlib.crc32(row.tiles_blob)
+    if row.tiles_json:
+        return zlib.crc32(row.tiles_json.encode("utf-8"))
+    return 0
+
 def _tiles_of(cx:int, cy:int) -> List[List[str]]:
     now = _now()
     key = (cx,cy)
     ts, val = _TILE_CACHE.get(key, (0.0, None))
     if val is not None and now - ts < _CACHE_TTL:
         return val
-    row = _ensure_chunk(cx,cy)
-    tiles = json.loads(row.tiles_json or "[]")
+    row = _chunk_for_read(cx,cy)
+    tiles = row.tiles_matrix()
     _TILE_CACHE[key] = (now, tiles)
+    _TILE_VER[key] = _chunk_tiles_version(row)
     return tiles
 
 def _climate_of(cx:int, cy:int) -> Dict[str,float]:
@@ -221,9 +435,8 @@ def _climate_of(cx:int, cy:int) -> Dict[str,float]:
     ts, val = _CLIMATE_CACHE.get(key, (0.0, None))
     if val is not None and now - ts < _CACHE_TTL:
         return val
-    row = _ensure_chunk(cx, cy)
-    try: climate = json.loads(row.climate_json or "{}")
-    except Exception: climate = {}
+    row = _chunk_for_read(cx, cy)
+    climate = row.climate_dict()
     _CLIMATE_CACHE[key] = (now, climate)
     return climate
 
@@ -243,21 +456,162 @@ def _climate_cached(ctx:_TileCtx, cx:int, cy:int):
         ctx.climate_by_chunk[key] = c
     return c
 
+# ---- версии оверлеев по чанкам + общий кеш готовых патчей ----
+# Версия чанка растёт при любой записи построек/оверрайдов в нём (и при мутации тайлов).
+# Патч кешируется по (прямоугольник, бакет, шаг фазы, версии чанков под ним) и
+# отдаётся всем игрокам, стоящим в той же точке; TTL ограничивает устаревание
+# погоды и записей из других воркеров.
+_OVERLAY_VER: Dict[Tuple[int,int], int] = {}
+
+_PATCH_CACHE: "OrderedDict[tuple, Tuple[float, Dict[str,Any]]]" = OrderedDict()
+_PATCH_CACHE_MAX = int(os.getenv("WORLD_PATCH_CACHE", "512") or 512)
+_PATCH_CACHE_TTL = float(os.getenv("WORLD_PATCH_CACHE_TTL", "2.0") or 2.0)
+PATCH_CACHE_STATS = {"hit": 0, "miss": 0, "evict": 0}
+
+def _bump_chunk_overlay(cx:int, cy:int):
+    _OVERLAY_VER[(cx, cy)] = _OVERLAY_VER.get((cx, cy), 0) + 1
+
+def _on_overlay_reload(chunks):
+    # индекс перечитан из-за записи в другом воркере: чанки с изменившимися постройками/
+    # оверрайдами получают новую версию — патчи, сетки стоимостей и маршруты по ним устаревают
+    for cx, cy in chunks:
+        _bump_chunk_overlay(cx, cy)
+
+overlay_index.on_reload(_on_overlay_reload)
+
+def bump_overlay_version(x:int, y:int):
+    """
+    Вызывать после commit записи постройки/оверрайда в клетке (x,y):
+    инвалидирует патчи вокруг и обновляет индекс построек (+счётчик для других воркеров).
+    """
+    cx, cy = x // CHUNK_SIZE, y // CHUNK_SIZE
+    _bump_chunk_overlay(cx, cy)
+    overlay_index.touch(x, y)
+
+def _overlay_version(x0:int, y0:int, x1:int, y1:int) -> tuple:
+    return tuple(
+        _OVERLAY_VER.get((cx, cy), 0)
+        for cy in range(y0 // CHUNK_SIZE, y1 // CHUNK_SIZE + 1)
+        for cx in range(x0 // CHUNK_SIZE, x1 // CHUNK_SIZE + 1)
+    )
+
+def _patch_cache_get(key: tuple) -> Optional[Dict[str,Any]]:
+    with _CACHE_LOCK:
+        v = _PATCH_CACHE.get(key)
+        if v is None or _now() - v[0] > _PATCH_CACHE_TTL:
+            if v is not None:
+                _PATCH_CACHE.pop(key, None)
+            PATCH_CACHE_STATS["miss"] += 1
+            return None
+        _PATCH_CACHE.move_to_end(key)
+    PATCH_CACHE_STATS["hit"] += 1
+    return v[1]
+
+def _patch_cache_put(key: tuple, val: Dict[str,Any]):
+    with _CACHE_LOCK:
+        _PATCH_CACHE[key] = (_now(), val)
+        _PATCH_CACHE.move_to_end(key)
+        while len(_PATCH_CACHE) > _PATCH_CACHE_MAX:
+            _PATCH_CACHE.popitem(last=False)
+            PATCH_CACHE_STATS["evict"] += 1
+
+
+# ---- LRU готовых «видовых» слоёв чанка (база + эфемерные скины, без построек) ----
+# Скин чанка зависит только от (тайлы, климат, погода, бакет, квантованная фаза) —
+# одинаков для всех игроков в округе, поэтому считаем его один раз на шаг фазы.
+_SKIN_CACHE: "OrderedDict[tuple, List[List[str]]]" = OrderedDict()
+_SKIN_KEYS_BY_CHUNK: Dict[Tuple[int,int], set] = {}
+_SKIN_CACHE_MAX = int(os.getenv("WORLD_SKIN_CACHE", "1024") or 1024)
+SKIN_CACHE_STATS = {"hit": 0, "miss": 0, "evict": 0}
+
+def _skin_cache_drop_chunk(cx:int, cy:int):
+    with _CACHE_LOCK:
+        for k in _SKIN_KEYS_BY_CHUNK.pop((cx, cy), ()):
+            _SKIN_CACHE.pop(k, None)
+
+def _skin_cache_put(key: tuple, layer: List[List[str]]):
+    with _CACHE_LOCK:
+        _SKIN_CACHE[key] = layer
+        _SKIN_CACHE.move_to_end(key)
+        _SKIN_KEYS_BY_CHUNK.setdefault((key[0], key[1]), set()).add(key)
+        while len(_SKIN_CACHE) > _SKIN_CACHE_MAX:
+            old, _ = _SKIN_CACHE.popitem(last=False)
+            ks = _SKIN_KEYS_BY_CHUNK.get((old[0], old[1]))
+            if ks is not None:
+                ks.discard(old)
+                if not ks:
+                    _SKIN_KEYS_BY_CHUNK.pop((old[0], old[1]), None)
+            SKIN_CACHE_STATS["evict"] += 1
+
+def _chunk_view_layer(ctx:_TileCtx, cx:int, cy:int, phase: float) -> List[List[str]]:
+    """Весь чанк 32×32 с эфемерными скинами для (бакет, фаза) — из LRU или одним пакетным расчётом."""
+    tiles = _tiles_cached(ctx, cx, cy)
+    clim = _climate_cached(ctx, cx, cy)
+    wthr = _weather_for_chunk(ctx, cx, cy)
+    key = (
+        cx, cy, ctx.now_bucket, phase,
+        wthr.get("key"), wthr.get("precip"),
+        _TILE_VER.get((cx, cy), 0),
+        tuple(float(clim.get(k, 0.0)) for k in ("temp", "moist", "height_mean", "forest_density")),
+    )
+    with _CACHE_LOCK:
+        layer = _SKIN_CACHE.get(key)
+        if layer is not None:
+            _SKIN_CACHE.move_to_end(key)
+    if layer is not None:
+        SKIN_CACHE_STATS["hit"] += 1
+        return layer
+    SKIN_CACHE_STATS["miss"] += 1
+    h = len(tiles); w = len(tiles[0]) if h else 0
+    crow = [clim] * w; wrow = [wthr] * w
+    layer = evolve_tiles_ephemeral(tiles, cx*CHUNK_SIZE, cy*CHUNK_SIZE, [crow] * h, [wrow] * h,
+                                   ctx.now_bucket, phase)
+    _skin_cache_put(key, layer)
+    return layer
+
+def _chunk_influence(ctx:_TileCtx, cx:int, cy:int) -> float:
+    if not ctx.chunk_influence:
+        return ctx.influence
+    v = ctx.influence_by_chunk.get((cx, cy))
+    if v is None:
+        v = ctx.influence_by_chunk[(cx, cy)] = _influence_of_chunk(cx, cy)
+    return v
+
 def _weather_for_chunk(ctx:_TileCtx, cx:int, cy:int):
     key=(cx,cy)
     w = ctx.weather_by_chunk.get(key)
     if w is None:
         clim = _climate_cached(ctx, cx, cy)
         # передаём координаты и текущее время для плавной интерполяции внутри погоды
-        w = pick_weather_for_chunk(clim, ctx.influence, ctx.now_bucket, cx=cx, cy=cy, now_ts=_now())
+        w = pick_weather_for_chunk(clim, _chunk_influence(ctx, cx, cy), ctx.now_bucket, cx=cx, cy=cy, now_ts=_now())
         ctx.weather_by_chunk[key] = w
     return w
 
+def _prefetch_weather(ctx:_TileCtx, coords):
+    """Погода сразу для набора чанков (поля шума — пачкой), дальше _weather_for_chunk берёт из ctx."""
+    todo = [c for c in coords if c not in ctx.weather_by_chunk]
+    if len(todo) <= 1:
+        return
+    if ctx.chunk_influence and overlay_index.ENABLED:
+        # урбанизация всех чанков набора — одной сеткой по индексу построек
+        xs = [c[0] for c in todo]; ys = [c[1] for c in todo]
+        cx0, cy0 = min(xs), min(ys)
+        grid = overlay_index.chunk_influence_grid(cx0, cy0, max(xs), max(ys))
+        for cx, cy in todo:
+            ctx.influence_by_chunk.setdefault((cx, cy), float(grid[cy - cy0][cx - cx0]))
+    ctx.weather_by_chunk.update(pick_weather_for_chunks(
+        todo, lambda cx, cy: _climate_cached(ctx, cx, cy), lambda cx, cy: _chunk_influence(ctx, cx, cy),
+        ctx.now_bucket, now_ts=_now()))
+
 
 # -------------------- ПЕРМАНЕНТНАЯ ЭВОЛЮЦИЯ/ПРЕФЕТЧ --------------------
 
 _PREFETCH_GUARD: Dict[Tuple[int,int], float] = {}
 _PREFETCH_COOLDOWN = prefetch_cooldown_seconds()
+# delta-режим: когда последний раз прогоняли эволюцию нетронутого чанка (строки в БД нет) —
+# не чаще раза в период, как и для сохранённых строк
+_TRANSIENT_EVO: "OrderedDict[Tuple[int,int], float]" = OrderedDict()
+_TRANSIENT_EVO_MAX = 8192
 
 def _maybe_evolve_chunk(row: WorldChunk, influence: float = 0.0, now_ts: Optional[float] = None, *, autocommit: bool = True):
     """
@@ -266,31 +620,47 @@ def _maybe_evolve_chunk(row: WorldChunk, influence: float = 0.0, now_ts: Optiona
     """
     if not row:
         return
+    if row.id is None and getattr(_RO_TLS, "on", False):
+        return  # времянка из _readonly_chunks(): сохранить результат всё равно нельзя
     now_ts = float(now_ts or _now())
     last = float(getattr(row, "last_evolve_ts", 0.0) or 0.0)
     # частоту ограничиваем здесь, но метку времени НЕ выставляем
     from world_tuning import evolve_min_period_seconds
-    if now_ts - last < evolve_min_period_seconds():
+    transient = row.id is None and _DELTA_CHUNKS
+    if transient:
+        key = (row.cx, row.cy)
+        with _CACHE_LOCK:
+            if now_ts - _TRANSIENT_EVO.get(key, float("-inf")) < evolve_min_period_seconds():
+                return  # рано
+            _TRANSIENT_EVO[key] = now_ts
+            _TRANSIENT_EVO.move_to_end(key)
+            while len(_TRANSIENT_EVO) > _TRANSIENT_EVO_MAX:
+                _TRANSIENT_EVO.popitem(last=False)
+        # нетронутый чанк из сида: ровно один период экологии (now_ts мог быть взят раньше создания строки)
+        row.last_evolve_ts = min(last, now_ts - evolve_min_period_seconds())
+    elif now_ts - last < evolve_min_period_seconds():
         return  # рано
 
-    try:
-        climate = json.loads(row.climate_json or "{}")
-    except Exception:
-        climate = {}
+    climate = row.climate_dict()
 
     now_bucket = math.floor(now_ts/1800.0)*1800.0  # ок, это только для погоды
     weather = pick_weather_for_chunk(climate, float(influence or 0.0), now_bucket, cx=row.cx, cy=row.cy, now_ts=now_ts)
 
-    # evolve_chunk_persistent САМА обновит row.last_evolve_ts и eco_json/tiles_json при изменениях
+    # evolve_chunk_persistent САМА обновит row.last_evolve_ts и eco_json/тайлы (set_tiles_matrix) при изменениях
     changed = evolve_chunk_persistent(row, climate, weather, now_ts)
 
     # если тайлы изменились — сбросим кэш по чанку (иначе UI может показывать старое до TTL)
     if changed:
         try:
-            _TILE_CACHE.pop((row.cx, row.cy), None)
+            _invalidate_chunk_cache(row.cx, row.cy)
         except Exception:
             pass
 
+    # delta-режим: времянка из сида пишется, только если мутировали тайлы. Её экология — один
+    # период от нуля по сиду и текущей погоде, в следующий раз она так же пересчитывается, так что
+    # хранить нечего: иначе world_chunks рос бы по следам игроков, а не по изменениям мира.
+    if transient and not changed:
+        return
     db.session.add(row)
     if autocommit:
         try:
@@ -309,7 +679,7 @@ def _prefetch_ring(cx:int, cy:int, radius:int=1):
     touched = False
     for dy in range(-radius, radius+1):
         for dx in range(-radius, radius+1):
-            r = _ensure_chunk(cx+dx, cy+dy)
+            r = _chunk_for_read(cx+dx, cy+dy)
             _maybe_evolve_chunk(r, influence=0.0, now_ts=now_ts, autocommit=False)
             touched = True
     if touched:
@@ -322,9 +692,20 @@ def _prefetch_ring(cx:int, cy:int, radius:int=1):
 # -------------------- TILE/BUILDING LOOKUPS --------------------
 
 def _building_at(x:int,y:int) -> Optional[WorldBuilding]:
+    """Только для чтения: из индекса/снимка приходит кортеж с теми же полями, не ORM-объект."""
+    if overlay_index.ENABLED:
+        return overlay_index.building_at(x, y)
+    snap = _snapshot()
+    if snap is not None and snap.covers(x, y, x, y):
+        return snap.building_at(x, y)
     return WorldBuilding.query.filter_by(x=x, y=y).first()
 
 def _override_at(x:int,y:int) -> Optional[WorldOverride]:
+    if overlay_index.ENABLED:
+        return overlay_index.override_at(x, y)
+    snap = _snapshot()
+    if snap is not None and snap.covers(x, y, x, y):
+        return snap.override_at(x, y)
     return WorldOverride.query.filter_by(x=x, y=y).first()
 
 def _chunk_of_xy(x:int,y:int) -> Tuple[int,int,int,int]:
@@ -362,14 +743,7 @@ def _tile_at(x: int, y: int, ctx: Optional[_TileCtx] = None, *, for_view: bool =
         climate = _climate_cached(ctx, cx, cy)
         weather = _weather_for_chunk(ctx, cx, cy)
 
-        # фаза
-        now = _now()
-        phase = (now - ctx.now_bucket) / 1800.0
-        if for_view:
-            step = max(1, int(_VIEW_PHASE_STEPS))
-            phase = math.floor(phase * step) / step
-
-        return evolve_tile_ephemeral(base, x, y, climate, weather, ctx.now_bucket, phase)
+        return evolve_tile_ephemeral(base, x, y, climate, weather, ctx.now_bucket, _view_phase(ctx.now_bucket, for_view))
 
     # Медленный (совместимость)
     ov = _override_at(x,y)
@@ -393,6 +767,83 @@ def _tile_at(x: int, y: int, ctx: Optional[_TileCtx] = None, *, for_view: bool =
     return evolve_tile_ephemeral(base, x, y, climate, weather, now_bucket, phase)
 
 
+def _view_phase(now_bucket: float, for_view: bool) -> float:
+    phase = (_now() - now_bucket) / 1800.0
+    if for_view:
+        step = max(1, int(_VIEW_PHASE_STEPS))
+        phase = math.floor(phase * step) / step
+    return phase
+
+def _tiles_rect(ctx: _TileCtx, x0: int, y0: int, w: int, h: int, *, for_view: bool = False) -> List[List[str]]:
+    """
+    То же, что _tile_at(x, y, ctx) для каждой клетки прямоугольника, но пакетно:
+    эфемерные скины считаются одним evolve_tiles_ephemeral, постройки/оверрайды — поверх.
+    for_view=True — фаза квантована, поэтому просто режем готовые слои чанков из LRU.
+    """
+    if for_view:
+        out = _tiles_rect_view(ctx, x0, y0, w, h)
+        _apply_overlays(ctx, out, x0, y0, w, h)
+        return out
+
+    _prefetch_weather(ctx, [(cx, cy) for cy in range(y0 // CHUNK_SIZE, (y0 + h - 1) // CHUNK_SIZE + 1)
+                                     for cx in range(x0 // CHUNK_SIZE, (x0 + w - 1) // CHUNK_SIZE + 1)])
+    base_grid: List[List[str]] = []
+    clim_grid: List[List[Dict[str,float]]] = []
+    wthr_grid: List[List[Dict[str,Any]]] = []
+    for j in range(h):
+        y = y0 + j
+        brow: List[str] = []; crow = []; wrow = []
+        x = x0
+        x_end = x0 + w
+        while x < x_end:
+            cx, cy, ox, oy = _chunk_of_xy(x, y)
+            seg_end = min(x_end, ox + CHUNK_SIZE)
+            n = seg_end - x
+            brow.extend(_tiles_cached(ctx, cx, cy)[y - oy][x - ox: seg_end - ox])
+            clim = _climate_cached(ctx, cx, cy)
+            wthr = _weather_for_chunk(ctx, cx, cy)
+            crow.extend([clim] * n); wrow.extend([wthr] * n)
+            x = seg_end
+        base_grid.append(brow); clim_grid.append(crow); wthr_grid.append(wrow)
+
+    out = evolve_tiles_ephemeral(base_grid, x0, y0, clim_grid, wthr_grid, ctx.now_bucket,
+                                 _view_phase(ctx.now_bucket, for_view))
+    _apply_overlays(ctx, out, x0, y0, w, h)
+    return out
+
+def _tiles_rect_view(ctx: _TileCtx, x0: int, y0: int, w: int, h: int) -> List[List[str]]:
+    phase = _view_phase(ctx.now_bucket, True)
+    _prefetch_weather(ctx, [(cx, cy) for cy in range(y0 // CHUNK_SIZE, (y0 + h - 1) // CHUNK_SIZE + 1)
+                                     for cx in range(x0 // CHUNK_SIZE, (x0 + w - 1) // CHUNK_SIZE + 1)])
+    layers: Dict[Tuple[int,int], List[List[str]]] = {}
+    out: List[List[str]] = []
+    for j in range(h):
+        y = y0 + j
+        row: List[str] = []
+        x = x0
+        x_end = x0 + w
+        while x < x_end:
+            cx, cy, ox, oy = _chunk_of_xy(x, y)
+            seg_end = min(x_end, ox + CHUNK_SIZE)
+            layer = layers.get((cx, cy))
+            if layer is None:
+                layer = layers[(cx, cy)] = _chunk_view_layer(ctx, cx, cy, phase)
+            row.extend(layer[y - oy][x - ox: seg_end - ox])
+            x = seg_end
+        out.append(row)
+    return out
+
+def _apply_overlays(ctx: _TileCtx, out: List[List[str]], x0: int, y0: int, w: int, h: int):
+    """Постройки и оверрайды поверх (оверрайд главнее — как в _tile_at)."""
+    x1, y1 = x0 + w - 1, y0 + h - 1
+    for (bx, by), kind in ctx.bmap.items():
+        if kind in (T_TOWN, T_CAMP, T_TAVERN, T_ROAD) and x0 <= bx <= x1 and y0 <= by <= y1:
+            out[by - y0][bx - x0] = kind
+    for (ox_, oy_), tid in ctx.omap.items():
+        if tid and x0 <= ox_ <= x1 and y0 <= oy_ <= y1:
+            out[oy_ - y0][ox_ - x0] = tid
+
+
 # -------------------- Энергетика шага --------------------
 
 def _weather_eff_pair(weather: dict) -> Tuple[float, float]:
@@ -422,12 +873,83 @@ def _energy_cost_runtime(tile: str, weather: dict, fatigue: float) -> float:
 
 # -------------------- A* по энергозатратам --------------------
 
+# ---- сетки цены шага для A* ----
+# На чанк: float32[32*32] усталости за шаг (inf — непроходимо) для (слот погоды, фаза скинов,
+# погода/климат чанка, версия тайлов, версия оверлеев). Среда (_env_levels) в пределах чанка
+# одна, поэтому множители считаются по видам тайлов (их единицы), а не по клеткам; тайлы —
+# готовый слой скинов из _SKIN_CACHE, постройки/оверрайды — поверх. Мутации чанка и оверлеев
+# меняют версии в ключе — старые сетки просто вытесняются LRU.
+_COST_GRID: "OrderedDict[tuple, array]" = OrderedDict()
+_COST_GRID_MAX = int(os.getenv("WORLD_COST_GRID_CACHE", "512") or 512)
+COST_GRID_STATS = {"hit": 0, "miss": 0}
+_INF = float("inf")
+
+def _chunk_cost_grid(ctx: _TileCtx, cx:int, cy:int) -> array:
+    return _chunk_cost_entry(ctx, cx, cy)[1]
+
+def _chunk_cost_entry(ctx: _TileCtx, cx:int, cy:int) -> Tuple[tuple, array]:
+    """(ключ, сетка): ключ годится как версия сетки для производных кешей (HPA*)."""
+    if overlay_index.ENABLED:
+        overlay_index.ensure_fresh()  # чужие записи поднимают _OVERLAY_VER через on_reload
+    # фаза квантована как у патча и у профиля маршрута в _advance: стоимости и проходимость —
+    # с того же слоя, что видит клиент и по которому идёт герой
+    phase = _view_phase(ctx.now_bucket, True)
+    clim = _climate_cached(ctx, cx, cy)
+    wthr = _weather_for_chunk(ctx, cx, cy)
+    layer = _chunk_view_layer(ctx, cx, cy, phase)
+    key = (
+        cx, cy, ctx.now_bucket, phase,
+        wthr.get("key"), float(wthr.get("fatigue_mul", 1.0)),
+        _TILE_VER.get((cx, cy), 0), _OVERLAY_VER.get((cx, cy), 0),
+        tuple(float(clim.get(k, 0.0)) for k in ("temp", "moist", "height_mean", "forest_density")),
+    )
+    with _CACHE_LOCK:
+        grid = _COST_GRID.get(key)
+        if grid is not None:
+            _COST_GRID.move_to_end(key)
+    if grid is not None:
+        COST_GRID_STATS["hit"] += 1
+        return key, grid
+    COST_GRID_STATS["miss"] += 1
+
+    ox, oy = cx * CHUNK_SIZE, cy * CHUNK_SIZE
+    tiles = [t for row in layer for t in row]
+    bmap, omap = _rect_overlay_maps(ox, oy, ox + CHUNK_SIZE - 1, oy + CHUNK_SIZE - 1)
+    for (bx, by), kind in bmap.items():
+        if kind in (T_TOWN, T_CAMP, T_TAVERN, T_ROAD):
+            tiles[(by - oy) * CHUNK_SIZE + (bx - ox)] = kind
+    for (vx, vy), tid in omap.items():
+        if tid:
+            tiles[(vy - oy) * CHUNK_SIZE + (vx - ox)] = tid
+
+    w_eff, _ = _weather_eff_pair(wthr)
+    cost_of: Dict[str, float] = {}
+    for t in set(tiles):
+        cost_of[t] = (_BASE_FATIGUE_PER_TILE * tile_fatigue_mul(t) * tile_env_fatigue_mul(t, clim, wthr) * w_eff
+                      if is_passable(t) else _INF)
+    grid = array("f", map(cost_of.__getitem__, tiles))
+    with _CACHE_LOCK:
+        _COST_GRID[key] = grid
+        while len(_COST_GRID) > _COST_GRID_MAX:
+            _COST_GRID.popitem(last=False)
+    return key, grid
+
 def _neighbors(x:int,y:int):
     yield (x+1,y); yield (x-1,y); yield (x,y+1); yield (x,y-1)
 
 def _astar(row: WorldState, tx:int,ty:int, weather:dict, ctx: Optional[_TileCtx]=None, max_iter:int=100000) -> List[Tuple[int,int]]:
-    sx,sy = int(row.pos_x), int(row.pos_y)
-    if (sx,sy)==(tx,ty): return []
+    if ctx is None:  # совместимость: без контекста — текущий слот, без урбанизации
+        now = _now()
+        ctx = _TileCtx(now_bucket=math.floor(now/1800.0)*1800.0, influence=0.0, bmap={}, omap={})
+    return _grid_search(ctx, {}, int(row.pos_x), int(row.pos_y), tx, ty, max_iter)[0]
+
+def _grid_search(ctx: _TileCtx, grids: Dict[Tuple[int,int], array], sx:int, sy:int, tx:int, ty:int,
+                 max_iter:int = 100000, bounds: Optional[Tuple[int,int,int,int]] = None, partial: bool = False):
+    """
+    A* по сеткам цены шага: (путь без старта, раскрыто узлов). bounds — (x0,y0,x1,y1) включительно.
+    partial — цель не достигнута за max_iter: путь до раскрытой клетки, ближайшей к цели (жадный префикс).
+    """
+    if (sx,sy)==(tx,ty): return [], 0
 
     openh=[]; heapq.heappush(openh,(0.0,(sx,sy)))
     came: Dict[Tuple[int,int], Tuple[int,int]]={}
@@ -436,6 +958,7 @@ def _astar(row: WorldState, tx:int,ty:int, weather:dict, ctx: Optional[_TileCtx]
 
     avg = _BASE_FATIGUE_PER_TILE
     def h(x,y): return avg * (abs(x-tx)+abs(y-ty))
+    best, best_h = (sx,sy), h(sx,sy)
 
     it=0
     while openh and it<max_iter:
@@ -443,6 +966,8 @@ def _astar(row: WorldState, tx:int,ty:int, weather:dict, ctx: Optional[_TileCtx]
         _,(x,y)=heapq.heappop(openh)
         if (x,y) in seen: continue
         seen.add((x,y))
+        if partial and h(x,y) < best_h:
+            best, best_h = (x,y), h(x,y)
 
         if (x,y)==(tx,ty):
             path=[(x,y)]
@@ -451,31 +976,19 @@ def _astar(row: WorldState, tx:int,ty:int, weather:dict, ctx: Optional[_TileCtx]
                 path.append((x,y))
             path.reverse()
             if path and path[0]==(sx,sy): path=path[1:]
-            return path
+            return path, it
 
         for nx,ny in _neighbors(x,y):
-            t = _tile_at(nx,ny, ctx=ctx, for_view=False)  # логика: точная фаза, но без лишних SQL
-            if not is_passable(t):
+            if bounds is not None and not (bounds[0] <= nx <= bounds[2] and bounds[1] <= ny <= bounds[3]):
+                continue
+            cxn = nx // CHUNK_SIZE
+            cyn = ny // CHUNK_SIZE
+            grid = grids.get((cxn, cyn))
+            if grid is None:
+                grid = grids[(cxn, cyn)] = _chunk_cost_grid(ctx, cxn, cyn)
+            c = grid[(ny - cyn*CHUNK_SIZE)*CHUNK_SIZE + (nx - cxn*CHUNK_SIZE)]
+            if c == _INF:
                 continue
-
-            if ctx is not None:
-                cxn = nx // CHUNK_SIZE
-                cyn = ny // CHUNK_SIZE
-                clim_n = _climate_cached(ctx, cxn, cyn)
-                wch_n  = _weather_for_chunk(ctx, cxn, cyn)
-            else:
-                # совместимость: редкий путь без контекста
-                cxn = nx // CHUNK_SIZE
-                cyn = ny // CHUNK_SIZE
-                clim_n = _climate_of(cxn, cyn)
-                now = _now()
-                now_bucket = math.floor(now/1800.0)*1800.0
-                wch_n = pick_weather_for_chunk(clim_n, 0.0, now_bucket, cx=cxn, cy=cyn, now_ts=now)
-
-            w_eff, _ = _weather_eff_pair(wch_n)
-            env_mul = tile_env_fatigue_mul(t, clim_n, wch_n)
-            base_mul = tile_fatigue_mul(t)
-            c = _BASE_FATIGUE_PER_TILE * base_mul * env_mul * w_eff
 
             ng = g[(x,y)] + c
             if ng < g.get((nx,ny), 1e18):
@@ -484,16 +997,580 @@ def _astar(row: WorldState, tx:int,ty:int, weather:dict, ctx: Optional[_TileCtx]
                 f = ng + h(nx,ny)
                 heapq.heappush(openh,(f,(nx,ny)))
 
-    return []
+    if partial and best != (sx,sy):
+        x, y = best
+        path=[]
+        while (x,y)!=(sx,sy):
+            path.append((x,y))
+            x,y=came[(x,y)]
+        path.reverse()
+        return path, it
+    return [], it
+
+
+# ---- иерархический поиск (HPA*) для дальних целей ----
+# Абстрактный граф: узлы — порталы на границах чанков (середина каждого непрерывного отрезка,
+# где проходимы обе стороны границы), рёбра — шаг через границу (цена клетки, в которую входим)
+# и переходы между порталами одного чанка (Дейкстра внутри чанка по его сетке цены).
+# Внутричанковые цены кешируются по (ключ сетки чанка, набор порталов) — то есть на слот погоды
+# и версии тайлов/оверлеев — и досчитываются лениво, по мере раскрытия порталов. Сначала ищем по абстрактному графу, потом уточняем только коридор:
+# A* между соседними узлами пути, ограниченный одним чанком.
+_HPA_MIN_DIST = int(os.getenv("WORLD_HPA_MIN_DIST", "128") or 128)      # ближе — обычный A*
+_HPA_MAX_NODES = int(os.getenv("WORLD_HPA_MAX_NODES", "20000") or 20000)
+_HPA_INTRA: "OrderedDict[tuple, Dict[str,Any]]" = OrderedDict()
+_HPA_INTRA_MAX = int(os.getenv("WORLD_HPA_CACHE", "1024") or 1024)
+HPA_STATS = {"plans": 0, "intra_hit": 0, "intra_miss": 0}
+
+def _chunk_dijkstra(grid: array, src: int, targets: set, reverse: bool = False) -> Dict[int, float]:
+    """
+    Цены от клетки src (индекс j*32+i) до targets внутри одного чанка.
+    reverse=True — цены ОТ targets ДО src (ход u->v стоит grid[v], т.е. считаем «обратным ходом»).
+    """
+    dist = {src: 0.0}
+    out: Dict[int, float] = {}
+    left = set(targets)
+    heap = [(0.0, src)]
+    S = CHUNK_SIZE
+    while heap and left:
+        d, i = heapq.heappop(heap)
+        if d > dist[i]:
+            continue
+        if i in left:
+            out[i] = d
+            left.discard(i)
+        x, y = i % S, i // S
+        for j in ((i + 1) if x < S - 1 else -1, (i - 1) if x > 0 else -1,
+                  (i + S) if y < S - 1 else -1, (i - S) if y > 0 else -1):
+            if j < 0 or grid[j] == _INF:
+                continue
+            nd = d + (grid[i] if reverse else grid[j])
+            if nd < dist.get(j, 1e18):
+                dist[j] = nd
+                heapq.heappush(heap, (nd, j))
+    return out
+
+def _border_portals(ctx: _TileCtx, grids, cx:int, cy:int, side: str) -> List[Tuple[Tuple[int,int], Tuple[int,int]]]:
+    """Порталы границы чанка (cx,cy) с восточным ("E") или южным ("S") соседом: [(клетка_здесь, клетка_там)]."""
+    S = CHUNK_SIZE
+    ga = _hpa_grid(ctx, grids, cx, cy)
+    if side == "E":
+        gb = _hpa_grid(ctx, grids, cx + 1, cy)
+        pairs = [(((cx+1)*S - 1, cy*S + k), ((cx+1)*S, cy*S + k), ga[k*S + S - 1], gb[k*S]) for k in range(S)]
+    else:
+        gb = _hpa_grid(ctx, grids, cx, cy + 1)
+        pairs = [((cx*S + k, (cy+1)*S - 1), (cx*S + k, (cy+1)*S), ga[(S-1)*S + k], gb[k]) for k in range(S)]
+    out = []
+    run: List[Tuple[Tuple[int,int], Tuple[int,int]]] = []
+    for a, b, ca, cb in pairs + [(None, None, _INF, _INF)]:
+        if ca != _INF and cb != _INF:
+            run.append((a, b))
+        elif run:
+            out.append(run[len(run) // 2])
+            run = []
+    return out
+
+def _hpa_grid(ctx: _TileCtx, grids, cx:int, cy:int) -> array:
+    e = grids.get((cx, cy))
+    if e is None:
+        e = grids[(cx, cy)] = _chunk_cost_entry(ctx, cx, cy)
+    return e[1]
+
+def _chunk_graph(ctx: _TileCtx, grids, graphs, cx:int, cy:int):
+    """(порталы чанка {клетка: [клетки-соседи за границей]}, внутричанковые цены {u: {v: цена}})."""
+    gr = graphs.get((cx, cy))
+    if gr is not None:
+        return gr
+    nodes: Dict[Tuple[int,int], List[Tuple[int,int]]] = {}
+    for a, b in _border_portals(ctx, grids, cx, cy, "E") + _border_portals(ctx, grids, cx, cy, "S"):
+        nodes.setdefault(a, []).append(b)
+    for b, a in _border_portals(ctx, grids, cx - 1, cy, "E") + _border_portals(ctx, grids, cx, cy - 1, "S"):
+        nodes.setdefault(a, []).append(b)
+
+    _hpa_grid(ctx, grids, cx, cy)
+    gkey, grid = grids[(cx, cy)]
+    key = (gkey, tuple(sorted(nodes)))
+    with _CACHE_LOCK:
+        intra = _HPA_INTRA.get(key)
+        if intra is not None:
+            _HPA_INTRA.move_to_end(key)
+            HPA_STATS["intra_hit"] += 1
+        else:
+            HPA_STATS["intra_miss"] += 1
+            intra = _HPA_INTRA[key] = {"grid": grid, "origin": (cx * CHUNK_SIZE, cy * CHUNK_SIZE),
+                                       "done": set(), "cost": {n: {} for n in nodes}}
+            while len(_HPA_INTRA) > _HPA_INTRA_MAX:
+                _HPA_INTRA.popitem(last=False)
+    gr = graphs[(cx, cy)] = (nodes, intra)
+    return gr
+
+def _intra_succ(intra, u: Tuple[int,int]) -> Dict[Tuple[int,int], float]:
+    """
+    Цены от портала u до остальных порталов чанка — лениво, только для раскрытых узлов.
+    Цена пути = сумма входов без стартовой клетки, поэтому обратный путь по той же цепочке
+    стоит c - grid[v] + grid[u] и оптимален тоже: один прогон Дейкстры заполняет обе стороны.
+    Запись общая для потоков — досчёт под _CACHE_LOCK; у готового узла cost[u] больше не меняется.
+    """
+    cost = intra["cost"]
+    if u in intra["done"]:
+        return cost[u]
+    with _CACHE_LOCK:
+        if u in intra["done"]:
+            return cost[u]
+        grid = intra["grid"]; ox, oy = intra["origin"]
+        def ix(n): return (n[1] - oy) * CHUNK_SIZE + (n[0] - ox)
+        todo = {ix(n): n for n in cost if n != u and n not in intra["done"]}
+        iu = ix(u)
+        for j, c in _chunk_dijkstra(grid, iu, set(todo)).items():
+            v = todo[j]
+            cost[u][v] = c
+            cost[v][u] = c - grid[j] + grid[iu]
+        intra["done"].add(u)
+    return cost[u]
+
+def _hpa_path(ctx: _TileCtx, sx:int, sy:int, tx:int, ty:int) -> Tuple[List[Tuple[int,int]], Dict[str,int]]:
+    """Путь (без старта) и счётчики {"abstract", "refine"} раскрытых узлов."""
+    S = CHUNK_SIZE
+    stats = {"abstract": 0, "refine": 0}
+    HPA_STATS["plans"] += 1
+    sc = (sx // S, sy // S); gc = (tx // S, ty // S)
+    cells: Dict[Tuple[int,int], array] = {}
+    if sc == gc:
+        path, n = _grid_search(ctx, cells, sx, sy, tx, ty)
+        stats["refine"] = n
+        return path, stats
+
+    grids: Dict[Tuple[int,int], Tuple[tuple, array]] = {}
+    graphs: Dict[Tuple[int,int], Any] = {}
+    if _hpa_grid(ctx, grids, *gc)[(ty - gc[1]*S)*S + (tx - gc[0]*S)] == _INF:
+        return [], stats
+
+    def local(c, x, y):
+        return (y - c[1]*S)*S + (x - c[0]*S)
+
+    s_nodes, _ = _chunk_graph(ctx, grids, graphs, *sc)
+    s_idx = {local(sc, *n): n for n in s_nodes}
+    start_edges = {s_idx[j]: c for j, c in _chunk_dijkstra(grids[sc][1], local(sc, sx, sy), set(s_idx)).items()}
+    g_nodes, _ = _chunk_graph(ctx, grids, graphs, *gc)
+    g_idx = {local(gc, *n): n for n in g_nodes}
+    goal_in = {g_idx[j]: c for j, c in _chunk_dijkstra(grids[gc][1], local(gc, tx, ty), set(g_idx), reverse=True).items()}
+
+    start, goal = ("S", sx, sy), ("G", tx, ty)
+    avg = _BASE_FATIGUE_PER_TILE
+    def h(n): return avg * (abs(n[-2]-tx) + abs(n[-1]-ty))
+
+    g = {start: 0.0}
+    came: Dict[Any, Any] = {}
+    openh = [(h(start), start)]
+    seen = set()
+    found = False
+    while openh and stats["abstract"] < _HPA_MAX_NODES:
+        _, u = heapq.heappop(openh)
+        if u in seen:
+            continue
+        seen.add(u)
+        stats["abstract"] += 1
+        if u == goal:
+            found = True
+            break
+        if u == start:
+            succ = list(start_edges.items())
+        else:
+            c = (u[0] // S, u[1] // S)
+            nodes, intra = _chunk_graph(ctx, grids, graphs, *c)
+            succ = list(_intra_succ(intra, u).items()) if u in nodes else []
+            for b in nodes.get(u, ()):
+                bc = (b[0] // S, b[1] // S)
+                succ.append((b, _hpa_grid(ctx, grids, *bc)[local(bc, *b)]))
+            if c == gc and u in goal_in:
+                succ.append((goal, goal_in[u]))
+        for v, cost in succ:
+            ng = g[u] + cost
+            if ng < g.get(v, 1e18):
+                g[v] = ng
+                came[v] = u
+                heapq.heappush(openh, (ng + h(v), v))
+    if not found:
+        return [], stats
+
+    chain = [goal]
+    while chain[-1] != start:
+        chain.append(came[chain[-1]])
+    chain.reverse()
+    pts = [(sx, sy)] + [n if len(n) == 2 else (n[1], n[2]) for n in chain[1:]]
+
+    # уточнение коридора: соседние узлы в одном чанке — A* внутри чанка, через границу — один шаг
+    cells = {c: e[1] for c, e in grids.items()}
+    path: List[Tuple[int,int]] = []
+    for (ax, ay), (bx, by) in zip(pts, pts[1:]):
+        ac = (ax // S, ay // S)
+        if ac != (bx // S, by // S):
+            path.append((bx, by))
+            continue
+        seg, n = _grid_search(ctx, cells, ax, ay, bx, by,
+                              bounds=(ac[0]*S, ac[1]*S, ac[0]*S + S - 1, ac[1]*S + S - 1))
+        stats["refine"] += n
+        if not seg and (ax, ay) != (bx, by):
+            return [], stats
+        path.extend(seg)
+    return path, stats
+
+
+# ---- компоненты связности: мгновенный отказ для недостижимых целей ----
+# На чанк — разметка проходимых клеток по компонентам (заливка по сетке цены, кеш по ключу
+# сетки: эволюция чанка и правки оверлеев дают новый ключ). Вокруг цели (±WORLD_CONN_RADIUS
+# чанков) компоненты сшиваются через границы union-find'ом; компонента, не выходящая на край
+# окрестности, — замкнутая (остров, котловина в лаве): если старта в ней нет, пути точно нет.
+# Иначе ответ «неизвестно» — решает обычный поиск. Непроходимую/недостижимую цель рядом с
+# героем сдвигаем на ближайшую клетку его компоненты (WORLD_CONN_SNAP клеток), иначе — отказ.
+_CONN_RADIUS = int(os.getenv("WORLD_CONN_RADIUS", "2") or 2)
+_CONN_SNAP = int(os.getenv("WORLD_CONN_SNAP", "6") or 6)
+_COMP_CACHE: "OrderedDict[tuple, List[int]]" = OrderedDict()
+_COMP_CACHE_MAX = int(os.getenv("WORLD_COMP_CACHE", "1024") or 1024)
+CONN_STATS = {"rejected": 0, "snapped": 0, "unknown": 0, "connected": 0}
+
+def _chunk_components(ctx: _TileCtx, grids, cx:int, cy:int) -> List[int]:
+    """Метки компонент клеток чанка (-1 — непроходимо)."""
+    _hpa_grid(ctx, grids, cx, cy)
+    key, grid = grids[(cx, cy)]
+    with _CACHE_LOCK:
+        lab = _COMP_CACHE.get(key)
+        if lab is not None:
+            _COMP_CACHE.move_to_end(key)
+            return lab
+    S = CHUNK_SIZE
+    lab = [-1] * (S * S)
+    n = 0
+    for i0 in range(S * S):
+        if lab[i0] != -1 or grid[i0] == _INF:
+            continue
+        lab[i0] = n
+        stack = [i0]
+        while stack:
+            i = stack.pop()
+            x = i % S
+            for j in ((i + 1) if x < S - 1 else -1, (i - 1) if x > 0 else -1, i + S, i - S):
+                if 0 <= j < S * S and lab[j] == -1 and grid[j] != _INF:
+                    lab[j] = n
+                    stack.append(j)
+        n += 1
+    with _CACHE_LOCK:
+        _COMP_CACHE[key] = lab
+        while len(_COMP_CACHE) > _COMP_CACHE_MAX:
+            _COMP_CACHE.popitem(last=False)
+    return lab
+
+class _ConnRegion:
+    """Union-find компонент чанков прямоугольника [cx0..cx1]×[cy0..cy1] + признак «выходит на край»."""
+    def __init__(self, ctx: _TileCtx, grids, cx0:int, cy0:int, cx1:int, cy1:int):
+        S = CHUNK_SIZE
+        self.rect = (cx0, cy0, cx1, cy1)
+        self.labs = {(cx, cy): _chunk_components(ctx, grids, cx, cy)
+                     for cy in range(cy0, cy1 + 1) for cx in range(cx0, cx1 + 1)}
+        self.parent: Dict[tuple, tuple] = {}
+        for (cx, cy), lab in self.labs.items():
+            if cx < cx1:
+                rb = self.labs[(cx + 1, cy)]
+                for k in range(S):
+                    a, b = lab[k*S + S - 1], rb[k*S]
+                    if a >= 0 and b >= 0:
+                        self._union((cx, cy, a), (cx + 1, cy, b))
+            if cy < cy1:
+                db_ = self.labs[(cx, cy + 1)]
+                for k in range(S):
+                    a, b = lab[(S - 1)*S + k], db_[k]
+                    if a >= 0 and b >= 0:
+                        self._union((cx, cy, a), (cx, cy + 1, b))
+        # выход на внешний край окрестности — за ним может быть что угодно
+        self.open = set()
+        for (cx, cy), lab in self.labs.items():
+            edge = []
+            if cx == cx0: edge += [k*S for k in range(S)]
+            if cx == cx1: edge += [k*S + S - 1 for k in range(S)]
+            if cy == cy0: edge += list(range(S))
+            if cy == cy1: edge += [(S - 1)*S + k for k in range(S)]
+            for i in edge:
+                if lab[i] >= 0:
+                    self.open.add(self._find((cx, cy, lab[i])))
+
+    def _find(self, a):
+        p = self.parent
+        while p.get(a, a) != a:
+            p[a] = p.get(p[a], p[a])
+            a = p[a]
+        return a
+
+    def _union(self, a, b):
+        ra, rb = self._find(a), self._find(b)
+        if ra != rb:
+            self.parent[ra] = rb
+
+    def covers(self, x:int, y:int) -> bool:
+        r = self.rect
+        return r[0] <= x // CHUNK_SIZE <= r[2] and r[1] <= y // CHUNK_SIZE <= r[3]
+
+    def root(self, x:int, y:int):
+        """Корень компоненты клетки; None — непроходима."""
+        S = CHUNK_SIZE
+        cx, cy = x // S, y // S
+        l = self.labs[(cx, cy)][(y - cy*S)*S + (x - cx*S)]
+        return None if l < 0 else self._find((cx, cy, l))
+
+def _check_reachable(ctx: _TileCtx, sx:int, sy:int, tx:int, ty:int) -> Tuple[str, Optional[Tuple[int,int]]]:
+    """("ok"|"unknown", цель) — искать путь (цель могла сдвинуться), ("no", None) — пути точно нет."""
+    S, R = CHUNK_SIZE, _CONN_RADIUS
+    grids: Dict[Tuple[int,int], Tuple[tuple, array]] = {}
+    tcx, tcy = tx // S, ty // S
+    reg = _ConnRegion(ctx, grids, tcx - R, tcy - R, tcx + R, tcy + R)
+    rt = reg.root(tx, ty)
+    if reg.covers(sx, sy):
+        rs = reg.root(sx, sy)
+        if rs is None:  # герой стоит на непроходимой клетке (оверрайд под ним) — решит сам поиск
+            CONN_STATS["unknown"] += 1
+            return "unknown", (tx, ty)
+        if rt is not None and rt == rs:
+            CONN_STATS["connected"] += 1
+            return "ok", (tx, ty)
+        if rt is not None and (rs in reg.open and rt in reg.open):
+            CONN_STATS["unknown"] += 1
+            return "unknown", (tx, ty)
+        # цель непроходима или отрезана от героя — ближайшая клетка его компоненты
+        for d in range(1, _CONN_SNAP + 1):
+            for dx in range(-d, d + 1):
+                for dy in {-(d - abs(dx)), d - abs(dx)}:
+                    x, y = tx + dx, ty + dy
+                    if reg.covers(x, y) and reg.root(x, y) == rs:
+                        CONN_STATS["snapped"] += 1
+                        return "ok", (x, y)
+        CONN_STATS["rejected"] += 1
+        return "no", None
+    if rt is None or rt not in reg.open:
+        CONN_STATS["rejected"] += 1
+        return "no", None
+    scx, scy = sx // S, sy // S
+    sreg = _ConnRegion(ctx, grids, scx - R, scy - R, scx + R, scy + R)
+    rs = sreg.root(sx, sy)
+    if rs is not None and rs not in sreg.open:  # сам герой заперт (остров)
+        CONN_STATS["rejected"] += 1
+        return "no", None
+    CONN_STATS["unknown"] += 1
+    return "unknown", (tx, ty)
+
+
+# ---- кеш готовых маршрутов ----
+# Популярные пары (спавн, города, таверны, свои лагеря) считаются один раз на слот погоды.
+# Запись: путь, индекс клеток пути и версии оверлеев чанков коридора (_OVERLAY_VER растёт при
+# постройке/оверрайде/эволюции чанка, а записи других воркеров поднимают её через перезагрузку
+# индекса построек — on_reload). Проверка при чтении: изменился хоть один чанк коридора —
+# запись выбрасывается. Старт на уже известном пути к той же цели — отдаём хвост этого пути.
+_ROUTE_CACHE: "OrderedDict[tuple, Dict[str,Any]]" = OrderedDict()     # (sx,sy,tx,ty,bucket) -> запись
+_ROUTE_BY_GOAL: Dict[tuple, set] = {}                                  # (tx,ty,bucket) -> ключи записей
+_ROUTE_CACHE_MAX = int(os.getenv("WORLD_ROUTE_CACHE", "2048") or 2048)
+ROUTE_CACHE_STATS = {"hit": 0, "suffix_hit": 0, "miss": 0, "invalidated": 0, "saved_ms": 0.0}
+
+def _corridor_version(chunks) -> tuple:
+    return tuple(_OVERLAY_VER.get(c, 0) for c in chunks)
+
+def _route_cache_drop(key: tuple):
+    e = _ROUTE_CACHE.pop(key, None)
+    if e is None:
+        return
+    ks = _ROUTE_BY_GOAL.get(key[2:])
+    if ks is not None:
+        ks.discard(key)
+        if not ks:
+            _ROUTE_BY_GOAL.pop(key[2:], None)
+
+def _route_cache_get(sx:int, sy:int, tx:int, ty:int, bucket: float) -> Optional[List[Tuple[int,int]]]:
+    goal = (tx, ty, bucket)
+    exact = (sx, sy) + goal
+    if overlay_index.ENABLED and goal in _ROUTE_BY_GOAL:
+        overlay_index.ensure_fresh()
+    with _CACHE_LOCK:
+        keys = sorted(_ROUTE_BY_GOAL.get(goal, ()), key=lambda k: k != exact)  # точное совпадение — первым
+        for key in keys:
+            e = _ROUTE_CACHE[key]
+            i = e["index"].get((sx, sy))
+            if i is None:
+                continue
+            if _corridor_version(e["chunks"]) != e["ver"]:
+                _route_cache_drop(key)
+                ROUTE_CACHE_STATS["invalidated"] += 1
+                continue
+            _ROUTE_CACHE.move_to_end(key)
+            ROUTE_CACHE_STATS["hit" if key == exact else "suffix_hit"] += 1
+            ROUTE_CACHE_STATS["saved_ms"] += e["ms"]
+            return e["path"][i + 1:]
+    ROUTE_CACHE_STATS["miss"] += 1
+    return None
+
+def _route_cache_put(sx:int, sy:int, tx:int, ty:int, bucket: float, path: List[Tuple[int,int]], ms: float):
+    key = (sx, sy, tx, ty, bucket)
+    path = [(int(x), int(y)) for x, y in path]
+    chunks = sorted({(x // CHUNK_SIZE, y // CHUNK_SIZE) for x, y in path} | {(sx // CHUNK_SIZE, sy // CHUNK_SIZE)})
+    index = {(sx, sy): -1}
+    for i, p in enumerate(path):
+        index.setdefault(p, i)
+    with _CACHE_LOCK:
+        _route_cache_drop(key)
+        _ROUTE_CACHE[key] = {"path": path, "index": index, "chunks": chunks, "ver": _corridor_version(chunks), "ms": ms}
+        _ROUTE_BY_GOAL.setdefault(key[2:], set()).add(key)
+        while len(_ROUTE_CACHE) > _ROUTE_CACHE_MAX:
+            _route_cache_drop(next(iter(_ROUTE_CACHE)))
+
+def route_cache_metrics() -> Dict[str, Any]:
+    st = ROUTE_CACHE_STATS
+    lookups = st["hit"] + st["suffix_hit"] + st["miss"]
+    return dict(st, saved_ms=round(st["saved_ms"], 1), size=len(_ROUTE_CACHE),
+                hit_rate=round((st["hit"] + st["suffix_hit"]) / lookups, 3) if lookups else 0.0)
 
 
 # -------------------- USER STATE --------------------
 
+# ---- write-behind состояния героя ----
+# Поллинг стоящего/отдыхающего героя меняет лишь last_update и fatigue — такие изменения
+# не коммитим сразу, а держим в памяти (_HOT_STATE) и сбрасываем пачкой: по таймеру
+# (start_state_flusher), при значимом изменении (позиция/путь/цель/отдых/скорость — обычный
+# commit) и при остановке процесса. Крах теряет не больше WORLD_STATE_FLUSH_SEC секунд отдыха.
+# Запись защищена оптимистично: UPDATE ... WHERE last_update = то, что было в БД при синхронизации;
+# если строку успел переписать другой воркер/путь — его версия главнее, наша запись отбрасывается.
+_WRITE_BEHIND = os.getenv("WORLD_STATE_WRITE_BEHIND", "1").strip() != "0"
+_STATE_FLUSH_SEC = float(os.getenv("WORLD_STATE_FLUSH_SEC", "5.0") or 5.0)
+_HOT_COLS = ("last_update", "fatigue")
+_SIGNIFICANT_COLS = ("pos_x", "pos_y", "dest_x", "dest_y", "path_json", "path_rle", "path_cur", "resting", "speed")
+_HOT_STATE: Dict[str, Dict[str, Any]] = {}   # user_id -> {"vals", "base_lu", "dirty_since"}
+_HOT_LOCK = threading.Lock()
+STATE_CACHE_STATS = {"deferred": 0, "flushes": 0, "flushed_rows": 0, "stale_dropped": 0,
+                     "last_flush_ms": 0.0, "max_flush_ms": 0.0}
+
+def _hot_apply(row: WorldState):
+    """Подмешать несброшенные значения к только что прочитанной строке (если БД с тех пор не менялась)."""
+    with _HOT_LOCK:
+        e = _HOT_STATE.get(row.user_id)
+        if e is None:
+            return
+        lu = float(row.last_update or 0.0)
+        if lu == float(e["vals"]["last_update"] or 0.0):
+            return  # строка из identity map этой же сессии — значения уже на ней
+        if lu != e["base_lu"]:
+            _HOT_STATE.pop(row.user_id, None)  # строку переписали мимо нас — она главнее
+            STATE_CACHE_STATS["stale_dropped"] += 1
+            return
+        vals = dict(e["vals"])
+    for k, v in vals.items():
+        setattr(row, k, v)  # обычная запись: если путь закоммитит строку — уйдут и они
+
+@event.listens_for(Session, "before_flush")
+def _hot_state_before_flush(session, flush_context, instances):
+    """Любой flush изменённой строки героя (в т.ч. мимо движка: добыча, админка) забирает и
+    отложенные значения — иначе таймер позже перезаписал бы строку устаревшими."""
+    if not _HOT_STATE:
+        return
+    for obj in session.dirty:
+        if not isinstance(obj, WorldState) or not session.is_modified(obj):
+            continue
+        with _HOT_LOCK:
+            e = _HOT_STATE.pop(obj.user_id, None)
+        if e is not None:
+            for k in _HOT_COLS:
+                flag_modified(obj, k)
+
+def _defer_or_commit(row: WorldState, db_vals: Dict[str, Any]):
+    """После _advance в поллинге: значимое изменение — commit, иначе — отложить в _HOT_STATE."""
+    if not _WRITE_BEHIND or any(getattr(row, k) != db_vals[k] for k in _SIGNIFICANT_COLS):
+        db.session.add(row); _commit_keep_loaded()
+        with _HOT_LOCK:
+            _HOT_STATE.pop(row.user_id, None)
+        return
+    vals = {k: getattr(row, k) for k in _HOT_COLS}
+    with _HOT_LOCK:
+        e = _HOT_STATE.get(row.user_id)
+        if e is None:
+            e = _HOT_STATE[row.user_id] = {"base_lu": float(db_vals["last_update"] or 0.0), "dirty_since": _now()}
+        e["vals"] = vals
+        e["dirty_since"] = e.get("dirty_since") or _now()
+        STATE_CACHE_STATS["deferred"] += 1
+    # ORM считает значения уже сохранёнными — случайный commit дальше по запросу их не запишет
+    for k, v in vals.items():
+        set_committed_value(row, k, v)
+
+def flush_state_cache(max_age: float = 0.0) -> int:
+    """Пачкой сбросить отложенные last_update/fatigue (старше max_age сек). Возвращает число строк."""
+    now = _now()
+    with _HOT_LOCK:
+        batch = [(uid, e["base_lu"], dict(e["vals"])) for uid, e in _HOT_STATE.items()
+                 if e.get("dirty_since") and now - e["dirty_since"] >= max_age]
+    if not batch:
+        return 0
+    t0 = time.perf_counter()
+    tbl = WorldState.__table__
+    stmt = tbl.update().where(
+        tbl.c.user_id == bindparam("uid"), tbl.c.last_update == bindparam("base_lu")
+    ).values(last_update=bindparam("lu"), fatigue=bindparam("fat"))
+    params = [{"uid": uid, "base_lu": blu, "lu": v["last_update"], "fat": v["fatigue"]} for uid, blu, v in batch]
+    with db.engine.begin() as conn:
+        conn.execute(stmt, params)
+    with _HOT_LOCK:
+        for uid, _, v in batch:
+            e = _HOT_STATE.get(uid)
+            if e is None:
+                continue
+            e["base_lu"] = float(v["last_update"])
+            if e["vals"] == v:
+                _HOT_STATE.pop(uid, None)  # в БД ровно то, что в памяти
+    dt_ms = (time.perf_counter() - t0) * 1000.0
+    STATE_CACHE_STATS["flushes"] += 1
+    STATE_CACHE_STATS["flushed_rows"] += len(batch)
+    STATE_CACHE_STATS["last_flush_ms"] = round(dt_ms, 2)
+    STATE_CACHE_STATS["max_flush_ms"] = max(STATE_CACHE_STATS["max_flush_ms"], round(dt_ms, 2))
+    perf_log({"type": "state_flush", "rows": len(batch), "dur_ms": round(dt_ms, 2), "dirty": state_cache_dirty()})
+    return len(batch)
+
+def state_cache_dirty() -> int:
+    with _HOT_LOCK:
+        return sum(1 for e in _HOT_STATE.values() if e.get("dirty_since"))
+
+def state_cache_metrics() -> Dict[str, Any]:
+    return dict(STATE_CACHE_STATS, dirty=state_cache_dirty(), enabled=_WRITE_BEHIND, flush_sec=_STATE_FLUSH_SEC)
+
+_FLUSHER_STARTED = False
+
+def start_state_flusher(app) -> Optional[threading.Thread]:
+    """
+    Фоновый сброс раз в WORLD_STATE_FLUSH_SEC + финальный при выходе процесса:
+    write-behind состояния героев и очередь чанков, прочитанных без записи.
+    """
+    global _FLUSHER_STARTED
+    if _FLUSHER_STARTED or not (_WRITE_BEHIND or _PERSIST_READS):
+        return None
+    _FLUSHER_STARTED = True
+
+    def _flush():
+        try:
+            with app.app_context():
+                flush_state_cache()
+                if _PERSIST_Q:
+                    persist_queued_chunks()
+        except Exception as e:
+            print(f"[WorldState] flush error: {e}")
+
+    def _loop():
+        while True:
+            time.sleep(_STATE_FLUSH_SEC)
+            _flush()
+
+    import atexit
+    atexit.register(_flush)
+    th = threading.Thread(target=_loop, name="world-state-flush", daemon=True)
+    th.start()
+    return th
+
+
 def _get_state(uid_any) -> WorldState:
     """Берём/создаём строку состояния ИСКЛЮЧИТЕЛЬНО для этого пользователя."""
     uid_s = str(_uid(uid_any))
     row = WorldState.query.filter_by(user_id=uid_s).first()
     if row:
+        _hot_apply(row)
         return row
     row = WorldState(
         user_id=uid_s, pos_x=0, pos_y=0,
@@ -531,130 +1608,236 @@ def _step_time(row: WorldState) -> float:
 
 # -------------------- ENGINE: MOVE / REST --------------------
 
-def _advance(row: WorldState):
+# ---- профиль маршрута: цены шагов считаем один раз на маршрут, а не на каждый тик ----
+# cost[k]  — усталость за полный шаг на path[k] (база тайла × среда × погода),
+# rrate[k] — реген в секунду на этом шаге, block — индекс первой непроходимой клетки.
+# Годен, пока не сменился слот погоды (now_bucket) и версия оверлеев чанков под маршрутом;
+# Ключ — path_sig() строки (старт+RLE не меняются при продвижении), сдвиг — курсор path_cur,
+# так что попадание в профиль не требует даже декодировать путь.
+_ROUTE_PROFILES: "OrderedDict[str, Dict[str,Any]]" = OrderedDict()
+_ROUTE_PROFILES_MAX = int(os.getenv("WORLD_ROUTE_PROFILES", "4096") or 4096)
+ROUTE_PROFILE_STATS = {"hit": 0, "build": 0}
+
+def _route_profile(row: WorldState, now_bucket: float) -> Tuple[Dict[str,Any], int]:
+    uid_s = str(row.user_id)
+    sig = row.path_sig()
+    cur = int(row.path_cur or 0) if row.path_rle is not None else 0
+    prof = _ROUTE_PROFILES.get(uid_s)
+    if (prof is not None and prof["sig"] == sig and prof["base"] <= cur
+            and prof["bucket"] == now_bucket and prof["phase"] == _view_phase(now_bucket, True)
+            and prof["ov"] == _overlay_version(*prof["rect"])):
+        with _CACHE_LOCK:
+            if uid_s in _ROUTE_PROFILES:
+                _ROUTE_PROFILES.move_to_end(uid_s)
+        ROUTE_PROFILE_STATS["hit"] += 1
+        return prof, cur - prof["base"]
+
+    with _readonly_chunks():
+        return _route_profile_build(row, uid_s, sig, cur, now_bucket)
+
+def _route_profile_build(row: WorldState, uid_s: str, sig: tuple, cur: int, now_bucket: float):
+    path = row.path_points()
+    xs = [p[0] for p in path]; ys = [p[1] for p in path]
+    rect = (min(xs) - 1, min(ys) - 1, max(xs) + 1, max(ys) + 1)
+    ov = _overlay_version(*rect)
+    bmap, omap = _rect_overlay_maps(*rect)
+    # урбанизация — по чанку каждой клетки, как у героя в _advance и у патча (_chunk_influence)
+    ctx = _TileCtx(now_bucket=now_bucket, influence=0.0, bmap=bmap, omap=omap, chunk_influence=True)
+    _prefetch_weather(ctx, list(dict.fromkeys((x // CHUNK_SIZE, y // CHUNK_SIZE) for x, y in path)))
+    cost: List[float] = []; rrate: List[float] = []
+    block = len(path)
+    # фаза квантованная — как у сеток цены планировщика (_chunk_cost_entry) и у патча: ходок
+    # не упирается в клетку, которую планировщик считал проходимой; шаг фазы сменился — профиль заново
+    phase = _view_phase(now_bucket, True)
+    for k, (tx, ty) in enumerate(path):
+        tile = _tile_at(tx, ty, ctx=ctx, for_view=True)
+        if not is_passable(tile):
+            block = k
+            break
+        cxn, cyn, _, _ = _chunk_of_xy(tx, ty)
+        wch = _weather_for_chunk(ctx, cxn, cyn)
+        w_eff, w_raw = _weather_eff_pair(wch)
+        env_mul = tile_env_fatigue_mul(tile, _climate_cached(ctx, cxn, cyn), wch)
+        cost.append(_BASE_FATIGUE_PER_TILE * tile_fatigue_mul(tile) * env_mul * w_eff)
+        rrate.append(_MOVE_REST_PER_SEC * tile_rest_mul(tile) * (1.0 / w_raw))
+
+    prof = {"sig": sig, "base": cur, "path": [list(p) for p in path], "bucket": now_bucket, "phase": phase,
+            "rect": rect, "ov": ov, "cost": cost, "rrate": rrate, "block": block}
+    with _CACHE_LOCK:
+        _ROUTE_PROFILES[uid_s] = prof
+        _ROUTE_PROFILES.move_to_end(uid_s)
+        while len(_ROUTE_PROFILES) > _ROUTE_PROFILES_MAX:
+            _ROUTE_PROFILES.popitem(last=False)
+    ROUTE_PROFILE_STATS["build"] += 1
+    return prof, 0
+
+def _walk_profile(prof: Dict[str,Any], off: int, fatigue: float, dt: float, step_t: float):
     """
-    Сдвигаем героя вперёд на прошедшее время.
+    Закрытая форма пошагового цикла движения: (шагов, усталость, остаток dt, исход),
+    исход — None / "blocked" (непроходимая клетка) / "exhausted" (усталость 100).
+    Полный шаг k: f = max(0, f + d_k), d_k = cost_k - rrate_k*step_t (рекурсия Линдли):
+    f_j = max(f0 + D_j, D_j - min(D_1..D_j)). Максимум f по префиксу — неубывающий,
+    поэтому первый шаг с f >= 100 ищем бинарным поиском.
+    """
+    cost, rrate = prof["cost"], prof["rrate"]
+    n = len(prof["path"]) - off
+    block = prof["block"] - off
+    m = max(0, min(int(dt // step_t), n, block))
+    if m:
+        D = list(accumulate(map(operator.sub, cost[off:off + m], [r * step_t for r in rrate[off:off + m]])))
+        M = list(accumulate(D, min))
+        G = list(accumulate(map(operator.sub, D, M), max))
+        H = list(map(max, map(fatigue.__add__, accumulate(D, max)), G))
+        kc = bisect.bisect_left(H, 100.0)
+        if kc < m:
+            return kc + 1, 100.0, dt - (kc + 1) * step_t, "exhausted"
+        fatigue = max(fatigue + D[-1], D[-1] - M[-1])
+    left = dt - m * step_t
+    if left <= 0 or m >= n:
+        return m, fatigue, left, None
+    if m >= block:
+        return m, fatigue, left, "blocked"
+    # неполный шаг: тратим, но клетку не меняем (как и раньше)
+    k = off + m
+    fatigue += cost[k] * (left / step_t)
+    fatigue = max(0.0, fatigue - rrate[k] * left)
+    if fatigue >= 100.0:
+        return m, 100.0, 0.0, "exhausted"
+    return m, fatigue, 0.0, None
+
+# ---- локальная починка пути ----
+# Клетку на пути перекрыли (постройка, оверрайд, вода после эволюции) — вместо сброса маршрута
+# ищем обход: A* в рамке вокруг закрытого участка от героя до первой проходимой клетки пути
+# за ним (не дальше WORLD_REPAIR_AHEAD клеток) и вшиваем его в сохранённый путь.
+# Не нашли в рамке/лимите — путь сбрасывается, как раньше (клиент перепросит set_dest).
+_REPAIR_MAX = int(os.getenv("WORLD_REPAIR_MAX", "2") or 0)        # починок за один _advance
+_REPAIR_AHEAD = int(os.getenv("WORLD_REPAIR_AHEAD", "24") or 24)
+_REPAIR_PAD = int(os.getenv("WORLD_REPAIR_PAD", "8") or 8)
+_REPAIR_ITER = int(os.getenv("WORLD_REPAIR_ITER", "4000") or 4000)
+REPAIR_STATS = {"repaired": 0, "failed": 0}
+
+def _repair_path(row: WorldState, prof: Dict[str,Any], now_bucket: float) -> bool:
+    path, k = prof["path"], prof["block"]
+    px, py = int(row.pos_x), int(row.pos_y)
+    ctx = _TileCtx(now_bucket=now_bucket, influence=0.0, bmap={}, omap={}, chunk_influence=True)
+    S = CHUNK_SIZE
+    with _readonly_chunks():
+        grids: Dict[Tuple[int,int], array] = {}
+        def free(x, y):
+            c = (x // S, y // S)
+            g = grids.get(c)
+            if g is None:
+                g = grids[c] = _chunk_cost_grid(ctx, *c)
+            return g[(y - c[1]*S)*S + (x - c[0]*S)] != _INF
+        j = next((i for i in range(k + 1, min(len(path), k + 1 + _REPAIR_AHEAD)) if free(*path[i])), None)
+        if j is None:
+            REPAIR_STATS["failed"] += 1
+            return False
+        rx, ry = path[j]
+        bounds = (min(px, rx, path[k][0]) - _REPAIR_PAD, min(py, ry, path[k][1]) - _REPAIR_PAD,
+                  max(px, rx, path[k][0]) + _REPAIR_PAD, max(py, ry, path[k][1]) + _REPAIR_PAD)
+        detour = _grid_search(ctx, grids, px, py, int(rx), int(ry), _REPAIR_ITER, bounds)[0]
+    if not detour:
+        REPAIR_STATS["failed"] += 1
+        return False
+    row.set_path(detour + [tuple(p) for p in path[j + 1:]], px, py)
+    REPAIR_STATS["repaired"] += 1
+    return True
+
+def _advance(row: WorldState, now: Optional[float] = None):
+    """
+    Сдвигаем героя вперёд на прошедшее время (до now; по умолчанию — текущий момент).
+    Детерминирован по (row, now, путь, мир) — на этом держится project_world_state.
     ВАЖНО: префетч/эволюцию чанков делаем снаружи (get_world_state), чтобы тик был быстрым.
     """
-    path: List[Tuple[int,int]] = json.loads(row.path_json or "[]")
+    has_path = row.path_left() > 0
 
-    now = _now()
+    now = _now() if now is None else float(now)
     now_bucket = math.floor(now / 1800.0) * 1800.0
 
     cx = row.pos_x // CHUNK_SIZE
     cy = row.pos_y // CHUNK_SIZE
     climate = _climate_of(cx, cy)
 
-    # влияние игроков (урбанизация)
-    ox = row.pos_x - 10; oy = row.pos_y - 6
-    ex = row.pos_x + 10; ey = row.pos_y + 6
-    area = max(1, (ex - ox + 1) * (ey - oy + 1))
-    cnt = WorldBuilding.query.filter(
-        WorldBuilding.x >= ox, WorldBuilding.x <= ex,
-        WorldBuilding.y >= oy, WorldBuilding.y <= ey
-    ).count()
-    influence = _clamp(cnt / area, 0.0, 1.0)
-    weather = pick_weather_for_chunk(climate, influence, now_bucket, cx=cx, cy=cy, now_ts=now)
-
     dt = max(0.0, now - float(row.last_update or now))
     fatigue = float(row.fatigue or 0.0)
     step_t = _step_time(row)
 
-    # Сформируем крошечный локальный контекст для текущей клетки и ближайшего шага пути
-    if path:
-        nx0, ny0 = path[0]
-        rx0 = min(int(row.pos_x), nx0) - 1
-        ry0 = min(int(row.pos_y), ny0) - 1
-        rx1 = max(int(row.pos_x), nx0) + 1
-        ry1 = max(int(row.pos_y), ny0) + 1
-    else:
-        rx0 = int(row.pos_x) - 1; ry0 = int(row.pos_y) - 1
-        rx1 = int(row.pos_x) + 1; ry1 = int(row.pos_y) + 1
+    # крошечный локальный контекст для текущей клетки (режим отдыха/лагерь)
+    rx0 = int(row.pos_x) - 1; ry0 = int(row.pos_y) - 1
+    rx1 = int(row.pos_x) + 1; ry1 = int(row.pos_y) + 1
     bmap, omap = _rect_overlay_maps(rx0, ry0, rx1, ry1)
-    local_ctx = _TileCtx(now_bucket=now_bucket, influence=influence, bmap=bmap, omap=omap)
+    local_ctx = _TileCtx(now_bucket=now_bucket, influence=0.0, bmap=bmap, omap=omap, chunk_influence=True)
+
+    # влияние игроков (урбанизация) — по чанку героя, как у профиля маршрута и патча
+    weather = pick_weather_for_chunk(climate, _influence_of_chunk(cx, cy), now_bucket, cx=cx, cy=cy, now_ts=now)
 
-    cur_tile = _tile_at(row.pos_x, row.pos_y, ctx=local_ctx, for_view=False)
+    cur_tile = _tile_at(row.pos_x, row.pos_y, ctx=local_ctx, for_view=True)  # фаза как у профиля маршрута
     on_camp = (cur_tile == T_CAMP)
-    standing_still = not path
+    standing_still = not has_path
     if on_camp and standing_still:
         row.resting = True
 
     # REST MODE
-    if row.resting or not path:
+    if row.resting or not has_path:
         rest_mul = tile_rest_mul(cur_tile) * (1.0 / float(weather.get("fatigue_mul", 1.0)))
         camp_bonus = 1.15 if on_camp else 1.0
         fatigue = max(0.0, fatigue - _BASE_REST_PER_SEC * rest_mul * camp_bonus * dt)
-        if row.resting and fatigue <= 20.0 and path:
+        if row.resting and fatigue <= 20.0 and has_path:
             row.resting = False
         row.fatigue = fatigue
         row.last_update = now
         return
 
-    # MOVE
-    x, y = int(row.pos_x), int(row.pos_y)
-    idx = 0
-    left_dt = dt
-
-    while left_dt > 0 and idx < len(path):
-        tx, ty = path[idx]
-        next_tile = _tile_at(tx, ty, ctx=local_ctx, for_view=False)
-        if not is_passable(next_tile):
-            path = []
+    # MOVE — по профилю маршрута, без обхода пути клетка за клеткой
+    if row.path_rle is None:  # путь в старом формате — переводим при первом же шаге
+        row.set_path(row.path_points(), row.pos_x, row.pos_y)
+    for attempt in range(_REPAIR_MAX + 1):
+        prof, off = _route_profile(row, now_bucket)
+        steps, fatigue, left_dt, outcome = _walk_profile(prof, off, fatigue, dt, step_t)
+        if steps:
+            row.pos_x, row.pos_y = (int(v) for v in prof["path"][off + steps - 1])
+        # клетку впереди закрыли — обход вместо сброса маршрута, дальше идём уже по нему
+        if outcome != "blocked" or attempt == _REPAIR_MAX or not _repair_path(row, prof, now_bucket):
             break
-
-        if left_dt >= step_t:
-            time_spent = step_t
-            x, y = tx, ty
-            left_dt -= step_t
-            idx += 1
-        else:
-            time_spent = left_dt
-            left_dt = 0.0
-
-        # расход за долю шага (учёт эко-мода и локальной погоды следующей клетки)
-        cxn, cyn, _, _ = _chunk_of_xy(tx, ty)
-        clim_next = _climate_cached(local_ctx, cxn, cyn)
-        wch_next  = _weather_for_chunk(local_ctx, cxn, cyn)
-        w_eff, w_raw = _weather_eff_pair(wch_next)
-
-        env_mul = tile_env_fatigue_mul(next_tile, clim_next, wch_next)
-        base_mul = tile_fatigue_mul(next_tile)
-        cost_full_tile = _BASE_FATIGUE_PER_TILE * base_mul * env_mul * w_eff
-
-        fatigue += cost_full_tile * (time_spent / step_t)
-
-        # реген во время движения (против сырого множителя погоды)
-        rest_mul = tile_rest_mul(next_tile) * (1.0 / w_raw)
-        fatigue = max(0.0, fatigue - _MOVE_REST_PER_SEC * rest_mul * time_spent)
-
-        if fatigue >= 100.0:
-            fatigue = 100.0
-            path = []
-            row.dest_x = row.dest_y = None
-            row.resting = True
-            break
-
-    row.pos_x, row.pos_y = x, y
-    rest = path[idx:]
-    row.path_json = json.dumps(rest, separators=(",", ":"))
-    if not rest:
+        dt = left_dt
+    if outcome:
+        row.clear_path()
+    else:
+        row.advance_path(steps)  # RLE: только path_cur += steps
+    if outcome == "exhausted":
+        row.resting = True
+    if row.path_left() <= 0:
         row.dest_x = row.dest_y = None
 
-    row.last_update = now - left_dt
+    row.last_update = now - max(0.0, left_dt)
     row.fatigue = _clamp(fatigue, 0.0, 100.0)
 
 
 # -------------------- VIEW / PATCH --------------------
 
 def _buildings_rect(x0:int,y0:int,x1:int,y1:int) -> List[dict]:
+    snap = _snapshot()
+    if overlay_index.ENABLED or (snap is not None and snap.covers(x0, y0, x1, y1)):
+        q = (overlay_index if overlay_index.ENABLED else snap).buildings_in(x0, y0, x1, y1)
+        return [dict(id=b.id, x=b.x, y=b.y, kind=b.kind, owner_id=b.owner_id) for b in q]
     q = WorldBuilding.query.filter(
         WorldBuilding.x >= x0, WorldBuilding.x <= x1,
         WorldBuilding.y >= y0, WorldBuilding.y <= y1
     ).all()
     return [dict(id=b.id, x=b.x, y=b.y, kind=b.kind, owner_id=b.owner_id) for b in q]
 
+def _influence_of_chunk(cx:int, cy:int) -> float:
+    x0, y0 = cx*CHUNK_SIZE, cy*CHUNK_SIZE
+    return _player_influence(x0, y0, x0 + CHUNK_SIZE - 1, y0 + CHUNK_SIZE - 1)
+
 def _player_influence(x0:int,y0:int,x1:int,y1:int) -> float:
     area = max(1, (x1-x0+1)*(y1-y0+1))
+    if overlay_index.ENABLED:
+        return _clamp(overlay_index.count_buildings(x0, y0, x1, y1)/area, 0.0, 1.0)
+    snap = _snapshot()
+    if snap is not None and snap.covers(x0, y0, x1, y1):
+        return _clamp(len(snap.buildings_in(x0, y0, x1, y1))/area, 0.0, 1.0)
     cnt = WorldBuilding.query.filter(
         WorldBuilding.x >= x0, WorldBuilding.x <= x1,
         WorldBuilding.y >= y0, WorldBuilding.y <= y1
@@ -673,18 +1856,17 @@ def _patch(cx:int, cy:int, w:int=_PATCH_W, h:int=_PATCH_H) -> Dict[str,Any]:
     big_oy = cy - h//2
     x0, y0, x1, y1 = big_ox, big_oy, big_ox + w - 1, big_oy + h - 1
 
-    infl = _player_influence(x0, y0, x1, y1)
     now = _now()
     now_bucket = math.floor(now/1800.0)*1800.0
+    ckey = (big_ox, big_oy, w, h, now_bucket, _view_phase(now_bucket, True), _overlay_version(x0, y0, x1, y1))
+    cached = _patch_cache_get(ckey)
+    if cached is not None:
+        return dict(cached)  # верхний уровень копируем: вызывающие дописывают поля ("view")
+
     bmap, omap = _rect_overlay_maps(x0, y0, x1, y1)
-    ctx = _TileCtx(now_bucket=now_bucket, influence=infl, bmap=bmap, omap=omap)
+    ctx = _TileCtx(now_bucket=now_bucket, influence=0.0, bmap=bmap, omap=omap, chunk_influence=True)
 
-    buffer_tiles = []
-    for j in range(h):
-        row = []
-        for i in range(w):
-            row.append(_tile_at(big_ox + i, big_oy + j, ctx=ctx, for_view=True))
-        buffer_tiles.append(row)
+    buffer_tiles = _tiles_rect(ctx, big_ox, big_oy, w, h, for_view=True)
 
     blds = _buildings_rect(x0, y0, x1, y1)
 
@@ -695,7 +1877,7 @@ def _patch(cx:int, cy:int, w:int=_PATCH_W, h:int=_PATCH_H) -> Dict[str,Any]:
     sj = _PAD_Y  # смещение по Y
     visible_tiles = [buffer_tiles[sj + jj][si:si + _VIEW_W] for jj in range(_VIEW_H)]
 
-    return {
+    out = {
         # видимая камера (как раньше ожидал фронт)
         "ox": view_ox, "oy": view_oy, "w": _VIEW_W, "h": _VIEW_H,
         "tiles": visible_tiles,
@@ -708,48 +1890,223 @@ def _patch(cx:int, cy:int, w:int=_PATCH_W, h:int=_PATCH_H) -> Dict[str,Any]:
         "center": {"i": _VIEW_W // 2, "j": _VIEW_H // 2, "x": cx, "y": cy},
         "pad": {"x": _PAD_X, "y": _PAD_Y},
     }
+    out["v"] = _view_version(out)
+    _patch_cache_put(ckey, out)
+    return dict(out)
+
+
+# ---- дельта-протокол видимого окна ----
+# Клиент присылает base="ox,oy,v" последнего применённого патча. Если это окно ещё
+# помним — отвечаем "unchanged" либо дельтой (новые полосы строк/столбцов + изменённые
+# клетки перекрытия), иначе — полным патчем. v — crc32 содержимого окна (тайлы+постройки).
+# Клиентам, знающим протокол (base передан, пусть и пустой), большой buffer не шлём.
+_VIEW_HIST: "OrderedDict[str, Tuple[int,int,int,int,List[List[str]]]]" = OrderedDict()
+_VIEW_HIST_MAX = int(os.getenv("WORLD_VIEW_HISTORY", "4096") or 4096)
+_DELTA_MAX_FRAC = 0.5   # дельта больше половины окна — выгоднее полный патч
+PATCH_DELTA_STATS = {"unchanged": 0, "delta": 0, "full": 0}
+
+def _view_version(pt: Dict[str,Any]) -> str:
+    s = "%d,%d|" % (pt["ox"], pt["oy"]) + "|".join(",".join(r) for r in pt["tiles"])
+    s += "#" + ";".join("%s:%d,%d" % (b["kind"], b["x"], b["y"]) for b in pt["buildings"])
+    return "%08x" % (zlib.crc32(s.encode("utf-8")) & 0xffffffff)
+
+def _view_hist_put(pt: Dict[str,Any]):
+    v = pt["v"]
+    with _CACHE_LOCK:
+        _VIEW_HIST[v] = (pt["ox"], pt["oy"], pt["w"], pt["h"], pt["tiles"])
+        _VIEW_HIST.move_to_end(v)
+        while len(_VIEW_HIST) > _VIEW_HIST_MAX:
+            _VIEW_HIST.popitem(last=False)
+
+def _parse_patch_base(base) -> Optional[Tuple[int,int,str]]:
+    """base: "ox,oy,v" или {"ox","oy","v"}; None — если не разобрали."""
+    try:
+        if isinstance(base, dict):
+            return int(base["ox"]), int(base["oy"]), str(base["v"])
+        ox, oy, v = str(base).split(",")
+        return int(ox), int(oy), v.strip()
+    except Exception:
+        return None
+
+def _view_delta(old: tuple, pt: Dict[str,Any]) -> Optional[Dict[str,Any]]:
+    """rows: [[j, row]], cols: [[i, j0, seg]], cells: [[i, j, tile]] — или None, если не выгодно."""
+    oox, ooy, ow, oh, otiles = old
+    w, h, tiles = pt["w"], pt["h"], pt["tiles"]
+    if (ow, oh) != (w, h):
+        return None
+    dx, dy = pt["ox"] - oox, pt["oy"] - ooy
+    if abs(dx) >= w or abs(dy) >= h:
+        return None
+    j0, j1 = max(0, -dy), min(h, h - dy)   # строки, которые есть в старом окне
+    i0, i1 = max(0, -dx), min(w, w - dx)
+    rows = [[j, tiles[j]] for j in range(h) if not (j0 <= j < j1)]
+    cols = [[i, j0, [tiles[j][i] for j in range(j0, j1)]] for i in range(w) if not (i0 <= i < i1)]
+    cells = []
+    for j in range(j0, j1):
+        row, orow = tiles[j], otiles[j + dy]
+        for i in range(i0, i1):
+            if row[i] != orow[i + dx]:
+                cells.append([i, j, row[i]])
+    cost = len(rows) * w + len(cols) * (j1 - j0) + 3 * len(cells)
+    if cost > _DELTA_MAX_FRAC * w * h:
+        return None
+    return {"rows": rows, "cols": cols, "cells": cells}
+
+def _patch_for_client(pt: Dict[str,Any], base=None) -> Dict[str,Any]:
+    """Полный патч / {"mode":"unchanged"} / {"mode":"delta"} относительно base клиента."""
+    _view_hist_put(pt)
+    if base is None:  # старый клиент — всё как было
+        PATCH_DELTA_STATS["full"] += 1
+        return pt
+    meta = {k: pt[k] for k in ("ox", "oy", "w", "h", "v", "center", "pad") if k in pt}
+    if "view" in pt:
+        meta["view"] = pt["view"]
+    b = _parse_patch_base(base)
+    old = _VIEW_HIST.get(b[2]) if b else None
+    if old is not None and (old[0], old[1]) == (b[0], b[1]):
+        if b[2] == pt["v"]:
+            PATCH_DELTA_STATS["unchanged"] += 1
+            return dict(meta, mode="unchanged", base=b[2])
+        d = _view_delta(old, pt)
+        if d is not None:
+            PATCH_DELTA_STATS["delta"] += 1
+            return dict(meta, mode="delta", base=b[2], buildings=pt["buildings"], **d)
+    PATCH_DELTA_STATS["full"] += 1
+    return dict(meta, mode="full", tiles=pt["tiles"], buildings=pt["buildings"])
+
+
+def pack_patch(pt: Dict[str,Any], binary: bool = False, rle: bool = True) -> Dict[str,Any]:
+    """
+    Компактный патч: палитра + uint8-индексы (опц. RLE) одной сеткой — buffer, если он есть,
+    иначе видимое окно; окно задаётся смещением off{i,j} внутри сетки.
+    binary=True — data остаётся bytes (для MessagePack), иначе base64.
+    unchanged/delta и так малы — отдаются как есть.
+    """
+    if "tiles" not in pt:
+        return pt
+    g = pt.get("buffer") or pt
+    try:
+        palette, data, enc = pack_grid(g["tiles"], rle)
+    except ValueError:
+        return pt
+    out = {k: v for k, v in pt.items() if k not in ("tiles", "buffer")}
+    out["packed"] = {
+        "ox": g["ox"], "oy": g["oy"], "w": g["w"], "h": g["h"],
+        "palette": palette, "enc": enc,
+        "data": data if binary else base64.b64encode(data).decode("ascii"),
+    }
+    out["off"] = {"i": pt["ox"] - g["ox"], "j": pt["oy"] - g["oy"]}
+    return out
 
 
 # ------------- TEMP CAMP HELPERS -------------
 
 def _temp_camp_here(row: WorldState) -> Optional[WorldBuilding]:
-    b = _building_at(row.pos_x, row.pos_y)
+    b = _building_at(row.pos_x, row.pos_y)  # проверка без SQL (индекс)
     if not b or b.kind != "camp": return None
     dj = _parse_json(b.data_json)
     if not dj.get("temp"): return None
     if str(b.owner_id or "") != str(row.user_id): return None
-    return b
+    return WorldBuilding.query.get(b.id)  # ORM-объект — его удаляют
 
 def _remove_temp_camp_here(row: WorldState):
     b = _temp_camp_here(row)
     if b:
         db.session.delete(b)
         db.session.commit()
+        bump_overlay_version(row.pos_x, row.pos_y)
 
 
 # -------------------- PUBLIC API --------------------
 
-def get_world_state(user_or_id) -> Dict[str,Any]:
+def _state_snapshot_rect(row: WorldState) -> Tuple[int,int,int,int]:
+    """
+    Прямоугольник, покрывающий всё, что прочитает get_world_state: старт и достижимые за dt
+    клетки пути, расширенные на полупатч и до границ чанков (урбанизация — по чанку). Слишком большой
+    (долгий офлайн на длинном пути) — режем до окрестности старта, дальше обычные запросы.
+    """
+    x0 = x1 = int(row.pos_x); y0 = y1 = int(row.pos_y)
+    if not row.resting:
+        dt = max(0.0, _now() - float(row.last_update or _now()))
+        for px, py in row.path_points()[:int(dt / _step_time(row)) + 2]:
+            x0 = min(x0, px); x1 = max(x1, px); y0 = min(y0, py); y1 = max(y1, py)
+        if (x1 - x0) > 4 * _PATCH_W or (y1 - y0) > 4 * _PATCH_H:
+            x0 = x1 = int(row.pos_x); y0 = y1 = int(row.pos_y)
+    mx = _PATCH_W // 2 + 1
+    my = _PATCH_H // 2 + 1
+    S = CHUNK_SIZE
+    return (x0 - mx) // S * S, (y0 - my) // S * S, ((x1 + mx) // S + 1) * S - 1, ((y1 + my) // S + 1) * S - 1
+
+def get_world_state(user_or_id, patch_base=None) -> Dict[str,Any]:
     ensure_world_models()
     uid = _uid(user_or_id)
     row = _get_state(uid)
-    _advance(row)
-    db.session.add(row); db.session.commit()
+    # постройки/оверрайды/чанки всего запроса — из одного снимка (см. _WorldSnapshot)
+    with _world_snapshot(*_state_snapshot_rect(row)):
+        return _world_state_body(uid, row, patch_base)
 
-    # эволюция/префетч ближайших чанков — СЮДА (а не в _advance), чтобы тик был быстрым.
-    _prefetch_ring(row.pos_x//CHUNK_SIZE, row.pos_y//CHUNK_SIZE, radius=1)
+# Чтение без записи: GET /world/state проецирует героя на «сейчас» в памяти, ничего не коммитя.
+# Сохраняют состояние действия (set_dest/stop/rest/…, они сами делают _advance+commit), POST-тик
+# и чекпоинт: если строка не сохранялась дольше WORLD_STATE_CHECKPOINT_SEC — идём обычным путём.
+_STATE_CHECKPOINT_SEC = float(os.getenv("WORLD_STATE_CHECKPOINT_SEC", "30.0") or 30.0)
+
+def project_world_state(user_or_id, now: Optional[float] = None, patch_base=None) -> Dict[str,Any]:
+    """То же, что get_world_state, но без побочных эффектов для строки героя (и без префетча чанков)."""
+    ensure_world_models()
+    uid = _uid(user_or_id)
+    row = _get_state(uid)
+    now = _now() if now is None else float(now)
+    if now - float(row.last_update or now) >= _STATE_CHECKPOINT_SEC:
+        with _world_snapshot(*_state_snapshot_rect(row)):
+            return _world_state_body(uid, row, patch_base)
+    # отвязываем строку: никакой commit по ходу запроса (создание чанка и т.п.) её не запишет
+    if sa_inspect(row).expired_attributes:
+        db.session.refresh(row)
+    db.session.expunge(row)
+    with _world_snapshot(*_state_snapshot_rect(row)):
+        return _world_state_body(uid, row, patch_base, now=now, persist=False)
+
+def _committed_values(row: WorldState) -> Dict[str, Any]:
+    """Значения колонок, какими они лежат в БД (до несброшенных/новых изменений)."""
+    st = sa_inspect(row)
+    out = {}
+    for k in _SIGNIFICANT_COLS + _HOT_COLS:
+        h = st.attrs[k].history
+        out[k] = h.deleted[0] if h.deleted else getattr(row, k)
+    return out
+
+def _commit_keep_loaded():
+    """commit без expire: строку игрока мы только что сами записали — перечитывать её (SELECT) незачем."""
+    sess = db.session()
+    keep = sess.expire_on_commit
+    sess.expire_on_commit = False
+    try:
+        sess.commit()
+    finally:
+        sess.expire_on_commit = keep
+
+def _world_state_body(uid: int, row: WorldState, patch_base, now: Optional[float] = None,
+                      persist: bool = True) -> Dict[str,Any]:
+    if persist:
+        db_vals = _committed_values(row)
+        _advance(row, now)
+        _plan_apply_ready(row)
+        _defer_or_commit(row, db_vals)
+        # эволюция/префетч ближайших чанков — СЮДА (а не в _advance), чтобы тик был быстрым.
+        _prefetch_ring(row.pos_x//CHUNK_SIZE, row.pos_y//CHUNK_SIZE, radius=1)
+    else:
+        _advance(row, now)
 
     # сразу строим патч (он уже содержит согласованные погоду/фазу/эфемерные скины)
     pt = _patch(row.pos_x, row.pos_y)
     pt["view"] = {"ox": pt["ox"], "oy": pt["oy"], "w": pt["w"], "h": pt["h"]}
 
-    # влияние и актуальная погода для UI-цифр
-    infl = _player_influence(pt["ox"], pt["oy"], pt["ox"]+pt["w"]-1, pt["oy"]+pt["h"]-1)
-
+    # влияние и актуальная погода для UI-цифр — по чанку героя, как в _advance (не по камере)
     cx, cy = row.pos_x//CHUNK_SIZE, row.pos_y//CHUNK_SIZE
+    infl = _influence_of_chunk(cx, cy)
     climate = _climate_of(cx, cy)
 
-    now = _now()
+    now = _now() if now is None else float(now)
     now_bucket = math.floor(now/1800.0)*1800.0
     weather = pick_weather_for_chunk(climate, infl, now_bucket, cx=cx, cy=cy, now_ts=now)
 
@@ -791,11 +2148,11 @@ def get_world_state(user_or_id) -> Dict[str,Any]:
         }
     })
 
-    path = json.loads(row.path_json or "[]")
+    path_left = row.path_left()
     anim = None
     move_progress = None
-    if path:
-        nx, ny = path[0]
+    if path_left:
+        nx, ny = row.path_next()
         step_t = _step_time(row)
         p0 = _clamp((now - float(row.last_update or now)) / max(1e-6, step_t), 0.0, 1.0)
         anim = {
@@ -815,10 +2172,10 @@ def get_world_state(user_or_id) -> Dict[str,Any]:
         "screen": pt["view"],             # видимое окно 15×9
         "center_idx": pt["center"],       # где рисовать игрока в tiles
         "dest": None if row.dest_x is None else {"x":row.dest_x,"y":row.dest_y},
-        "path_left": len(path),
+        "path_left": path_left,
         "speed_base": float(row.speed or 1.6),
         "tile": cur,
-        "patch": pt,
+        "patch": _patch_for_client(pt, patch_base),
         "weather": weather_ui,            # <-- отдаем обогащённый объект
         "climate": climate,
         "urbanization": infl,
@@ -826,7 +2183,8 @@ def get_world_state(user_or_id) -> Dict[str,Any]:
         "resting": bool(row.resting),
         "camp": camp_info,
         "anim": anim,
-        "move": {"moving": bool(path), "progress": move_progress, "step_t": _step_time(row)},
+        "move": {"moving": bool(path_left), "progress": move_progress, "step_t": _step_time(row),
+                 "eta": (float(row.last_update) + path_left * _step_time(row)) if path_left else None},
         "now": now
     }
 
@@ -843,43 +2201,253 @@ def _encode_dirs(path: List[Tuple[int,int]], sx:int, sy:int) -> str:
         px, py = x, y
     return ''.join(dirs)
 
+# ---- асинхронное планирование дальних маршрутов ----
+# Дальняя цель без попадания в кеш маршрутов не держит поток запроса: set_destination отдаёт
+# жадный префикс (A* с малым лимитом раскрытий до клетки, ближайшей к цели) и id задачи,
+# а полный путь от конца префикса считает пул WORLD_PLAN_WORKERS. Пул строку героя не трогает:
+# готовый хвост лежит в задаче (status "ready"), а пришивает его к WorldState ближайший поток
+# запроса (тик состояния или plan_job_status) после своего _advance — если герой всё ещё идёт
+# по этому префиксу (или стоит в его конце) и задача не отменена новой целью/стопом.
+_PLAN_WORKERS = int(os.getenv("WORLD_PLAN_WORKERS", "2") or 0)                      # 0 — всё синхронно
+_PLAN_ASYNC_DIST = int(os.getenv("WORLD_PLAN_ASYNC_DIST", str(_HPA_MIN_DIST)) or _HPA_MIN_DIST)
+_PLAN_PREFIX = int(os.getenv("WORLD_PLAN_PREFIX", "48") or 48)                      # клеток в префиксе
+_PLAN_PREFIX_ITER = int(os.getenv("WORLD_PLAN_PREFIX_ITER", "3000") or 3000)
+_PLAN_JOBS_MAX = 4096
+_PLAN_JOBS: "OrderedDict[str, Dict[str,Any]]" = OrderedDict()   # job_id -> статус
+_PLAN_BY_USER: Dict[str, str] = {}                               # uid -> актуальная задача
+_PLAN_LOCK = threading.Lock()
+_PLAN_JOB_PUBLIC = ("pending", "done", "failed", "dropped")   # ready/applying клиенту — ещё pending
+_PLAN_POOL = None
+PLAN_JOB_STATS = {"queued": 0, "done": 0, "failed": 0, "dropped": 0, "ms": 0.0}
+
+def _plan_pool():
+    global _PLAN_POOL
+    if _PLAN_POOL is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _PLAN_POOL = ThreadPoolExecutor(max_workers=max(1, _PLAN_WORKERS), thread_name_prefix="world-plan")
+    return _PLAN_POOL
+
+def _plan_cancel(uid):
+    """Новая цель/стоп/отдых: готовый хвост старой задачи уже не пришиваем."""
+    with _PLAN_LOCK:
+        _PLAN_BY_USER.pop(str(uid), None)
+
+def _plan_finish(job: Dict[str,Any], status: str, **extra):
+    with _PLAN_LOCK:
+        job.update(extra, status=status, finished=_now())
+    PLAN_JOB_STATS[status] += 1
+
+def _plan_job_run(app, job_id: str, ctx: _TileCtx, prefix: List[Tuple[int,int]], sx:int, sy:int, tx:int, ty:int):
+    job = _PLAN_JOBS[job_id]
+    uid = job["uid"]
+    px, py = prefix[-1] if prefix else (sx, sy)
+    try:
+        with app.app_context():
+            t0 = time.perf_counter()
+            with _readonly_chunks():
+                rest = _hpa_path(ctx, px, py, tx, ty)[0]
+            ms = (time.perf_counter() - t0) * 1000.0
+            PLAN_JOB_STATS["ms"] += ms
+            if not rest:
+                _plan_finish(job, "failed", message="Путь не найден (вода/лава/преграды).")
+                return
+            _route_cache_put(sx, sy, tx, ty, ctx.now_bucket, prefix + rest, ms)
+            with _PLAN_LOCK:
+                current = _PLAN_BY_USER.get(uid) == job_id
+                if current:
+                    job.update(rest=rest, ms=round(ms, 1), status="ready")
+            if not current:
+                _plan_finish(job, "dropped")
+    except Exception as e:
+        print(f"[WorldPlan] job {job_id} error: {e}")
+        _plan_finish(job, "failed", message="Ошибка построения маршрута")
+
+_PLAN_APPLY_COLS = ("path_json", "path_rle", "path_sx", "path_sy", "path_len", "path_cur", "dest_x", "dest_y", "resting")
+
+def _plan_apply_ready(row: WorldState) -> bool:
+    """
+    Пришить готовый хвост задачи к строке героя (поток запроса, сразу после _advance; commit — за
+    вызывающим). True — строку изменили. Маршрут пишется условным UPDATE: только пока в БД всё тот
+    же префикс (или уже пустой путь в его конце) — иначе между проверкой и commit его сменил
+    другой запрос, и задача снимается.
+    """
+    uid = str(row.user_id)
+    with _PLAN_LOCK:
+        job = _PLAN_JOBS.get(_PLAN_BY_USER.get(uid, ""))
+        if job is None or job["status"] != "ready":
+            return False
+        job["status"] = "applying"  # пришивает ровно один поток
+        rest = job.pop("rest")
+    px, py = job["from"]["x"], job["from"]["y"]
+    on_prefix = row.path_left() > 0 and row.path_sig() == job["sig"]
+    at_end = row.path_left() <= 0 and (int(row.pos_x), int(row.pos_y)) == (px, py)
+    if not (on_prefix or at_end):
+        _plan_finish(job, "dropped")
+        return False
+    old = {k: getattr(row, k) for k in _PLAN_APPLY_COLS}
+    if on_prefix:
+        row.set_path(row.path_points() + rest, int(row.pos_x), int(row.pos_y))
+    else:
+        row.set_path(rest, px, py)
+        # выдохся на конце префикса — отдыхает дальше; с путём встанет сам (fatigue <= 20, см. _advance)
+        row.resting = bool(row.resting) and float(row.fatigue or 0.0) > 20.0
+    row.dest_x, row.dest_y = job["dest"]
+    vals = {k: getattr(row, k) for k in _PLAN_APPLY_COLS}
+    sigs = [WorldState.path_sig_filter(("json", "[]"))] if at_end else []
+    if job["sig"] is not None:
+        sigs.append(WorldState.path_sig_filter(job["sig"]))
+    with db.session.no_autoflush:
+        n = WorldState.query.filter(WorldState.user_id == uid, or_(*(and_(*f) for f in sigs))) \
+            .update(vals, synchronize_session=False)
+    if not n:
+        for k, v in old.items():
+            setattr(row, k, v)
+        _plan_finish(job, "dropped")
+        return False
+    for k, v in vals.items():
+        set_committed_value(row, k, v)  # уже записано UPDATE'ом — flush строки их не повторит
+    step_t = _step_time(row)
+    _plan_finish(job, "done", tail=_encode_dirs(rest, px, py), at=float(row.last_update),
+                 eta=float(row.last_update) + row.path_left() * step_t)
+    return True
+
+def _plan_async(row: WorldState, ctx: _TileCtx, sx:int, sy:int, tx:int, ty:int) -> Dict[str,Any]:
+    """Префикс сразу, полный путь — задачей в пуле."""
+    from flask import current_app
+    import uuid
+    with _readonly_chunks():
+        prefix = _grid_search(ctx, {}, sx, sy, tx, ty, _PLAN_PREFIX_ITER, partial=True)[0][:_PLAN_PREFIX]
+
+    row.dest_x, row.dest_y = int(tx), int(ty)
+    if prefix:
+        row.set_path(prefix, sx, sy)
+    else:
+        row.clear_path()
+    row.last_update = _now()
+    row.resting = False
+    db.session.add(row); db.session.commit()
+    if prefix:
+        with _readonly_chunks():
+            _route_profile(row, ctx.now_bucket)
+
+    uid = str(row.user_id)
+    job_id = uuid.uuid4().hex[:16]
+    job = {"uid": uid, "status": "pending", "created": _now(), "sig": row.path_sig() if prefix else None,
+           "dest": (int(tx), int(ty)),
+           "from": {"x": int((prefix[-1] if prefix else (sx, sy))[0]), "y": int((prefix[-1] if prefix else (sx, sy))[1])}}
+    with _PLAN_LOCK:
+        _PLAN_JOBS[job_id] = job
+        _PLAN_BY_USER[uid] = job_id
+        while len(_PLAN_JOBS) > _PLAN_JOBS_MAX:
+            _PLAN_JOBS.popitem(last=False)
+    PLAN_JOB_STATS["queued"] += 1
+    _plan_pool().submit(_plan_job_run, current_app._get_current_object(), job_id, ctx, prefix, sx, sy, tx, ty)
+
+    step_t = _step_time(row)
+    return {
+        "ok": True,
+        "message": "Маршрут строится",
+        "steps": len(prefix),
+        "job": job_id,
+        "plan": {
+            "start": {"x": sx, "y": sy},
+            "dirs": _encode_dirs(prefix, sx, sy),
+            "step_t": float(step_t),
+            "now": _now(),
+            "eta": None,
+            "job": job_id,
+            "partial": True
+        }
+    }
+
+def plan_job_status(user_or_id, job_id: str) -> Dict[str,Any]:
+    """
+    Статус задачи планирования: pending | done (tail — направления от from, at — когда герой
+    пошёл по хвосту, если к тому моменту уже стоял) | failed | dropped | unknown (другой воркер/вытеснена).
+    Готовый хвост ("ready") пришивается здесь же, как в тике состояния.
+    """
+    uid = str(_uid(user_or_id))
+    with _PLAN_LOCK:
+        job = _PLAN_JOBS.get(str(job_id or ""))
+        ready = job is not None and job["uid"] == uid and job["status"] == "ready"
+    if ready:
+        ensure_world_models()
+        row = _get_state(uid)
+        db_vals = _committed_values(row)
+        _advance(row)
+        _plan_apply_ready(row)
+        _defer_or_commit(row, db_vals)
+    with _PLAN_LOCK:
+        job = _PLAN_JOBS.get(str(job_id or ""))
+        job = dict(job) if job is not None and job["uid"] == uid else None
+    if job is None:
+        return {"ok": False, "status": "unknown"}
+    out = {"ok": True, "status": job["status"] if job["status"] in _PLAN_JOB_PUBLIC else "pending",
+           "job": job_id, "from": job["from"]}
+    for k in ("tail", "at", "eta", "message"):
+        if k in job:
+            out[k] = job[k]
+    return out
+
+def plan_job_metrics() -> Dict[str, Any]:
+    with _PLAN_LOCK:
+        pending = sum(1 for j in _PLAN_JOBS.values() if j["status"] not in _PLAN_JOB_PUBLIC[1:])
+    return dict(PLAN_JOB_STATS, ms=round(PLAN_JOB_STATS["ms"], 1), pending=pending, workers=_PLAN_WORKERS)
+
 def set_destination(user_or_id, tx:int, ty:int) -> Dict[str,Any]:
     ensure_world_models()
     uid = _uid(user_or_id)
     row = _get_state(uid)
     _advance(row)
+    _plan_cancel(row.user_id)
 
     _remove_temp_camp_here(row)
 
     sx,sy = int(row.pos_x), int(row.pos_y)
 
-    # прямоугольник от старта к цели (+паддинг) для быстрого A*
-    x0, x1 = sorted((sx, tx)); y0, y1 = sorted((sy, ty))
-    PAD = 12
-    x0 -= PAD; x1 += PAD; y0 -= PAD; y1 += PAD
-    infl = _player_influence(x0,y0,x1,y1)
     now = _now()
     now_bucket = math.floor(now/1800.0)*1800.0
-    bmap, omap = _rect_overlay_maps(x0,y0,x1,y1)
-    ctx = _TileCtx(now_bucket=now_bucket, influence=infl, bmap=bmap, omap=omap)
+    # сетки цены шага берут постройки/оверрайды сами (по чанку) — карты на весь прямоугольник не нужны;
+    # урбанизация — по чанку, как у профиля маршрута, по которому потом пойдёт герой
+    ctx = _TileCtx(now_bucket=now_bucket, influence=0.0, bmap={}, omap={}, chunk_influence=True)
 
-    cx, cy = row.pos_x//CHUNK_SIZE, row.pos_y//CHUNK_SIZE
-    climate = _climate_of(cx, cy)
-    weather = pick_weather_for_chunk(climate, infl, now_bucket, cx=cx, cy=cy, now_ts=now)
+    weather = _weather_for_chunk(ctx, row.pos_x//CHUNK_SIZE, row.pos_y//CHUNK_SIZE)
 
     if (sx,sy)==(tx,ty):
-        row.dest_x=row.dest_y=None; row.path_json="[]"; db.session.commit()
+        row.dest_x=row.dest_y=None; row.clear_path(); db.session.commit()
         return {"ok": True, "message":"Уже на месте"}
 
-    path = _astar(row, tx, ty, weather, ctx=ctx)
+    with _readonly_chunks():
+        verdict, goal = _check_reachable(ctx, sx, sy, tx, ty)
+    if verdict == "no":
+        return {"ok": False, "message":"Путь не найден (вода/лава/преграды)."}
+    tx, ty = goal
+    if (sx,sy)==(tx,ty):
+        row.dest_x=row.dest_y=None; row.clear_path(); db.session.commit()
+        return {"ok": True, "message":"Уже на месте"}
+
+    path = _route_cache_get(sx, sy, tx, ty, now_bucket)
+    if path is None and _PLAN_WORKERS > 0 and abs(tx - sx) + abs(ty - sy) >= _PLAN_ASYNC_DIST:
+        return _plan_async(row, ctx, sx, sy, tx, ty)
+    if path is None:
+        t0 = time.perf_counter()
+        with _readonly_chunks():
+            if abs(tx - sx) + abs(ty - sy) >= _HPA_MIN_DIST:
+                path = _hpa_path(ctx, sx, sy, tx, ty)[0]   # дальняя цель: порталы чанков, затем коридор
+            else:
+                path = _astar(row, tx, ty, weather, ctx=ctx)
+        if path:
+            _route_cache_put(sx, sy, tx, ty, now_bucket, path, (time.perf_counter() - t0) * 1000.0)
     if not path:
         return {"ok": False, "message":"Путь не найден (вода/лава/преграды)."}
 
     row.dest_x, row.dest_y = int(tx), int(ty)
-    row.path_json = json.dumps(path, separators=(",", ":"))
+    row.set_path(path, sx, sy)
     row.last_update = _now()
     row.resting = False
     db.session.add(row); db.session.commit()
+    with _readonly_chunks():
+        _route_profile(row, now_bucket)  # цены шагов — сразу, тики их только читают
 
     # Вернём компактный «план» для клиента (локальная анимация без частых запросов)
     dirs = _encode_dirs(path, sx, sy)
@@ -892,7 +2460,8 @@ def set_destination(user_or_id, tx:int, ty:int) -> Dict[str,Any]:
             "start": {"x": sx, "y": sy},
             "dirs": dirs,
             "step_t": float(step_t),
-            "now": _now()
+            "now": _now(),
+            "eta": float(row.last_update) + len(path) * float(step_t)
         }
     }
 
@@ -901,7 +2470,8 @@ def stop_hero(user_or_id) -> Dict[str,Any]:
     uid = _uid(user_or_id)
     row = _get_state(uid)
     _advance(row)
-    row.dest_x=row.dest_y=None; row.path_json="[]"; row.last_update=_now()
+    _plan_cancel(row.user_id)
+    row.dest_x=row.dest_y=None; row.clear_path(); row.last_update=_now()
     db.session.add(row); db.session.commit()
     return {"ok": True, "message":"Остановлен"}
 
@@ -910,8 +2480,9 @@ def rest_here(user_or_id) -> Dict[str,Any]:
     uid = _uid(user_or_id)
     row = _get_state(uid)
     _advance(row)
+    _plan_cancel(row.user_id)
     row.resting = True
-    row.dest_x=row.dest_y=None; row.path_json="[]"; row.last_update=_now()
+    row.dest_x=row.dest_y=None; row.clear_path(); row.last_update=_now()
     db.session.add(row); db.session.commit()
     return {"ok": True, "message":"Отдых начат"}
 
@@ -950,11 +2521,12 @@ def build_here(user_or_id, kind: str) -> Dict[str,Any]:
     if kind != "camp":
         return {"ok": False, "message":"Сейчас можно строить только лагерь."}
 
-    if WorldBuilding.query.filter_by(x=x,y=y).first():
+    if _building_at(x, y):
         return {"ok": False, "message":"Клетка занята постройкой."}
 
     b = WorldBuilding(x=x,y=y,kind="camp", owner_id=str(uid), data_json=json.dumps({"temp": False}), created_at=_now())
     db.session.add(b); db.session.commit()
+    bump_overlay_version(x, y)
     return {"ok": True, "message": "Лагерь установлен", "x":x,"y":y,"kind":kind}
 
 def camp_start(user_or_id) -> Dict[str,Any]:
@@ -972,17 +2544,20 @@ def camp_start(user_or_id) -> Dict[str,Any]:
     if b and b.kind=="camp":
         dj = _parse_json(b.data_json)
         if dj.get("temp") and str(b.owner_id or "")==str(uid):
+            _plan_cancel(row.user_id)
             row.resting = True
-            row.dest_x=row.dest_y=None; row.path_json="[]"; row.last_update=_now()
+            row.dest_x=row.dest_y=None; row.clear_path(); row.last_update=_now()
             db.session.add(row); db.session.commit()
             return {"ok": True, "message":"Вы уже в своём лагере"}
         else:
             return {"ok": False, "message":"Здесь уже стоит лагерь."}
     nb = WorldBuilding(x=x,y=y,kind="camp", owner_id=str(uid), data_json=json.dumps({"temp": True}), created_at=_now())
     db.session.add(nb)
+    _plan_cancel(row.user_id)
     row.resting = True
-    row.dest_x=row.dest_y=None; row.path_json="[]"; row.last_update=_now()
+    row.dest_x=row.dest_y=None; row.clear_path(); row.last_update=_now()
     db.session.add(row); db.session.commit()
+    bump_overlay_version(x, y)
     return {"ok": True, "message":"Лагерь разбит. Можно отдыхать."}
 
 def camp_leave(user_or_id) -> Dict[str,Any]:
@@ -997,12 +2572,67 @@ def camp_leave(user_or_id) -> Dict[str,Any]:
     row.resting = False
     db.session.add(row)
     db.session.commit()
+    bump_overlay_version(row.pos_x, row.pos_y)
     return {"ok": True, "message":"Лагерь свёрнут. Путь свободен."}
 
+# --- ЧАНКИ ЦЕЛИКОМ (кешируемое API карты: клиент сам собирает вид) ---
+_CHUNKS_MAX_BATCH = 64
+
+def _chunk_etag(ctx: _TileCtx, cx:int, cy:int, phase: float) -> str:
+    """
+    Строгий ETag: версия тайлов чанка + отпечаток его построек/оверрайдов
+    + слот погоды (бакет, фаза, ключ/осадки, климат) — всё, от чего зависит разрешённый вид.
+    """
+    clim = _climate_cached(ctx, cx, cy)
+    wthr = _weather_for_chunk(ctx, cx, cy)
+    ov = repr((sorted(ctx.bmap.items()), sorted(ctx.omap.items())))
+    wk = repr((wthr.get("key"), wthr.get("precip"),
+               tuple(float(clim.get(k, 0.0)) for k in ("temp", "moist", "height_mean", "forest_density"))))
+    tv = _TILE_VER.get((cx, cy), 0) & 0xffffffff
+    return "c%d.%d-%08x-%08x-%08x-%d-%d" % (
+        cx, cy, tv,
+        zlib.crc32(ov.encode("utf-8")) & 0xffffffff, zlib.crc32(wk.encode("utf-8")) & 0xffffffff,
+        int(ctx.now_bucket), int(phase * _VIEW_PHASE_STEPS))
+
+def get_chunk_views(coords: List[Tuple[int,int]], known=()) -> Dict[str, Any]:
+    """
+    Разрешённые чанки 32×32 (эфемерные скины + постройки/оверрайды), не более _CHUNKS_MAX_BATCH.
+    known — ETag-и, которые у клиента уже есть: такие чанки отдаются без тайлов ("same": true).
+    etag ответа — свёртка ETag-ов чанков (для If-None-Match на всю пачку).
+    """
+    ensure_world_models()
+    now = _now()
+    now_bucket = math.floor(now/1800.0)*1800.0
+    phase = _view_phase(now_bucket, True)
+    known = set(known or ())
+    with _readonly_chunks():
+        out = [_chunk_view_item(cx, cy, now_bucket, phase, known) for cx, cy in coords[:_CHUNKS_MAX_BATCH]]
+    etag = "b-%08x" % (zlib.crc32("|".join(c["etag"] for c in out).encode("utf-8")) & 0xffffffff)
+    return {"ok": True, "chunks": out, "etag": etag}
+
+def _chunk_view_item(cx: int, cy: int, now_bucket: float, phase: float, known: set) -> Dict[str, Any]:
+    x0, y0 = cx*CHUNK_SIZE, cy*CHUNK_SIZE
+    x1, y1 = x0 + CHUNK_SIZE - 1, y0 + CHUNK_SIZE - 1
+    bmap, omap = _rect_overlay_maps(x0, y0, x1, y1)
+    # (x,y) построек уникальны — len(bmap) == count() из _player_influence
+    infl = _clamp(len(bmap) / float(CHUNK_SIZE*CHUNK_SIZE), 0.0, 1.0)
+    ctx = _TileCtx(now_bucket=now_bucket, influence=infl, bmap=bmap, omap=omap,
+                   chunk_influence=True, influence_by_chunk={(cx, cy): infl})
+    _tiles_cached(ctx, cx, cy)  # прогревает _TILE_VER
+    etag = _chunk_etag(ctx, cx, cy, phase)
+    item = {"cx": cx, "cy": cy, "ox": x0, "oy": y0, "w": CHUNK_SIZE, "h": CHUNK_SIZE, "etag": etag}
+    if etag in known:
+        item["same"] = True
+    else:
+        item["tiles"] = _tiles_rect(ctx, x0, y0, CHUNK_SIZE, CHUNK_SIZE, for_view=True)
+        item["buildings"] = _buildings_rect(x0, y0, x1, y1)
+    return item
+
+
 # --- VIEW-ONLY PATCH (для подгрузки тайлов по камере) ---
-def get_patch_view(cx: int, cy: int) -> Dict[str, Any]:
+def get_patch_view(cx: int, cy: int, patch_base=None) -> Dict[str, Any]:
     ensure_world_models()
     _prefetch_ring(cx // CHUNK_SIZE, cy // CHUNK_SIZE, radius=1)
     pt = _patch(cx, cy)
     pt["view"] = {"ox": pt["ox"], "oy": pt["oy"], "w": pt["w"], "h": pt["h"]}
-    return {"ok": True, "patch": pt}
+    return {"ok": True, "patch": _patch_for_client(pt, patch_base)}
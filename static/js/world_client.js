@@ -9,7 +9,7 @@
   const BOOT = window.WORLD_BOOT || {tileVersions:{}, endpoints:{}};
   const ENDPOINTS = Object.assign({
     state:'/world/state', setDest:'/world/set_dest', stop:'/world/stop',
-    campStart:'/world/camp/start', campLeave:'/world/camp/leave',
+    campStart:'/world/camp/start', campLeave:'/world/camp/leave', planJob:'/world/plan_job',
     tileVersions:'/world/tile_versions', patchView:'/world/patch', stateGet:'',
     // Новые эндпойнты добычи/инвентаря (можешь переопределить в WORLD_BOOT)
     gatherStart:'/world/gather/start',
@@ -92,7 +92,7 @@
     hideHero:false,didIdlePrefetch:false,lastResting:false,lastPathLeft:0,tickInFlight:false,tickTimer:null,lastDataNow:0,
     arriveLockUntil:0, wasMoving:false,
     campHere:false, campMine:false, wxOpen:false, hudCollapsed:false,
-    plan:{active:false,start:{x:0,y:0},dirs:'',idx:0,stepT:.6,ts:0,stopAt:null,cur:{x:0,y:0}},
+    plan:{active:false,start:{x:0,y:0},dirs:'',idx:0,stepT:.6,ts:0,stopAt:null,cur:{x:0,y:0},job:null},
     // добыча
     gatherActive:false, gatherTimer:null
   };
@@ -153,16 +153,16 @@
   }
 
   /* ——— API helpers ——— */
-  async function apiPOST(path,data){
+  async function apiPOST(path,data,headers){
     try{
-      const r=await fetch(path,{method:'POST',headers:{'Content-Type':'application/json'},body:data?JSON.stringify(data):'{}'});
+      const r=await fetch(path,{method:'POST',headers:Object.assign({'Content-Type':'application/json'},headers||{}),body:data?JSON.stringify(data):'{}'});
       let j=null; try{ j=await r.json() }catch(e){ j={ok:false,error:'bad_json'} }
       if(!r.ok) j.ok=false; j.__http=r.status; return j;
     }catch(e){ return {ok:false,error:'network_error',detail:String(e)} }
   }
-  async function apiGET(path){
+  async function apiGET(path,headers){
     try{
-      const r=await fetch(path,{method:'GET',headers:{'Cache-Control':'no-cache'}});
+      const r=await fetch(path,{method:'GET',headers:Object.assign({'Cache-Control':'no-cache'},headers||{})});
       let j=null; try{ j=await r.json() }catch(e){ j={ok:false,error:'bad_json'} }
       if(!r.ok) j.ok=false; j.__http=r.status; return j;
     }catch(e){ return {ok:false,error:'network_error',detail:String(e)} }
@@ -178,6 +178,31 @@
 
   /* ——— render patch ——— */
   function patchSignature(pt){ let s=`${pt.ox}|${pt.oy}|${pt.w}|${pt.h}|`; for(let j=0;j<pt.h;j++) s+=pt.tiles[j].join(',')+'|'; if(pt.buildings&&pt.buildings.length){ for(const b of pt.buildings) s+=`${b.kind}:${b.x},${b.y}|` } return s }
+  // компактный формат: палитра + uint8 (base64, опц. RLE); окно — смещение off внутри сетки
+  const PACKED={'X-Patch-Format':'packed'};
+  function unpackPatch(pt){
+    if(!pt||!pt.packed) return pt;
+    const g=pt.packed, raw=atob(g.data), n=g.w*g.h, idx=new Uint8Array(n);
+    if(g.enc==='rle'){ let k=0; for(let p=0;p<raw.length;p+=2){ const c=raw.charCodeAt(p), v=raw.charCodeAt(p+1); idx.fill(v,k,k+c); k+=c } }
+    else for(let k=0;k<n;k++) idx[k]=raw.charCodeAt(k);
+    const oi=pt.off?pt.off.i:0, oj=pt.off?pt.off.j:0, tiles=new Array(pt.h);
+    for(let j=0;j<pt.h;j++){ const row=new Array(pt.w), base=(j+oj)*g.w+oi; for(let i=0;i<pt.w;i++) row[i]=g.palette[idx[base+i]]; tiles[j]=row }
+    const out=Object.assign({},pt,{tiles}); delete out.packed; delete out.off; return out;
+  }
+
+  // дельта-протокол: сервер отвечает full / unchanged / delta относительно S.lastPatch
+  function patchBase(){ const pt=S.lastPatch; return (pt&&pt.v)?`${pt.ox},${pt.oy},${pt.v}`:'' }
+  function applyPatchDelta(pt){
+    if(!pt||!pt.mode||pt.mode==='full') return pt;
+    const old=S.lastPatch; if(!old||old.v!==pt.base) return null;
+    if(pt.mode==='unchanged') return old;
+    const dx=pt.ox-old.ox, dy=pt.oy-old.oy, tiles=new Array(pt.h);
+    for(let j=0;j<pt.h;j++){ const orow=old.tiles[j+dy]; const row=new Array(pt.w); for(let i=0;i<pt.w;i++) row[i]=orow?orow[i+dx]:undefined; tiles[j]=row }
+    for(const [j,r] of (pt.rows||[])) tiles[j]=r.slice();
+    for(const [i,j0,seg] of (pt.cols||[])) for(let k=0;k<seg.length;k++) tiles[j0+k][i]=seg[k];
+    for(const [i,j,t] of (pt.cells||[])) tiles[j][i]=t;
+    return Object.assign({},pt,{mode:'full',tiles,buildings:pt.buildings||[]});
+  }
   function renderPatch(pt,force=false){
     if(!pt||!pt.tiles) return;
     S.lastPatch=pt; const sig=patchSignature(pt);
@@ -238,8 +263,9 @@
     const padY=(pt.pad && typeof pt.pad.y==='number')?pt.pad.y:5;
     const nearLeft=x<=pt.ox+padX, nearRight=x>=pt.ox+pt.w-1-padX, nearTop=y<=pt.oy+padY, nearBottom=y>=pt.oy+pt.h-1-padY;
     if(!(nearLeft||nearRight||nearTop||nearBottom)) return;
-    const j=await apiGET(`${ENDPOINTS.patchView}?cx=${x}&cy=${y}`);
-    if(j&&j.ok&&j.patch){ renderPatch(j.patch,true); addPreloadHints(j.patch); preloadForPatch(j.patch) }
+    const j=await apiGET(`${ENDPOINTS.patchView}?cx=${x}&cy=${y}&base=${encodeURIComponent(patchBase())}`,PACKED);
+    const np=j&&j.ok?applyPatchDelta(unpackPatch(j.patch)):null;
+    if(np){ renderPatch(np,true); addPreloadHints(np); preloadForPatch(np) }
   }
   function applyCamTransform(){
     const viewPX=(S.screenW*S.cell), viewPY=(S.screenH*S.cell);
@@ -615,9 +641,12 @@ function setStats(s){
   async function tick(){
     if(S.tickInFlight) return; S.tickInFlight=true; hideDiag();
     if(!ENDPOINTS.state){ showDiag('<b>Нет ENDPOINTS.state</b>'); S.tickInFlight=false; return }
-    let s=await apiPOST(ENDPOINTS.state);
+    let s=await apiPOST(ENDPOINTS.state,{base:patchBase()},PACKED);
     if(!s||!s.ok){ if(ENDPOINTS.stateGet){ const g=await apiGET(ENDPOINTS.stateGet); if(g&&g.ok) s=g } }
     if(!s||!s.ok){ const detail=s?JSON.stringify({http:s.__http,error:s.error||null,detail:s.detail||null}):'no response'; showDiag(`<b>Не удалось получить состояние</b><br><small>${detail}</small>`); S.tickInFlight=false; return }
+    const pt=applyPatchDelta(unpackPatch(s.patch));
+    if(!pt){ S.lastPatch=null; S.tickInFlight=false; scheduleTickSoon(30); return }  // база разошлась — следующий тик придёт полным
+    s.patch=pt;
     try{
       const willChange=(patchSignature(s.patch)!==S.lastPatchSig)||(S.lastVersGen!==VERS_GEN);
       renderPatch(s.patch);
@@ -639,27 +668,54 @@ function setStats(s){
 
   function scheduleTickSoon(ms=120){ clearTimeout(S.tickTimer); S.tickTimer=setTimeout(loop,ms) }
 
+  function startPlan(start,dirs,stepT,ts,stopAt){
+    S.plan.active=true; S.plan.start={x:start.x,y:start.y}; S.plan.cur={x:start.x,y:start.y};
+    S.plan.dirs=dirs||''; S.plan.idx=0; S.plan.stepT=Math.max(.1, Number(stepT)||.6); S.plan.ts=(ts||Date.now()/1000); S.plan.stopAt=(typeof stopAt==='number')?stopAt:null;
+    if(S.plan.dirs.length){
+      try{ window.dispatchEvent(new Event('pk:movement')); }catch(_){}
+      const [dx,dy]=([...'RLDU'].includes(S.plan.dirs[0])?((c)=>c==='R'?[1,0]:c==='L'?[-1,0]:c==='D'?[0,1]:[0,-1])(S.plan.dirs[0]):[0,0]);
+      S.anim={moving:true, frm:{x:S.plan.cur.x,y:S.plan.cur.y}, to:{x:S.plan.cur.x+dx,y:S.plan.cur.y+dy}, t:S.plan.stepT, ts:S.plan.ts, key:`${S.plan.cur.x},${S.plan.cur.y}->${S.plan.cur.x+dx},${S.plan.cur.y+dy}`};
+      S.pos={x:S.plan.cur.x,y:S.plan.cur.y}; ensurePatchFor(S.plan.cur.x,S.plan.cur.y);
+    } else { S.plan.active=false }
+  }
+
+  // Дальний маршрут: сервер отдал префикс и id задачи — ждём хвост и дописываем его в план
+  async function watchPlanJob(id){
+    for(let i=0;i<120 && S.plan.job===id;i++){
+      await new Promise(res=>setTimeout(res, i<5?300:700));
+      if(S.plan.job!==id) return;
+      const r=await apiGET(`${ENDPOINTS.planJob}?id=${encodeURIComponent(id)}`);
+      if(S.plan.job!==id) return;
+      if(r && r.status==='pending') continue;
+      S.plan.job=null;
+      if(r && r.status==='done' && r.tail){
+        if(S.plan.active) S.plan.dirs+=r.tail;   // ещё идём по префиксу — просто продлеваем
+        else startPlan(r.from, r.tail, S.plan.stepT, r.at);
+        pkToast('Маршрут проложен');
+      } else if(r && r.status==='failed'){ pkToast(r.message||'Путь не найден'); scheduleTickSoon(50) }
+      else { scheduleTickSoon(50) }
+      return;
+    }
+    if(S.plan.job===id){ S.plan.job=null; scheduleTickSoon(50) }
+  }
+
   async function commitDest(t){
     if (S.campHere) { pkToast('Нельзя двигаться, пока развернут лагерь. Нажмите «Лагерь», чтобы свернуть.'); return; }
     const now=performance.now(); if(now-S.lastSetAt<150) return; S.lastSetAt=now;
+    S.plan.job=null;
     const r=await apiPOST(ENDPOINTS.setDest,t);
     if(r&&r.ok){
       pkToast(r.message||'OK');
-      if(r.plan && r.plan.dirs){
-        S.plan.active=true; S.plan.start={x:r.plan.start.x,y:r.plan.start.y}; S.plan.cur={x:r.plan.start.x,y:r.plan.start.y};
-        S.plan.dirs=r.plan.dirs||''; S.plan.idx=0; S.plan.stepT=Math.max(.1, Number(r.plan.step_t)||.6); S.plan.ts=(r.plan.now||Date.now()/1000); S.plan.stopAt=(typeof r.plan.stop_at==='number')?r.plan.stop_at:null;
-        if(S.plan.dirs.length){
-          try{ window.dispatchEvent(new Event('pk:movement')); }catch(_){}
-          const [dx,dy]=([...'RLDU'].includes(S.plan.dirs[0])?((c)=>c==='R'?[1,0]:c==='L'?[-1,0]:c==='D'?[0,1]:[0,-1])(S.plan.dirs[0]):[0,0]);
-          S.anim={moving:true, frm:{x:S.plan.cur.x,y:S.plan.cur.y}, to:{x:S.plan.cur.x+dx,y:S.plan.cur.y+dy}, t:S.plan.stepT, ts:S.plan.ts, key:`${S.plan.cur.x},${S.plan.cur.y}->${S.plan.cur.x+dx},${S.plan.cur.y+dy}`};
-          S.pos={x:S.plan.cur.x,y:S.plan.cur.y}; ensurePatchFor(S.plan.cur.x,S.plan.cur.y);
-        }
+      if(r.plan && typeof r.plan.dirs==='string'){
+        startPlan(r.plan.start, r.plan.dirs, r.plan.step_t, r.plan.now, r.plan.stop_at);
+        if(r.plan.job){ S.plan.job=r.plan.job; watchPlanJob(r.plan.job) }
+        else if(!S.plan.active) scheduleTickSoon(50);
       } else { scheduleTickSoon(50) }
     } else { pkToast((r&&r.message)||'Ошибка'); scheduleTickSoon(50) }
   }
 
   async function onMapDown(e){ e.preventDefault(); S.dragging=true; S.hover=mapPoint(e); S.aimTo={...S.hover}; renderHover(); renderAim();
-    clearTimeout(S.longPressTimer); S.longPressTimer=setTimeout(async()=>{ S.dragging=false; clearTimeout(S.longPressTimer); S.plan.active=false; S.anim=null; const r=await apiPOST(ENDPOINTS.stop); pkToast(r.message||'Стоп'); scheduleTickSoon(30) },450) }
+    clearTimeout(S.longPressTimer); S.longPressTimer=setTimeout(async()=>{ S.dragging=false; clearTimeout(S.longPressTimer); S.plan.active=false; S.plan.job=null; S.anim=null; const r=await apiPOST(ENDPOINTS.stop); pkToast(r.message||'Стоп'); scheduleTickSoon(30) },450) }
   function onMapMove(e){ if(!S.dragging) return; S.hover=mapPoint(e); S.aimTo={...S.hover}; renderHover(); renderAim() }
   async function onMapUp(e){ clearTimeout(S.longPressTimer); if(!S.dragging) return; S.dragging=false; const t=mapPoint(e); S.hover={x:null,y:null}; renderHover(); S.aimTo={...t}; renderAim() }
   async function onGo(){ if(S.aimTo.x==null){ pkToast('Сначала выберите точку на карте'); return } await commitDest(S.aimTo) }
@@ -677,7 +733,7 @@ function setStats(s){
     scheduleTickSoon(30);
   }
 
-  async function onStop(){ S.plan.active=false; S.anim=null; if (S.gatherActive) await stopGather(); const r=await apiPOST(ENDPOINTS.stop); pkToast(r.message||'Стоп'); scheduleTickSoon(30) }
+  async function onStop(){ S.plan.active=false; S.plan.job=null; S.anim=null; if (S.gatherActive) await stopGather(); const r=await apiPOST(ENDPOINTS.stop); pkToast(r.message||'Стоп'); scheduleTickSoon(30) }
 
   /* ——— цикл обновлений ——— */
   let hidden=document.visibilityState==='hidden';
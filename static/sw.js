@@ -1,5 +1,7 @@
 const STATIC = 'pk-static-v2'; // было v1
+const CHUNKS = 'pk-chunks-v1';  // /world/chunks: храним ответ, перед выдачей ревалидируем по ETag
 const MATCH = /\/static\/tiles\//;
+const MATCH_CHUNKS = /\/world\/chunks$/;
 
 self.addEventListener('install', e=>{
   self.skipWaiting();
@@ -9,7 +11,7 @@ self.addEventListener('install', e=>{
 self.addEventListener('activate', e=>{
   e.waitUntil((async()=>{
     const keys = await caches.keys();
-    await Promise.all(keys.filter(k=>k!==STATIC).map(k=>caches.delete(k)));
+    await Promise.all(keys.filter(k=>k!==STATIC && k!==CHUNKS).map(k=>caches.delete(k)));
     self.clients.claim();
   })());
 });
@@ -25,5 +27,20 @@ self.addEventListener('fetch', e=>{
       }).catch(()=>hit);
       return hit || fetchP;
     })());
+  } else if (MATCH_CHUNKS.test(url.pathname) && e.request.method === 'GET' && !e.request.headers.has('If-None-Match')) {
+    e.respondWith((async()=>{
+      const cache = await caches.open(CHUNKS);
+      const hit = await cache.match(e.request);
+      const etag = hit && hit.headers.get('ETag');
+      try{
+        const r = await fetch(e.request.url, {headers: etag ? {'If-None-Match': etag} : {}, cache: 'no-store'});
+        if (r.status === 304 && hit) return hit;
+        if (r.ok && r.headers.get('Cache-Control') !== 'no-store') cache.put(e.request, r.clone());
+        return r;
+      }catch(err){
+        if (hit) return hit;
+        throw err;
+      }
+    })());
   }
 });
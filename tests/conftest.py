@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    from flask import Flask
+    from models import db, init_db_config
+    from world_models import ensure_world_models
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + str(tmp_path_factory.mktemp("db") / "world.db")
+    init_db_config(app)
+    db.init_app(app)
+    with app.app_context():
+        ensure_world_models()  # таблицы создаются один раз на процесс — одна БД на сессию тестов
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def urban_weather(monkeypatch):
+    """Погода, где урбанизация прямо в множителе усталости: любое расхождение модели влияния видно в цене."""
+    import services_world as sw
+
+    one, many = sw.pick_weather_for_chunk, sw.pick_weather_for_chunks
+
+    def pick(climate, urb, now_bucket, **kw):
+        return dict(one(climate, urb, now_bucket, **kw), fatigue_mul=1.0 + float(urb))
+
+    def pick_many(coords, climate_of, urb, now_bucket, now_ts=None):
+        urb_of = urb if callable(urb) else (lambda cx, cy: urb)
+        out = many(coords, climate_of, urb, now_bucket, now_ts=now_ts)
+        return {c: dict(w, fatigue_mul=1.0 + float(urb_of(*c))) for c, w in out.items()}
+
+    monkeypatch.setattr(sw, "pick_weather_for_chunk", pick)
+    monkeypatch.setattr(sw, "pick_weather_for_chunks", pick_many)
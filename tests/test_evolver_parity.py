@@ -0,0 +1,68 @@
+"""Пакетный evolve_tiles_ephemeral против потайлового evolve_tile_ephemeral."""
+import random
+
+import pytest
+
+import world_biome_evolver as evo
+from world_tuning import bucket_seconds
+
+pytestmark = pytest.mark.skipif(not evo.NUMPY_OK, reason="нужен NumPy")
+
+TILES = ["grass", "meadow", "forest", "swamp", "sand", "desert", "rock", "snow",
+         "water", "lava", "road", "town", "camp", "tavern", ""]
+CLIMATES = [
+    {"temp": 0.10, "moist": 0.50, "height_mean": 0.60, "forest_density": 0.3},  # снег
+    {"temp": 0.60, "moist": 0.92, "height_mean": 0.10, "forest_density": 0.5},  # болото
+    {"temp": 0.98, "moist": 0.05, "height_mean": 0.00, "forest_density": 0.0},  # сухость
+    {"temp": 0.50, "moist": 0.50, "height_mean": 0.50, "forest_density": 0.0},
+]
+WEATHERS = [{"key": "clear", "precip": "none"}, {"key": "rain", "precip": "rain"},
+            {"key": "snow", "precip": "snow"}, {"key": "storm", "precip": "rain"},
+            {"key": "heat", "precip": "none"}, {}]
+_RND = random.Random(505)
+ORIGINS = [(0, 0), (-37, -23), (-1, 5), (4_000_000, -3_999_987), (-2 ** 31 + 77, 2 ** 31 - 900)] + \
+          [(_RND.randint(-10 ** 6, 10 ** 6), _RND.randint(-10 ** 6, 10 ** 6)) for _ in range(3)]
+
+
+def _case(seed, w=37, h=23):
+    """Сетка тайлов и две «чанковые» половины с разными климатом/погодой."""
+    rnd = random.Random(seed)
+    base = [[rnd.choice(TILES) for _ in range(w)] for _ in range(h)]
+    ca, cb = rnd.sample(CLIMATES, 2)
+    wa, wb = rnd.sample(WEATHERS, 2)
+    split = rnd.randint(1, w - 1)
+    clim = [[ca if i < split else cb for i in range(w)] for _ in range(h)]
+    wthr = [[wa if i < split else wb for i in range(w)] for _ in range(h)]
+    return base, clim, wthr
+
+
+@pytest.mark.parametrize("x0,y0", ORIGINS)
+@pytest.mark.parametrize("slot,phase", [(0, 0.0), (-3, 0.37), (48_123, 1.0), (911, 0.5)])
+def test_batch_matches_per_tile(x0, y0, slot, phase):
+    now_bucket = slot * bucket_seconds()
+    base, clim, wthr = _case(hash((x0, y0, slot)) & 0xffff)
+    got = evo.evolve_tiles_ephemeral(base, x0, y0, clim, wthr, now_bucket, phase)
+    want = [[evo.evolve_tile_ephemeral(base[j][i], x0 + i, y0 + j, clim[j][i], wthr[j][i], now_bucket, phase)
+             for i in range(len(base[0]))] for j in range(len(base))]
+    assert got == want
+
+
+def test_all_climate_weather_combos():
+    """Каждая пара (климат, погода) по всем биомам: скины снега, болота и песка попадают в проверку."""
+    seen = set()
+    for ci, clim in enumerate(CLIMATES):
+        for wi, wthr in enumerate(WEATHERS):
+            base = [[TILES[(i + j) % len(TILES)] for i in range(29)] for j in range(17)]
+            x0, y0 = -ci * 101 - 13, wi * 97 - 300
+            cg = [[clim] * 29 for _ in range(17)]
+            wg = [[wthr] * 29 for _ in range(17)]
+            got = evo.evolve_tiles_ephemeral(base, x0, y0, cg, wg, 7 * bucket_seconds(), 0.25)
+            want = [[evo.evolve_tile_ephemeral(base[j][i], x0 + i, y0 + j, clim, wthr, 7 * bucket_seconds(), 0.25)
+                     for i in range(29)] for j in range(17)]
+            assert got == want, (ci, wi)
+            seen.update(t for row in got for t in row)
+    assert {"swamp", "grass_snow"} <= seen
+
+
+def test_empty_grid():
+    assert evo.evolve_tiles_ephemeral([], 0, 0, [], [], 0.0) == []
@@ -0,0 +1,65 @@
+"""Одна модель урбанизации (по чанку) у вида (/world/chunks, патч) и у логики (герой, планировщик)."""
+import math
+
+import pytest
+
+import services_world as sw
+import world_overlay_index as overlay_index
+from models import db
+from world_models import WorldBuilding, WorldState
+
+S = sw.CHUNK_SIZE
+
+
+@pytest.fixture
+def quarter(app, monkeypatch, urban_weather):
+    """Плотный квартал в чанке (0,0) у его правого края; соседний чанк (1,0) пуст."""
+    t0 = (math.floor(1.7e9 / 1800.0) * 1800.0) + 600.0
+    monkeypatch.setattr(sw, "_now", lambda: t0)
+    WorldBuilding.query.delete()
+    for y in range(0, 8):
+        for x in range(S - 16, S):
+            db.session.add(WorldBuilding(x=x, y=y, kind="road", created_at=t0))
+    db.session.commit()
+    overlay_index.load()
+    sw._ROUTE_PROFILES.clear()
+    return t0
+
+
+def test_view_and_logic_weather_agree(quarter):
+    nb = math.floor(quarter / 1800.0) * 1800.0
+    for cx, cy in [(0, 0), (1, 0), (-1, 0)]:
+        infl = sw._influence_of_chunk(cx, cy)
+        # /world/chunks: урбанизация из карты построек чанка
+        bmap, _ = sw._rect_overlay_maps(cx * S, cy * S, cx * S + S - 1, cy * S + S - 1)
+        view = sw._TileCtx(now_bucket=nb, influence=0.0, bmap={}, omap={}, chunk_influence=True,
+                           influence_by_chunk={(cx, cy): len(bmap) / float(S * S)})
+        # планировщик/профиль маршрута: пакетная погода по сетке индекса
+        logic = sw._TileCtx(now_bucket=nb, influence=0.0, bmap={}, omap={}, chunk_influence=True)
+        sw._prefetch_weather(logic, [(cx, cy), (cx + 5, cy)])
+        assert sw._weather_for_chunk(view, cx, cy)["fatigue_mul"] == pytest.approx(1.0 + infl)
+        assert sw._weather_for_chunk(logic, cx, cy)["fatigue_mul"] == pytest.approx(1.0 + infl)
+        assert sw._chunk_cost_grid(view, cx, cy) == sw._chunk_cost_grid(logic, cx, cy)
+    assert sw._influence_of_chunk(0, 0) == pytest.approx(128 / 1024.0)
+
+
+@pytest.mark.parametrize("x", [S - 20, S + 2])
+def test_state_urbanization_is_hero_chunk_not_camera(quarter, x):
+    """Камера у границы чанков захватывает квартал, но цифры и отдых — по чанку героя."""
+    uid = 9000 + x
+    db.session.add(WorldState(user_id=str(uid), pos_x=x, pos_y=12, last_update=quarter - 10.0,
+                              speed=1.6, fatigue=50.0, resting=True))
+    db.session.commit()
+    st = sw.project_world_state(uid, now=quarter)
+    infl = sw._influence_of_chunk(x // S, 0)
+    assert st["urbanization"] == pytest.approx(infl)
+    assert st["weather"]["fatigue_mul"] == pytest.approx(1.0 + infl)
+
+    # отдых в _advance берёт ту же погоду, что показана игроку
+    row = WorldState.query.filter_by(user_id=str(uid)).first()
+    tile = sw._tile_at(x, 12, ctx=sw._TileCtx(now_bucket=math.floor(quarter / 1800.0) * 1800.0,
+                                               influence=0.0, bmap={}, omap={}, chunk_influence=True),
+                       for_view=True)
+    sw._advance(row, quarter)
+    rest = sw._BASE_REST_PER_SEC * sw.tile_rest_mul(tile) / st["weather"]["fatigue_mul"] * 10.0
+    assert row.fatigue == pytest.approx(50.0 - rest)
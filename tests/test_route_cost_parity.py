@@ -0,0 +1,74 @@
+"""Профиль маршрута (закрытая форма) против пошагового цикла движения старого _advance."""
+import math
+
+import pytest
+
+import services_world as sw
+import world_overlay_index as overlay_index
+from models import db
+from world_models import WorldBuilding, WorldState
+
+S = sw.CHUNK_SIZE
+
+
+def _ref_walk(path, fatigue, steps, now_bucket):
+    """Цикл «клетка за клеткой»: тайл шага + погода его чанка с урбанизацией по чанку героя."""
+    xs = [p[0] for p in path]; ys = [p[1] for p in path]
+    bmap, omap = sw._rect_overlay_maps(min(xs), min(ys), max(xs), max(ys))
+    ctx = sw._TileCtx(now_bucket=now_bucket, influence=0.0, bmap=bmap, omap=omap)
+    costs = []
+    for tx, ty in path[:steps]:
+        tile = sw._tile_at(tx, ty, ctx=ctx, for_view=True)
+        assert sw.is_passable(tile)
+        cx, cy = tx // S, ty // S
+        clim = sw._climate_of(cx, cy)
+        infl = sw._player_influence(cx * S, cy * S, cx * S + S - 1, cy * S + S - 1)
+        w = sw.pick_weather_for_chunk(clim, infl, now_bucket, cx=cx, cy=cy, now_ts=sw._now())
+        w_eff, w_raw = sw._weather_eff_pair(w)
+        cost = sw._BASE_FATIGUE_PER_TILE * sw.tile_fatigue_mul(tile) * sw.tile_env_fatigue_mul(tile, clim, w) * w_eff
+        rate = sw._MOVE_REST_PER_SEC * sw.tile_rest_mul(tile) * (1.0 / w_raw)
+        costs.append((cost, rate))
+    return costs
+
+
+@pytest.mark.parametrize("urban", [False, True])
+@pytest.mark.parametrize("start,goal", [((26, 4), (40, 10)), ((-6, -3), (7, 4))])
+def test_route_profile_matches_per_step_advance(app, monkeypatch, request, start, goal, urban):
+    t0 = (math.floor(1.7e9 / 1800.0) * 1800.0) + 600.0
+    monkeypatch.setattr(sw, "_now", lambda: t0)
+    if urban:
+        request.getfixturevalue("urban_weather")
+    nb = math.floor(t0 / 1800.0) * 1800.0
+    # плотный квартал в стороне от пути (нижние ряды чанка старта): урбанизация по чанку
+    # старта 0.375, у чанка цели 0 — окно вокруг маршрута дало бы третье, общее значение
+    cx0, cy0 = start[0] // S, start[1] // S
+    WorldBuilding.query.delete()
+    for y in range(cy0 * S + 12, cy0 * S + S - 8):
+        for x in range(cx0 * S, cx0 * S + S):
+            db.session.add(WorldBuilding(x=x, y=y, kind="road", created_at=t0))
+    db.session.commit()
+    overlay_index.load()
+    sw._ROUTE_PROFILES.clear()
+
+    with sw._readonly_chunks():
+        ctx = sw._TileCtx(now_bucket=nb, influence=0.0, bmap={}, omap={}, chunk_influence=True)
+        path = sw._grid_search(ctx, {}, start[0], start[1], goal[0], goal[1], 20000)[0]
+    assert path and len({(x // S, y // S) for x, y in path}) > 1
+
+    row = WorldState(user_id="parity", pos_x=start[0], pos_y=start[1], last_update=t0,
+                     speed=2.0, fatigue=30.0, resting=False)
+    row.set_path(path, *start)
+    ref = _ref_walk(path, 30.0, len(path), nb)
+    prof, off = sw._route_profile(row, nb)
+    assert off == 0 and prof["block"] == len(path)
+    assert prof["cost"] == pytest.approx([c for c, _ in ref], rel=1e-9)
+    assert prof["rrate"] == pytest.approx([r for _, r in ref], rel=1e-9)
+
+    # тик на каждый шаг (step_t = 0.5 — времена точные) против ссылочного цикла
+    step_t = sw._step_time(row)
+    fatigue = 30.0
+    for k, (cost, rate) in enumerate(ref[:-1]):
+        sw._advance(row, t0 + (k + 1) * step_t)
+        fatigue = max(0.0, fatigue + cost - rate * step_t)
+        assert (row.pos_x, row.pos_y) == tuple(path[k])
+        assert row.fatigue == pytest.approx(fatigue, abs=1e-9)
@@ -0,0 +1,53 @@
+"""Пакетная погода (weather_fields_grid/pick_weather_for_chunks) против скалярной."""
+import random
+
+import pytest
+
+import world_weather as ww
+
+pytestmark = pytest.mark.skipif(not ww.NUMPY_OK, reason="нужен NumPy")
+
+_RND = random.Random(2525)
+COORDS = [(0, 0), (-1, -1), (-5, 3), (7, -9), (123457, -987653), (-2 ** 31 + 5, 2 ** 31 - 7)] + \
+          [(_RND.randint(-10 ** 6, 10 ** 6), _RND.randint(-10 ** 6, 10 ** 6)) for _ in range(40)]
+SLOTS = [(0, 0, 0.0), (3, 4, 0.5), (-2, -1, 0.93), (480_123, 480_124, 0.07)]
+CLIMATES = [
+    {"temp": 0.10, "moist": 0.80, "height_mean": 0.70, "forest_density": 0.2},
+    {"temp": 0.90, "moist": 0.10, "height_mean": 0.05, "forest_density": 0.0},
+    {"temp": 0.55, "moist": 0.95, "height_mean": 0.20, "forest_density": 0.9},
+    {"temp": 0.45, "moist": 0.45, "height_mean": 0.45, "forest_density": 0.4},
+]
+
+
+@pytest.mark.parametrize("slotA,slotB,alpha", SLOTS)
+def test_fields_grid_matches_scalar(slotA, slotB, alpha):
+    grid = ww.weather_fields_grid([c[0] for c in COORDS], [c[1] for c in COORDS], slotA, slotB, alpha)
+    for k, (cx, cy) in enumerate(COORDS):
+        got = tuple(float(f[k]) for f in grid)
+        assert got == ww._fields_scalar(cx, cy, slotA, slotB, alpha), (cx, cy)
+
+
+def _clim(cx, cy):
+    return CLIMATES[(cx * 7 + cy * 3) % len(CLIMATES)]
+
+
+@pytest.mark.parametrize("now_ts_off", [None, 0.0, 0.4, 0.999])
+@pytest.mark.parametrize("bucket", [0.0, -7 * 1800.0, 1.7e9, 2.5e9 + 1800.0])
+def test_pick_for_chunks_matches_scalar(monkeypatch, bucket, now_ts_off):
+    monkeypatch.setattr(ww, "_WEATHER_CACHE", type(ww._WEATHER_CACHE)())
+    now_ts = None if now_ts_off is None else bucket + now_ts_off * ww.WEATHER_SLOT_SEC
+    urb = lambda cx, cy: ((cx ^ cy) & 7) / 7.0
+    batch = ww.pick_weather_for_chunks(COORDS, _clim, urb, bucket, now_ts=now_ts)
+    ww._WEATHER_CACHE.clear()  # скалярный путь считает заново, а не читает ответы пакета
+    for cx, cy in COORDS:
+        assert batch[(cx, cy)] == ww.pick_weather_for_chunk(_clim(cx, cy), urb(cx, cy), bucket,
+                                                            cx=cx, cy=cy, now_ts=now_ts), (cx, cy)
+
+
+def test_pick_for_chunks_uses_and_fills_cache(monkeypatch):
+    monkeypatch.setattr(ww, "_WEATHER_CACHE", type(ww._WEATHER_CACHE)())
+    coords = COORDS[:10]
+    first = {c: ww.pick_weather_for_chunk(_clim(*c), 0.3, 1.7e9, cx=c[0], cy=c[1], now_ts=1.7e9 + 60) for c in coords[:4]}
+    batch = ww.pick_weather_for_chunks(coords, _clim, 0.3, 1.7e9, now_ts=1.7e9 + 60)
+    assert all(batch[c] == w for c, w in first.items())
+    assert len(ww._WEATHER_CACHE) == len(coords)
@@ -0,0 +1,31 @@
+"""Векторный генератор чанков (generate_region/generate_chunk_np) против скалярного эталона."""
+import random
+
+import pytest
+
+import world_gen
+
+pytestmark = pytest.mark.skipif(not world_gen.NUMPY_OK, reason="нужен NumPy")
+
+_RND = random.Random(1001)
+ORIGINS = [(0, 0), (-1, -1), (-7, 3), (5, -12), (123456, -98765), (-2 ** 20, 2 ** 20 - 3)] + \
+          [(_RND.randint(-50000, 50000), _RND.randint(-50000, 50000)) for _ in range(3)]
+
+
+@pytest.mark.parametrize("cx,cy", ORIGINS)
+def test_chunk_np_matches_scalar(cx, cy):
+    assert world_gen.generate_chunk_np(cx, cy) == world_gen.generate_chunk_scalar(cx, cy)
+
+
+@pytest.mark.parametrize("cx0,cy0", ORIGINS[2:6])
+def test_region_matches_scalar(cx0, cy0):
+    region = world_gen.generate_region(cx0 - 1, cy0, cx0 + 1, cy0 + 1)
+    assert set(region) == {(cx, cy) for cx in range(cx0 - 1, cx0 + 2) for cy in range(cy0, cy0 + 2)}
+    for (cx, cy), got in region.items():
+        assert got == world_gen.generate_chunk_scalar(cx, cy), (cx, cy)
+
+
+def test_region_small_size_matches_scalar():
+    region = world_gen.generate_region(-3, -2, 2, 1, size=8)
+    for (cx, cy), got in region.items():
+        assert got == world_gen.generate_chunk_scalar(cx, cy, 8), (cx, cy)
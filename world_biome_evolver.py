@@ -1,9 +1,17 @@
 # world_biome_evolver.py
 from __future__ import annotations
-from typing import Dict
+from typing import Dict, List, Optional, Tuple
 import math
 from world_tuning import bucket_seconds
 
+# NumPy — опционально: без него evolve_tiles_ephemeral работает потайлово
+try:
+    import numpy as np
+    NUMPY_OK = True
+except Exception:
+    np = None  # type: ignore
+    NUMPY_OK = False
+
 _NON_BIOME = {"road", "town", "tavern", "camp", "lava", "water"}
 _SKINNABLE_SNOW = {"grass","meadow","forest","swamp","sand","desert","rock","road"}
 
@@ -57,16 +65,12 @@ def _blob_noise_temporal(x: int, y: int, slot: int, phase: float) -> float:
     return _lerp(a, b, _fade(s))
 
 # ------------------------------------------------------------------------------
-def evolve_tile_ephemeral(base_tile: str,
-                          x: int, y: int,
-                          climate: Dict[str, float],
-                          weather: Dict[str, object],
-                          now_bucket: float,
-                          now_phase: float = 0.0) -> str:
-    """Возвращает тайл «сейчас». Снег — скин <base>_snow, пятна мигрируют плавно во времени."""
-    if not base_tile or base_tile in _NON_BIOME:
-        return base_tile
+# Параметры скина зависят только от (base, climate, weather) — не от клетки.
+# Общие для потайловой и пакетной версий, чтобы решения совпадали 1-в-1.
+_SkinParams = Tuple[float, Optional[float], bool, float]
 
+def _skin_params(base_tile: str, climate: Dict[str, float], weather: Dict[str, object]) -> _SkinParams:
+    """(snow_p, swamp_p|None, dry_ok, t_eff)"""
     # климат
     t = float(climate.get("temp", 0.5))
     m = float(climate.get("moist", 0.5))
@@ -80,9 +84,6 @@ def evolve_tile_ephemeral(base_tile: str,
     # холодает на высоте и в лесу
     t_eff = _clamp(t - 0.35*h - 0.06*f, 0.0, 1.0)
 
-    slot = int(now_bucket // bucket_seconds())
-    blob = _blob_noise_temporal(x, y, slot, now_phase)  # связное поле с временной плавностью
-
     # --- снег (скин базового тайла) ---
     cold_push = max(0.0, (0.44 - t_eff) * 2.2) + (0.25 if (precip == "snow" or key == "snow") else 0.0) + (0.18 * h)
     if base_tile == "rock":   cold_push *= 0.85
@@ -91,24 +92,144 @@ def evolve_tile_ephemeral(base_tile: str,
     snow_p = _clamp((cold_push - 0.52) * 1.9, 0.0, 1.0)
     # сгладим порог, чтобы «кромка» меньше дрожала
     snow_p = _fade(snow_p)
-    if snow_p > 0 and blob < snow_p:
-        return _snow_skin(base_tile)
 
     # --- болото (тоже использует мигрирующее поле) ---
+    swamp_p = None
     wet_push = m + (0.18 if precip == "rain" else 0.0) + (0.20 if key == "storm" else 0.0) - (0.10 if key == "heat" else 0.0)
     wet_push += 0.06 * f
     if base_tile in ("grass", "meadow", "forest"):
         swamp_p = _clamp((wet_push - 0.80) * 2.2, 0.0, 1.0)
-        # немного псевдоспектрального смешивания двух шумов, тоже сгладим
-        swamp_blob = _clamp(0.65*blob + 0.35*_blob_noise_temporal(x+7, y-5, slot, now_phase), 0.0, 1.0)
         swamp_p = _fade(swamp_p)
-        if swamp_p > 0 and swamp_blob < swamp_p and t_eff > 0.28:
-            return "swamp"
 
     # --- редкая сухость -> песок ---
     dry_push = (1.0 - m) + (0.20 if key == "heat" else 0.0)
-    if base_tile in ("meadow", "grass") and dry_push > 1.10 and t_eff > 0.66:
-        if blob > 0.88:   # очень редкие «языки» сухости
-            return "sand"
+    dry_ok = base_tile in ("meadow", "grass") and dry_push > 1.10 and t_eff > 0.66
+
+    return snow_p, swamp_p, dry_ok, t_eff
 
+def _skin_pick(base_tile: str, prm: _SkinParams, blob: float, swamp_blob) -> str:
+    """swamp_blob — число или callable без аргументов (считается лениво, только если нужно)."""
+    snow_p, swamp_p, dry_ok, t_eff = prm
+    if snow_p > 0 and blob < snow_p:
+        return _snow_skin(base_tile)
+    if swamp_p is not None:
+        sb = swamp_blob() if callable(swamp_blob) else swamp_blob
+        if swamp_p > 0 and sb < swamp_p and t_eff > 0.28:
+            return "swamp"
+    if dry_ok and blob > 0.88:   # очень редкие «языки» сухости
+        return "sand"
     return base_tile
+
+def evolve_tile_ephemeral(base_tile: str,
+                          x: int, y: int,
+                          climate: Dict[str, float],
+                          weather: Dict[str, object],
+                          now_bucket: float,
+                          now_phase: float = 0.0) -> str:
+    """Возвращает тайл «сейчас». Снег — скин <base>_snow, пятна мигрируют плавно во времени."""
+    if not base_tile or base_tile in _NON_BIOME:
+        return base_tile
+
+    slot = int(now_bucket // bucket_seconds())
+    blob = _blob_noise_temporal(x, y, slot, now_phase)  # связное поле с временной плавностью
+    prm = _skin_params(base_tile, climate, weather)
+
+    # немного псевдоспектрального смешивания двух шумов
+    def swamp_blob():
+        return _clamp(0.65*blob + 0.35*_blob_noise_temporal(x+7, y-5, slot, now_phase), 0.0, 1.0)
+
+    return _skin_pick(base_tile, prm, blob, swamp_blob)
+
+
+# ==================== ПАКЕТНАЯ ВЕРСИЯ (прямоугольник, NumPy) ====================
+# Шум считается один раз на прямоугольник; 4 соседние выборки блюра — сдвиги
+# одной расширенной сетки (w+2)×(h+2). Арифметика повторяет скалярную операция-в-операцию
+# (int64 для хеша: сдвиг арифметический, как у питоньего int), так что результат идентичен.
+
+def _h32_np(x):
+    x = x ^ (x >> 16); x = (x * 0x7feb352d) & 0xffffffff
+    x = x ^ (x >> 15); x = (x * 0x846ca68b) & 0xffffffff
+    x = x ^ (x >> 16); return x
+
+def _value_noise2_np(xs, ys, slot: int, freq: float, salt: int):
+    """xs — 1D целые координаты столбцов, ys — строк; сетка len(ys)×len(xs)."""
+    X = xs.astype(np.float64) * freq; Y = ys.astype(np.float64) * freq
+    fx = np.floor(X); fy = np.floor(Y)
+    xi = fx.astype(np.int64); yi = fy.astype(np.int64)
+    u = _fade(np.clip(X - fx, 0.0, 1.0))[None, :]
+    v = _fade(np.clip(Y - fy, 0.0, 1.0))[:, None]
+    k = (slot*83492791) ^ (salt*374761393)
+    ax0 = (xi*73856093)[None, :];     ax1 = ((xi + 1)*73856093)[None, :]
+    by0 = (yi*19349663)[:, None] ^ k; by1 = ((yi + 1)*19349663)[:, None] ^ k
+    s = float(1 << 24)
+    a = (_h32_np(ax0 ^ by0) & 0xffffff) / s
+    b = (_h32_np(ax1 ^ by0) & 0xffffff) / s
+    c = (_h32_np(ax0 ^ by1) & 0xffffff) / s
+    d = (_h32_np(ax1 ^ by1) & 0xffffff) / s
+    return _lerp(_lerp(a, b, u), _lerp(c, d, u), v)
+
+def _blob_noise_static_np(x0: int, y0: int, w: int, h: int, slot: int):
+    xs = np.arange(x0 - 1, x0 + w + 1, dtype=np.int64)
+    ys = np.arange(y0 - 1, y0 + h + 1, dtype=np.int64)
+    n1e = _value_noise2_np(xs, ys, slot, 0.14, 11)          # расширенная сетка (h+2)×(w+2)
+    n2  = _value_noise2_np(xs[1:-1], ys[1:-1], slot, 0.33, 29)
+    c = (slice(1, h + 1), slice(1, w + 1))
+    n  = 0.72*n1e[c] + 0.28*n2
+    nb = (
+        n +
+        0.18*n1e[1:h+1, 2:w+2] +   # x+1
+        0.18*n1e[1:h+1, 0:w]   +   # x-1
+        0.18*n1e[2:h+2, 1:w+1] +   # y+1
+        0.18*n1e[0:h,   1:w+1]     # y-1
+    ) / (1.0 + 4*0.18)
+    return np.clip(nb, 0.0, 1.0)
+
+def _blob_noise_temporal_np(x0: int, y0: int, w: int, h: int, slot: int, phase: float):
+    s = _clamp(phase, 0.0, 1.0)
+    a = _blob_noise_static_np(x0, y0, w, h, slot)
+    b = _blob_noise_static_np(x0, y0, w, h, slot+1)
+    return _lerp(a, b, _fade(s))
+
+def evolve_tiles_ephemeral(base_grid: List[List[str]],
+                           x0: int, y0: int,
+                           climate_grid: List[List[Dict[str, float]]],
+                           weather_grid: List[List[Dict[str, object]]],
+                           now_bucket: float,
+                           now_phase: float = 0.0) -> List[List[str]]:
+    """
+    Пакетный evolve_tile_ephemeral для прямоугольника: base_grid[j][i] — клетка (x0+i, y0+j),
+    climate_grid/weather_grid той же формы (обычно ссылки на словари своего чанка).
+    Результат совпадает с потайловым вызовом для каждой клетки.
+    """
+    h = len(base_grid)
+    w = len(base_grid[0]) if h else 0
+    if not NUMPY_OK or not w:
+        return [[evolve_tile_ephemeral(base_grid[j][i], x0+i, y0+j, climate_grid[j][i], weather_grid[j][i],
+                                       now_bucket, now_phase) for i in range(w)] for j in range(h)]
+
+    slot = int(now_bucket // bucket_seconds())
+    blob = _blob_noise_temporal_np(x0, y0, w, h, slot, now_phase).tolist()
+    swamp = None  # второе поле (x+7, y-5) — только если в прямоугольнике есть кандидаты в болото
+
+    # параметры один раз на (климат, погода, базовый тайл) — обычно это 1–4 чанка × несколько биомов
+    prm_cache: Dict[tuple, _SkinParams] = {}
+    out: List[List[str]] = []
+    for j in range(h):
+        brow = base_grid[j]; crow = climate_grid[j]; wrow = weather_grid[j]; blrow = blob[j]
+        row = []
+        for i in range(w):
+            base = brow[i]
+            if not base or base in _NON_BIOME:
+                row.append(base); continue
+            cl = crow[i]; we = wrow[i]
+            pk = (id(cl), id(we), base)
+            prm = prm_cache.get(pk)
+            if prm is None:
+                prm = prm_cache[pk] = _skin_params(base, cl, we)
+            bl = blrow[i]
+            if prm[1] is not None and swamp is None and not (prm[0] > 0 and bl < prm[0]):
+                swamp = _blob_noise_temporal_np(x0+7, y0-5, w, h, slot, now_phase).tolist()
+            sb = _clamp(0.65*bl + 0.35*swamp[j][i], 0.0, 1.0) if (prm[1] is not None and swamp is not None) else None
+            row.append(_skin_pick(base, prm, bl, sb))
+        out.append(row)
+    return out
@@ -142,10 +142,7 @@ def evolve_chunk_persistent(row, climate: Dict[str,float], weather: Dict[str,obj
 
     _integrate_ecology(eco, climate or {}, weather or {}, dt or min_interval_sec)
 
-    try:
-        tiles: List[List[str]] = json.loads(row.tiles_json or "[]")
-    except Exception:
-        tiles = []
+    tiles: List[List[str]] = row.tiles_matrix()
 
     size = int(row.size or 32)
     ox = int(row.cx) * size
@@ -176,6 +173,6 @@ def evolve_chunk_persistent(row, climate: Dict[str,float], weather: Dict[str,obj
     }, separators=(",",":"))
 
     if changed:
-        row.tiles_json = json.dumps(tiles, separators=(",",":"))
+        row.set_tiles_matrix(tiles)
 
     return changed
@@ -0,0 +1,148 @@
+# world_chunk_codec.py — компактное бинарное хранение тайлов чанка
+"""
+Формат tiles_blob (вместо 32×32 JSON-матрицы строк, ~8–10 КБ):
+
+    b"PT" | flags:u8 | w:u8 | h:u8 | n:u8 | n × (len:u8, utf8-имя) | body
+
+body — w*h байт uint8 (индексы в палитру, построчно), при flags&1 — сжат zlib.
+Палитра своя у каждого чанка, поэтому новые/экзотические тайлы не требуют миграций.
+"""
+
+from __future__ import annotations
+import os, zlib
+from typing import List, Tuple
+
+try:
+    import numpy as np
+    NUMPY_OK = True
+except Exception:
+    np = None  # type: ignore
+    NUMPY_OK = False
+
+MAGIC = b"PT"
+FLAG_ZLIB = 0x01
+
+
+def tiles_format() -> str:
+    """
+    Что писать в строку чанка (ENV WORLD_TILES_FORMAT):
+      "blob" — только tiles_blob (по умолчанию), "json" — только tiles_json (откат),
+      "both" — оба (на время выкатки, пока где-то живы старые воркеры).
+    Читаются оба формата всегда.
+    """
+    v = (os.getenv("WORLD_TILES_FORMAT", "blob") or "blob").strip().lower()
+    return v if v in ("blob", "json", "both") else "blob"
+
+
+def tiles_compress() -> bool:
+    return os.getenv("WORLD_TILES_ZLIB", "1").strip() != "0"
+
+
+def _palette_body(matrix: List[List[str]]) -> Tuple[List[str], int, int, bytearray]:
+    h = len(matrix)
+    w = len(matrix[0]) if h else 0
+    palette: List[str] = []
+    index = {}
+    body = bytearray(w * h)
+    k = 0
+    for row in matrix:
+        for t in row:
+            c = index.get(t)
+            if c is None:
+                c = index[t] = len(palette)
+                palette.append(t)
+            body[k] = c
+            k += 1
+    if len(palette) > 255 or w > 255 or h > 255:
+        raise ValueError("chunk too large/too many tile kinds for palette codec")
+    return palette, w, h, body
+
+
+def encode_tiles(matrix: List[List[str]], compress: bool = True) -> bytes:
+    palette, w, h, body = _palette_body(matrix)
+
+    flags = 0
+    data = bytes(body)
+    if compress:
+        z = zlib.compress(data, 6)
+        if len(z) < len(data):
+            data = z
+            flags |= FLAG_ZLIB
+
+    out = bytearray(MAGIC)
+    out += bytes((flags, w, h, len(palette)))
+    for name in palette:
+        b = name.encode("utf-8")
+        out.append(len(b))
+        out += b
+    out += data
+    return bytes(out)
+
+
+def _parse(blob: bytes) -> Tuple[List[str], int, int, memoryview]:
+    """Разбор заголовка: (palette, w, h, body) — body без копии, если не сжат."""
+    mv = memoryview(blob)
+    if bytes(mv[:2]) != MAGIC:
+        raise ValueError("bad tiles blob magic")
+    flags, w, h, n = mv[2], mv[3], mv[4], mv[5]
+    off = 6
+    palette: List[str] = []
+    for _ in range(n):
+        ln = mv[off]; off += 1
+        palette.append(bytes(mv[off:off + ln]).decode("utf-8"))
+        off += ln
+    body = mv[off:]
+    if flags & FLAG_ZLIB:
+        body = memoryview(zlib.decompress(body))
+    if len(body) != w * h:
+        raise ValueError("tiles blob body size mismatch")
+    return palette, w, h, body
+
+
+def decode_tiles(blob: bytes) -> List[List[str]]:
+    palette, w, h, body = _parse(blob)
+    pick = palette.__getitem__
+    raw = body.tobytes()
+    return [list(map(pick, raw[j*w:(j+1)*w])) for j in range(h)]
+
+
+def tiles_array(blob: bytes):
+    """
+    (palette, arr) — arr[h][w] индексов палитры.
+    NumPy есть: ndarray uint8 поверх буфера (без копии, если тело не сжато);
+    иначе — двумерный memoryview.
+    """
+    palette, w, h, body = _parse(blob)
+    if NUMPY_OK:
+        return palette, np.frombuffer(body, dtype=np.uint8).reshape(h, w)
+    return palette, body.cast("B", (h, w))
+
+
+# ---- wire-формат (ответы API, не хранение) ----
+def _rle(body: bytes) -> bytes:
+    """Пары (длина серии 1..255, индекс)."""
+    out = bytearray()
+    n = len(body)
+    i = 0
+    while i < n:
+        v = body[i]
+        j = i + 1
+        while j < n and body[j] == v and j - i < 255:
+            j += 1
+        out.append(j - i)
+        out.append(v)
+        i = j
+    return bytes(out)
+
+
+def pack_grid(matrix: List[List[str]], rle: bool = True) -> Tuple[List[str], bytes, str]:
+    """
+    (palette, data, enc): enc="u8" — w*h индексов построчно, "rle" — пары (count, idx),
+    если так короче. ValueError — если сетка не влезает в uint8-палитру.
+    """
+    palette, w, h, body = _palette_body(matrix)
+    if rle:
+        r = _rle(body)
+        if len(r) < len(body):
+            return palette, r, "rle"
+    return palette, bytes(body), "u8"
@@ -2,6 +2,7 @@ import json, time, math
 from typing import Dict, List, Tuple, Any
 from models import db
 from world_models import WorldChunk, WorldBuilding
+import world_overlay_index as overlay_index
 from world_weather import pick_weather_for_chunk
 
 CHUNK_SIZE = 32
@@ -33,10 +34,10 @@ def _h2u(x: int, y: int) -> float:
     return (h / 4294967295.0)
 
 def _load_tiles(row: WorldChunk) -> List[List[str]]:
-    return json.loads(row.tiles_json or "[]")
+    return row.tiles_matrix()
 
 def _save_tiles(row: WorldChunk, tiles: List[List[str]]) -> None:
-    row.tiles_json = json.dumps(tiles, separators=(",", ":"))
+    row.set_tiles_matrix(tiles)
 
 def _load_climate(row: WorldChunk) -> Dict[str, Any]:
     try:
@@ -54,10 +55,13 @@ def _chunk_bounds(cx: int, cy: int) -> Tuple[int,int,int,int]:
 def _urbanization_in_chunk(cx: int, cy: int) -> float:
     x0, y0, x1, y1 = _chunk_bounds(cx, cy)
     area = CHUNK_SIZE * CHUNK_SIZE
-    cnt = WorldBuilding.query.filter(
-        WorldBuilding.x >= x0, WorldBuilding.x <= x1,
-        WorldBuilding.y >= y0, WorldBuilding.y <= y1
-    ).count()
+    if overlay_index.ENABLED:
+        cnt = overlay_index.count_buildings(x0, y0, x1, y1)
+    else:
+        cnt = WorldBuilding.query.filter(
+            WorldBuilding.x >= x0, WorldBuilding.x <= x1,
+            WorldBuilding.y >= y0, WorldBuilding.y <= y1
+        ).count()
     return _clamp(cnt / max(1, area), 0.0, 1.0)
 
 def _ensure_base_tiles(cdict: Dict[str, Any], tiles: List[List[str]]) -> None:
@@ -1,8 +1,20 @@
 # world_gen.py
-import math, hashlib
+import math, hashlib, os, threading
+from collections import OrderedDict
 from typing import List, Tuple, Dict
 from world_tiles import *
 
+# NumPy — опционально: без него работает только скалярный (эталонный) генератор
+try:
+    import numpy as np
+    NUMPY_OK = True
+except Exception:
+    np = None  # type: ignore
+    NUMPY_OK = False
+
+# Выбор генератора чанков: "numpy" (векторный, по умолчанию) | "python" (эталонный скалярный)
+GEN_BACKEND = (os.getenv("WORLD_GEN_BACKEND", "numpy").strip().lower() or "numpy")
+
 # Глобальный сид — единый мир для всех
 GLOBAL_SEED = int(hashlib.sha256(b"PocketKingdom:GLOBAL_WORLD_V2").hexdigest()[:12], 16) & 0x7fffffff
 
@@ -73,7 +85,8 @@ def pick_tile(x: int, y: int) -> str:
     e = _env(x,y)
     return _pick_tile_by_env(e["h"], e["m"], e["t"])
 
-def generate_chunk(cx: int, cy: int, size: int=32) -> Tuple[List[List[str]], Dict[str,float]]:
+def generate_chunk_scalar(cx: int, cy: int, size: int=32) -> Tuple[List[List[str]], Dict[str,float]]:
+    """Эталонный генератор: потайловый _env() на чистом Python."""
     tiles=[]; count=0
     hsum=0.0; msum=0.0; tsum=0.0; forests=0
     ox, oy = cx*size, cy*size
@@ -93,3 +106,140 @@ def generate_chunk(cx: int, cy: int, size: int=32) -> Tuple[List[List[str]], Dic
         "forest_density": forests/max(1,count)
     }
     return tiles, climate
+
+
+# ==================== ВЕКТОРНЫЙ ГЕНЕРАТОР (NumPy) ====================
+# Повторяет скалярную арифметику операция-в-операцию (float64, тот же порядок),
+# поэтому тайлы и климат совпадают с generate_chunk_scalar бит-в-бит.
+# _hash2 сепарабелен: h32(xi+..) ^ h32(yi+..) — хешируем строки и столбцы решётки
+# отдельно (1D), а XOR делаем уже на сетке.
+
+_TILE_CODES = [T_WATER, T_SAND, T_DESERT, T_SWAMP, T_FOREST, T_MEADOW, T_GRASS, T_SNOW, T_ROCK]
+
+def _h32_np(x):
+    # int64: сдвиг арифметический (как у питоньего int), переполнение умножения
+    # не важно — нужны только младшие 32 бита
+    x = x ^ (x >> 16); x = (x * 0x45d9f3b) & 0xFFFFFFFF
+    x = x ^ (x >> 16); x = (x * 0x45d9f3b) & 0xFFFFFFFF
+    x = x ^ (x >> 16); return x
+
+def _noise2_np(X, Y, seed: int):
+    """X — 1D по столбцам, Y — 1D по строкам. Возвращает сетку len(Y)×len(X)."""
+    fx = np.floor(X); fy = np.floor(Y)
+    xi = fx.astype(np.int64); yi = fy.astype(np.int64)
+    xf = X - fx; yf = Y - fy
+    hx0 = _h32_np(xi + seed*7349);     hx1 = _h32_np(xi + 1 + seed*7349)
+    hy0 = _h32_np(yi + seed*9151);     hy1 = _h32_np(yi + 1 + seed*9151)
+    hx0 = hx0[None, :]; hx1 = hx1[None, :]
+    hy0 = hy0[:, None]; hy1 = hy1[:, None]
+    n00 = ((hx0 ^ hy0) & 0xFFFFFFFF) / 0xFFFFFFFF
+    n10 = ((hx1 ^ hy0) & 0xFFFFFFFF) / 0xFFFFFFFF
+    n01 = ((hx0 ^ hy1) & 0xFFFFFFFF) / 0xFFFFFFFF
+    n11 = ((hx1 ^ hy1) & 0xFFFFFFFF) / 0xFFFFFFFF
+    u = (xf*xf*(3-2*xf))[None, :]; v = (yf*yf*(3-2*yf))[:, None]
+    return _mix(_mix(n00,n10,u), _mix(n01,n11,u), v)
+
+def _fbm_np(X, Y, seed: int, octaves: int=4, lacun: float=2.0, gain: float=0.5):
+    amp=1.0; freq=1.0; s=0.0; norm=0.0
+    for _ in range(octaves):
+        s = s + amp * _noise2_np(X*freq, Y*freq, seed)
+        norm += amp
+        amp *= gain; freq *= lacun
+    return s/norm if norm>0 else np.zeros((len(Y), len(X)))
+
+def _env_np(x0: int, y0: int, w: int, h: int):
+    """Поля (h, m, t) для прямоугольника w×h с левым верхним углом (x0,y0)."""
+    s = GLOBAL_SEED
+    xs = np.arange(x0, x0 + w, dtype=np.float64)
+    ys = np.arange(y0, y0 + h, dtype=np.float64)
+    H = _fbm_np(xs/22.0, ys/22.0, s+11,  octaves=5)
+    M = _fbm_np(xs/31.0, ys/31.0, s+73,  octaves=4)
+    T = _fbm_np(xs/27.0, ys/27.0, s+149, octaves=4)
+    return H, M, T
+
+def _pick_tile_codes_np(h, m, t):
+    """_pick_tile_by_env в виде масок: np.select берёт первое истинное условие — как цепочка if."""
+    mid = (h >= 0.44) & (h < 0.76)
+    conds = [
+        h < 0.34,
+        h < 0.38,
+        (m < 0.25) & (h >= 0.38) & (h < 0.70) & (t > 0.55),
+        (m > 0.70) & (h < 0.60),
+        mid & (m > 0.60),
+        mid & (m > 0.45),
+        mid,
+        h > 0.88,
+        h >= 0.76,
+    ]
+    return np.select(conds, np.arange(len(_TILE_CODES)), default=_TILE_CODES.index(T_GRASS)).astype(np.uint8)
+
+def _seq_sum(a) -> float:
+    # последовательная сумма, как hsum += ... в скалярной версии (np.sum — попарная, округляет иначе)
+    acc = 0.0
+    for v in a.ravel().tolist():
+        acc += v
+    return acc
+
+def _chunk_from_fields(H, M, T, codes, size: int) -> Tuple[List[List[str]], Dict[str,float]]:
+    count = size*size
+    names = _TILE_CODES
+    tiles = [[names[c] for c in row] for row in codes.tolist()]
+    forests = int(np.count_nonzero(codes == _TILE_CODES.index(T_FOREST)))
+    climate = {
+        "height_mean": _seq_sum(H)/max(1,count),
+        "moist": _seq_sum(M)/max(1,count),
+        "temp": _seq_sum(T)/max(1,count),
+        "forest_density": forests/max(1,count)
+    }
+    return tiles, climate
+
+def generate_region(cx0: int, cy0: int, cx1: int, cy1: int, size: int=32) -> Dict[Tuple[int,int], Tuple[List[List[str]], Dict[str,float]]]:
+    """
+    Векторная генерация прямоугольника чанков [cx0..cx1]×[cy0..cy1] (включительно) одним проходом.
+    Результат: {(cx,cy): (tiles, climate)} — то же, что generate_chunk_scalar для каждого чанка.
+    """
+    if not NUMPY_OK:
+        return {(cx, cy): generate_chunk_scalar(cx, cy, size)
+                for cy in range(cy0, cy1+1) for cx in range(cx0, cx1+1)}
+    nw, nh = cx1 - cx0 + 1, cy1 - cy0 + 1
+    H, M, T = _env_np(cx0*size, cy0*size, nw*size, nh*size)
+    codes = _pick_tile_codes_np(H, M, T)
+    out = {}
+    for j in range(nh):
+        for i in range(nw):
+            sl = (slice(j*size, (j+1)*size), slice(i*size, (i+1)*size))
+            out[(cx0+i, cy0+j)] = _chunk_from_fields(H[sl], M[sl], T[sl], codes[sl], size)
+    return out
+
+def generate_chunk_np(cx: int, cy: int, size: int=32) -> Tuple[List[List[str]], Dict[str,float]]:
+    return generate_region(cx, cy, cx, cy, size)[(cx, cy)]
+
+def generate_chunk(cx: int, cy: int, size: int=32) -> Tuple[List[List[str]], Dict[str,float]]:
+    """Генерация чанка: векторная, если доступен NumPy и не выбран WORLD_GEN_BACKEND=python."""
+    if NUMPY_OK and GEN_BACKEND != "python":
+        return generate_chunk_np(cx, cy, size)
+    return generate_chunk_scalar(cx, cy, size)
+
+
+# ==================== BASELINE-КЕШ (нетронутый рельеф из сида) ====================
+# Чанк полностью детерминирован GLOBAL_SEED, поэтому «чистые» тайлы/климат не обязательно
+# хранить в БД — держим небольшой LRU сгенерированных эталонов на процесс.
+# ВНИМАНИЕ: возвращаются общие объекты — перед изменением копировать.
+
+_BASELINE_CACHE: "OrderedDict[Tuple[int,int,int], Tuple[List[List[str]], Dict[str,float]]]" = OrderedDict()
+_BASELINE_CACHE_MAX = int(os.getenv("WORLD_BASELINE_CACHE", "512") or 512)
+_BASELINE_LOCK = threading.Lock()  # читают и вытесняют потоки запросов и пул планировщика
+
+def baseline_chunk(cx: int, cy: int, size: int=32) -> Tuple[List[List[str]], Dict[str,float]]:
+    key = (int(cx), int(cy), int(size))
+    with _BASELINE_LOCK:
+        v = _BASELINE_CACHE.get(key)
+        if v is not None:
+            _BASELINE_CACHE.move_to_end(key)
+            return v
+    v = generate_chunk(key[0], key[1], key[2])
+    with _BASELINE_LOCK:
+        _BASELINE_CACHE[key] = v
+        while len(_BASELINE_CACHE) > _BASELINE_CACHE_MAX:
+            _BASELINE_CACHE.popitem(last=False)
+    return v
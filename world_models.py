@@ -1,7 +1,10 @@
 # world_models.py
-import json
+import json, os, time, threading
+from typing import Dict, List, Optional
 from models import db
 from sqlalchemy import UniqueConstraint
+from world_chunk_codec import encode_tiles, decode_tiles, tiles_array as _codec_tiles_array, tiles_format, tiles_compress
+from world_gen import baseline_chunk
 
 class WorldState(db.Model):
     __tablename__ = "world_state"
@@ -13,7 +16,15 @@ class WorldState(db.Model):
 
     dest_x = db.Column(db.Integer)
     dest_y = db.Column(db.Integer)
-    path_json = db.Column(db.Text, nullable=False, default="[]")
+    path_json = db.Column(db.Text, nullable=False, default="[]")  # старый формат: [[x,y],...] (читается всегда)
+
+    # Компактный путь: направления RLE ("3RD2R") от старта (path_sx, path_sy) + курсор пройденных шагов.
+    # Продвижение героя — это path_cur += k, а не переписывание списка точек.
+    path_rle = db.Column(db.Text, nullable=True)
+    path_sx = db.Column(db.Integer, nullable=True)
+    path_sy = db.Column(db.Integer, nullable=True)
+    path_len = db.Column(db.Integer, nullable=False, default=0)
+    path_cur = db.Column(db.Integer, nullable=False, default=0)
 
     last_update = db.Column(db.Float, nullable=False)
 
@@ -24,6 +35,71 @@ class WorldState(db.Model):
     fatigue = db.Column(db.Float, nullable=False, default=15.0)  # 0..100 (чем выше — тем сильнее усталость)
     resting = db.Column(db.Boolean, nullable=False, default=False)  # герой отдыхает/спит на месте
 
+    # Путь: читаем оба формата, пишем RLE (если путь из единичных шагов и не WORLD_PATH_FORMAT=json)
+    def path_points(self) -> List[List[int]]:
+        """Оставшиеся клетки пути [[x,y],...]."""
+        if self.path_rle is None:
+            try:
+                return json.loads(self.path_json or "[]")
+            except Exception:
+                return []
+        return decode_path(self.path_sx, self.path_sy, self.path_rle)[int(self.path_cur or 0):]
+
+    def path_left(self) -> int:
+        if self.path_rle is None:
+            return len(self.path_points())
+        return max(0, int(self.path_len or 0) - int(self.path_cur or 0))
+
+    def path_next(self) -> Optional[List[int]]:
+        """Следующая клетка пути (без декодирования всего маршрута)."""
+        if self.path_rle is None:
+            pts = self.path_points()
+            return pts[0] if pts else None
+        if self.path_left() <= 0:
+            return None
+        return path_point(self.path_sx, self.path_sy, self.path_rle, int(self.path_cur or 0) + 1)
+
+    def path_sig(self) -> tuple:
+        """Идентичность маршрута (не меняется при продвижении по нему)."""
+        if self.path_rle is None:
+            return ("json", self.path_json or "[]")
+        return (self.path_sx, self.path_sy, self.path_rle)
+
+    @classmethod
+    def path_sig_filter(cls, sig: tuple) -> tuple:
+        """Условия WHERE «маршрут строки всё ещё sig» — для записей поверх чужих коммитов."""
+        if sig[0] == "json":
+            return (cls.path_rle.is_(None), cls.path_json == sig[1])
+        return (cls.path_sx == sig[0], cls.path_sy == sig[1], cls.path_rle == sig[2])
+
+    def set_path(self, points, sx: int, sy: int):
+        self.clear_path()
+        if not points:
+            return
+        rle = encode_path(points, sx, sy) if path_format() == "rle" else None
+        if rle is None:
+            self.path_json = json.dumps([[int(x), int(y)] for x, y in points], separators=(",", ":"))
+            return
+        self.path_rle, self.path_sx, self.path_sy, self.path_len = rle, int(sx), int(sy), len(points)
+
+    def advance_path(self, steps: int):
+        if steps <= 0:
+            return
+        if self.path_rle is None:
+            rest = self.path_points()[steps:]
+            self.path_json = json.dumps(rest, separators=(",", ":"))
+        else:
+            self.path_cur = int(self.path_cur or 0) + steps
+            if self.path_cur >= int(self.path_len or 0):
+                self.clear_path()
+
+    def clear_path(self):
+        self.path_json = "[]"
+        self.path_rle = None
+        self.path_sx = self.path_sy = None
+        self.path_len = 0
+        self.path_cur = 0
+
 
 class WorldChunk(db.Model):
     __tablename__ = "world_chunks"
@@ -33,7 +109,9 @@ class WorldChunk(db.Model):
     size = db.Column(db.Integer, nullable=False, default=32)
 
     # Основные данные
-    tiles_json   = db.Column(db.Text, nullable=False)   # [["grass",...], ...]
+    # Пустые tiles_json/tiles_blob или climate_json = «нетронуто»: берём эталон из сида (world_gen.baseline_chunk)
+    tiles_json   = db.Column(db.Text, nullable=False)   # [["grass",...], ...] — старый формат ("" если пишем только blob)
+    tiles_blob   = db.Column(db.LargeBinary, nullable=True)  # палитра + uint8[h*w] (см. world_chunk_codec)
     climate_json = db.Column(db.Text, nullable=False)   # {"height_mean":..,"moist":..,"temp":..,"forest_density":..}
     created_at   = db.Column(db.Float, nullable=False)
 
@@ -43,21 +121,45 @@ class WorldChunk(db.Model):
 
     __table_args__ = (UniqueConstraint('cx','cy', name='uq_world_chunks_cx_cy'),)
 
-    # Удобные хелперы (не обязательны к использованию, но удобно)
-    def tiles_matrix(self):
+    # Кодек тайлов: читаем оба формата (blob приоритетнее), пишем по WORLD_TILES_FORMAT
+    def stored_tiles(self):
+        """Тайлы, реально лежащие в строке ([] — чанк нетронут)."""
+        if self.tiles_blob:
+            try:
+                return decode_tiles(self.tiles_blob)
+            except Exception:
+                pass
         try:
-            return json.loads(self.tiles_json)
+            return json.loads(self.tiles_json or "[]")
         except Exception:
             return []
 
+    def tiles_matrix(self):
+        tiles = self.stored_tiles()
+        if tiles:
+            return tiles
+        base, _ = baseline_chunk(self.cx, self.cy, int(self.size or 32))
+        return [list(r) for r in base]
+
     def set_tiles_matrix(self, matrix):
-        self.tiles_json = json.dumps(matrix, separators=(",",":"))
+        for k, v in tiles_columns(matrix).items():
+            setattr(self, k, v)
+
+    def tiles_array(self):
+        """(palette, uint8[h][w]) — без JSON и без копии для несжатого blob."""
+        blob = self.tiles_blob
+        if not blob:
+            blob = encode_tiles(self.tiles_matrix(), compress=False)
+        return _codec_tiles_array(blob)
 
     def climate_dict(self):
-        try:
-            return json.loads(self.climate_json)
-        except Exception:
-            return {}
+        if self.climate_json:
+            try:
+                return json.loads(self.climate_json)
+            except Exception:
+                return {}
+        _, clim = baseline_chunk(self.cx, self.cy, int(self.size or 32))
+        return dict(clim)
 
 
 class WorldBuilding(db.Model):
@@ -87,5 +189,253 @@ class WorldOverride(db.Model):
     __table_args__ = (UniqueConstraint('x','y', name='uq_world_overrides_xy'),)
 
 
+class WorldCounter(db.Model):
+    """
+    Счётчики изменений (напр. "overlay" — постройки/оверрайды): по ним воркеры узнают,
+    что их in-memory индексы устарели.
+    """
+    __tablename__ = "world_counters"
+    name = db.Column(db.String(32), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+# ==================== Кодек пути ====================
+
+_DIRS = {(1, 0): "R", (-1, 0): "L", (0, 1): "D", (0, -1): "U"}
+_DIR_VEC = {v: k for k, v in _DIRS.items()}
+
+
+def path_format() -> str:
+    """ENV WORLD_PATH_FORMAT: "rle" (по умолчанию) или "json" (откат). Читаются оба всегда."""
+    v = (os.getenv("WORLD_PATH_FORMAT", "rle") or "rle").strip().lower()
+    return v if v in ("rle", "json") else "rle"
+
+
+def encode_path(points, sx: int, sy: int) -> Optional[str]:
+    """Клетки пути -> RLE направлений ("3RD2R"); None — если есть не единичный шаг."""
+    out = []
+    px, py = int(sx), int(sy)
+    prev, n = None, 0
+    for x, y in points:
+        d = _DIRS.get((int(x) - px, int(y) - py))
+        if d is None:
+            return None
+        if d == prev:
+            n += 1
+        else:
+            if prev is not None:
+                out.append((str(n) if n > 1 else "") + prev)
+            prev, n = d, 1
+        px, py = int(x), int(y)
+    if prev is not None:
+        out.append((str(n) if n > 1 else "") + prev)
+    return "".join(out)
+
+
+def _path_runs(rle: str):
+    n = 0
+    for ch in rle:
+        if ch.isdigit():
+            n = n * 10 + (ord(ch) - 48)
+        else:
+            yield (n or 1), _DIR_VEC[ch]
+            n = 0
+
+
+def decode_path(sx: int, sy: int, rle: str) -> List[List[int]]:
+    x, y = int(sx), int(sy)
+    out = []
+    for n, (dx, dy) in _path_runs(rle or ""):
+        for _ in range(n):
+            x += dx; y += dy
+            out.append([x, y])
+    return out
+
+
+def path_point(sx: int, sy: int, rle: str, k: int) -> List[int]:
+    """Клетка после k шагов от старта — по сериям, без развёртки пути."""
+    x, y = int(sx), int(sy)
+    for n, (dx, dy) in _path_runs(rle or ""):
+        t = min(n, k)
+        x += dx * t; y += dy * t
+        k -= t
+        if k <= 0:
+            break
+    return [x, y]
+
+
+def tiles_columns(matrix: List[List[str]]) -> Dict[str, object]:
+    """Значения колонок tiles_json/tiles_blob для матрицы — общий путь для ORM и bulk INSERT."""
+    fmt = tiles_format()
+    return {
+        "tiles_blob": encode_tiles(matrix, compress=tiles_compress()) if fmt in ("blob", "both") else None,
+        "tiles_json": json.dumps(matrix, separators=(",",":")) if fmt in ("json", "both") else "",
+    }
+
+
+# ---- пакетная вставка чанков (world_pregen, очередь чанков, прочитанных без записи) ----
+def _chunk_insert_stmt():
+    """INSERT с пропуском конфликтов по (cx,cy) для текущего диалекта."""
+    table = WorldChunk.__table__
+    name = db.engine.dialect.name
+    if name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert(table).on_conflict_do_nothing(index_elements=["cx", "cy"])
+    if name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(table).on_conflict_do_nothing(index_elements=["cx", "cy"])
+    if name in ("mysql", "mariadb"):
+        return table.insert().prefix_with("IGNORE")
+    return table.insert()
+
+
+def insert_chunk_rows(rows: List[dict]) -> int:
+    """Вставляет строки WorldChunk одной транзакцией; конфликт (cx,cy) — пропуск. Возвращает число вставленных."""
+    if not rows:
+        return 0
+    with db.engine.begin() as conn:
+        res = conn.execute(_chunk_insert_stmt(), rows)
+    n = res.rowcount
+    return n if n is not None and n >= 0 else len(rows)  # драйвер не знает — считаем все
+
+
+_SCHEMA_OK = False
+_SCHEMA_LOCK = threading.Lock()
+
 def ensure_world_models():
-    db.create_all()
+    global _SCHEMA_OK
+    if _SCHEMA_OK:  # create_all на каждый вызов — это 4 PRAGMA на каждый поллинг
+        return
+    with _SCHEMA_LOCK:  # поток миграции и запросы стартуют одновременно — ALTER только один раз
+        if _SCHEMA_OK:
+            return
+        db.create_all()
+        _migrate_sqlite_columns()
+        _SCHEMA_OK = True  # только после ALTER: до этого новых колонок ещё может не быть
+
+
+def _migrate_sqlite_columns():
+    # мягкая миграция для уже существующей SQLite-БД (как в accounts.models)
+    eng = db.engine
+    if eng.dialect.name != "sqlite":
+        return
+    with eng.begin() as conn:
+        cols = [r[1] for r in conn.exec_driver_sql('PRAGMA table_info("world_chunks")').fetchall()]
+        if "tiles_blob" not in cols:
+            conn.exec_driver_sql('ALTER TABLE world_chunks ADD COLUMN tiles_blob BLOB')
+        cols = [r[1] for r in conn.exec_driver_sql('PRAGMA table_info("world_state")').fetchall()]
+        for name, ddl in (("path_rle", "TEXT"), ("path_sx", "INTEGER"), ("path_sy", "INTEGER"),
+                          ("path_len", "INTEGER NOT NULL DEFAULT 0"), ("path_cur", "INTEGER NOT NULL DEFAULT 0")):
+            if name not in cols:
+                conn.exec_driver_sql(f'ALTER TABLE world_state ADD COLUMN {name} {ddl}')
+
+
+# ==================== Фоновая миграция tiles_json -> tiles_blob ====================
+
+def migrate_tiles_batch(limit: int = 200) -> int:
+    """Перекодирует до limit чанков с тайлами только в JSON. Возвращает число обработанных строк."""
+    rows = WorldChunk.query.filter(WorldChunk.tiles_blob.is_(None), WorldChunk.tiles_json != "").limit(limit).all()
+    done = 0
+    for row in rows:
+        try:
+            tiles = json.loads(row.tiles_json or "[]")
+        except Exception:
+            tiles = []
+        row.set_tiles_matrix(tiles)
+        done += 1
+    if done:
+        db.session.commit()
+    return done
+
+
+def migrate_paths_batch(limit: int = 200) -> int:
+    """Переводит до limit путей героев из path_json в RLE+курсор. Возвращает число обработанных строк."""
+    rows = WorldState.query.filter(WorldState.path_rle.is_(None), WorldState.path_json != "[]").limit(limit).all()
+    done = 0
+    for row in rows:
+        pts = row.path_points()
+        row.set_path(pts, row.pos_x, row.pos_y)
+        if row.path_rle is None and pts:
+            row.path_json = "[]"  # не единичные шаги (битый путь) — сбрасываем, герой просто остановится
+            row.dest_x = row.dest_y = None
+        done += 1
+    if done:
+        db.session.commit()
+    return done
+
+
+_MIGR_STARTED = False
+
+def start_tiles_migration(app, batch: int = 200, pause: float = 0.5) -> Optional[threading.Thread]:
+    """
+    Фоновый поток: пачками конвертирует старые строки, пока они есть (паузы — чтобы не душить SQLite):
+    тайлы чанков tiles_json -> tiles_blob и пути героев path_json -> RLE.
+    """
+    global _MIGR_STARTED
+    tiles_on = tiles_format() != "json"
+    paths_on = path_format() == "rle"
+    if _MIGR_STARTED or not (tiles_on or paths_on):
+        return None
+    _MIGR_STARTED = True
+
+    def _loop():
+        total = paths = 0
+        while True:
+            try:
+                with app.app_context():
+                    ensure_world_models()
+                    n = migrate_tiles_batch(batch) if tiles_on else 0
+                    p = migrate_paths_batch(batch) if paths_on else 0
+            except Exception as e:
+                print(f"[WorldTiles] migration error: {e}")
+                return
+            if not n and not p:
+                break
+            total += n
+            paths += p
+            time.sleep(pause)
+        if total:
+            print(f"[WorldTiles] migrated {total} chunks to tiles_blob")
+        if paths:
+            print(f"[WorldState] migrated {paths} paths to RLE")
+
+    th = threading.Thread(target=_loop, name="world-tiles-migration", daemon=True)
+    th.start()
+    return th
+
+
+# ==================== Архивация нетронутых чанков ====================
+
+def archive_pristine_chunks(limit: int = 500, after_id: int = 0) -> Dict[str, int]:
+    """
+    Проход по строкам с id > after_id (до limit штук), тайлы которых совпадают с эталоном из сида:
+      - климат не правили и экологии нет (eco_json пуст) — строку удаляем;
+      - иначе очищаем только тайлы: eco_json/last_evolve_ts (и правленый климат) остаются дельтой.
+    Возвращает {"scanned", "deleted", "stripped", "last_id"}; last_id — курсор для следующего вызова.
+    """
+    rows = WorldChunk.query.filter(WorldChunk.id > after_id).order_by(WorldChunk.id).limit(limit).all()
+    deleted = stripped = 0
+    last_id = after_id
+    for row in rows:
+        last_id = row.id
+        tiles = row.stored_tiles()
+        size = int(row.size or 32)
+        base_tiles, base_clim = baseline_chunk(row.cx, row.cy, size)
+        if tiles and tiles != base_tiles:
+            continue
+        clim_pristine = True
+        if row.climate_json:
+            try:
+                clim_pristine = json.loads(row.climate_json) == base_clim
+            except Exception:
+                clim_pristine = False
+        if clim_pristine and not row.eco_json:
+            db.session.delete(row)
+            deleted += 1
+        elif tiles:
+            row.tiles_blob = None
+            row.tiles_json = ""
+            stripped += 1
+    if deleted or stripped:
+        db.session.commit()
+    return {"scanned": len(rows), "deleted": deleted, "stripped": stripped, "last_id": last_id}
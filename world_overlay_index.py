@@ -0,0 +1,311 @@
+# world_overlay_index.py — in-memory пространственный индекс построек и оверрайдов
+"""
+Постройки и оверрайды — маленькие и редко пишущиеся таблицы, а читаются диапазонами
+по x/y много раз за запрос. Держим их в памяти процесса, разложенными по чанкам:
+
+    _BUCKETS[(cx, cy)] = ({(x, y): Bld}, {(x, y): Ovr})
+
+- загрузка целиком — при первом обращении (или load() на старте);
+- пути записи после commit зовут touch(x, y): клетка перечитывается, счётчик
+  WorldCounter("overlay") в БД растёт на 1;
+- остальные воркеры не чаще раза в WORLD_OVERLAY_INDEX_CHECK сек сверяют счётчик
+  и при расхождении перезагружают индекс; подписчики on_reload() получают множество
+  чанков, чьё содержимое изменилось (так services_world сбрасывает свои кеши по версиям).
+
+Плотность построек (урбанизация) — через интегральные изображения (summed-area table)
+по чанку: _SAT[(cx, cy)][j][i] = число построек в [0..i) × [0..j) чанка; count_buildings
+для любого прямоугольника — O(1) на каждый задетый чанк, touch правит таблицу инкрементом.
+
+Потоки (пул планировщика, сброс состояния, threaded-воркеры) читают без блокировки, поэтому
+всё опубликованное неизменяемо: load() собирает новый словарь и подменяет ссылку целиком,
+touch() копирует корзину чанка (и верхний словарь) и тоже подменяет ссылку. Читатель один раз
+берёт _BUCKETS и работает с согласованным снимком. SAT привязан к объекту корзины, из которой
+собран: корзину заменили — таблица считается устаревшей.
+
+WORLD_OVERLAY_INDEX=0 — выключить (services_world ходит в БД как раньше).
+Всё возвращаемое — кортежи только для чтения (не ORM-объекты).
+"""
+
+from __future__ import annotations
+import os, time, threading
+from collections import namedtuple
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db
+from world_models import WorldBuilding, WorldOverride, WorldCounter
+
+try:
+    import numpy as np
+    NUMPY_OK = True
+except Exception:
+    np = None  # type: ignore
+    NUMPY_OK = False
+
+CHUNK_SIZE = 32
+ENABLED = os.getenv("WORLD_OVERLAY_INDEX", "1").strip() != "0"
+CHECK_SEC = float(os.getenv("WORLD_OVERLAY_INDEX_CHECK", "1.0") or 1.0)
+COUNTER = "overlay"
+
+Bld = namedtuple("Bld", "id x y kind owner_id data_json")
+Ovr = namedtuple("Ovr", "x y tile_id")
+
+_BUCKETS: Dict[Tuple[int, int], Tuple[Dict[Tuple[int, int], Bld], Dict[Tuple[int, int], Ovr]]] = {}
+_SAT: Dict[Tuple[int, int], tuple] = {}    # (cx,cy) -> (корзина, (CHUNK_SIZE+1)² префиксных сумм — ndarray или списки)
+_VER: Optional[int] = None     # значение счётчика, которому соответствует индекс; None — не загружен
+_CHECKED = 0.0
+_LOCK = threading.RLock()
+_ON_RELOAD: List[Callable[[Set[Tuple[int, int]]], None]] = []
+STATS = {"loads": 0, "touches": 0, "checks": 0}
+
+
+def _bucket(x: int, y: int):
+    return _BUCKETS.get((x // CHUNK_SIZE, y // CHUNK_SIZE))
+
+
+def _read_counter() -> int:
+    return int(db.session.query(WorldCounter.value).filter_by(name=COUNTER).scalar() or 0)
+
+
+def on_reload(fn: Callable[[Set[Tuple[int, int]]], None]):
+    """fn(chunks) зовётся после перезагрузки с множеством изменившихся чанков (не на первой загрузке)."""
+    if fn not in _ON_RELOAD:
+        _ON_RELOAD.append(fn)
+
+
+def load():
+    """Полная (пере)загрузка индекса из БД."""
+    global _VER, _CHECKED
+    with _LOCK:
+        first = _VER is None
+        old = _BUCKETS
+        ver = _read_counter()
+        buckets: Dict = {}
+        q = db.session.query(
+            WorldBuilding.id, WorldBuilding.x, WorldBuilding.y,
+            WorldBuilding.kind, WorldBuilding.owner_id, WorldBuilding.data_json
+        ).order_by(WorldBuilding.id)
+        for r in q.all():
+            k = (r[1] // CHUNK_SIZE, r[2] // CHUNK_SIZE)
+            buckets.setdefault(k, ({}, {}))[0][(r[1], r[2])] = Bld(*r)
+        q = db.session.query(WorldOverride.x, WorldOverride.y, WorldOverride.tile_id)
+        for r in q.all():
+            k = (r[0] // CHUNK_SIZE, r[1] // CHUNK_SIZE)
+            buckets.setdefault(k, ({}, {}))[1][(r[0], r[1])] = Ovr(*r)
+        _publish(buckets, {})
+        _VER = ver
+        _CHECKED = time.time()
+        STATS["loads"] += 1
+        if first or not _ON_RELOAD:
+            return
+        changed = {k for k in set(old) | set(buckets) if old.get(k, ({}, {})) != buckets.get(k, ({}, {}))}
+        if changed:
+            for fn in _ON_RELOAD:
+                fn(changed)
+
+
+def _publish(buckets: Dict, sat: Dict):
+    """Подмена ссылок — читатели видят либо старый индекс, либо новый, но не полупустой."""
+    global _BUCKETS, _SAT
+    _SAT = sat
+    _BUCKETS = buckets
+
+
+def ensure_fresh():
+    global _CHECKED
+    if _VER is None:
+        load()
+        return
+    now = time.time()
+    if now - _CHECKED < CHECK_SEC:
+        return
+    _CHECKED = now
+    STATS["checks"] += 1
+    if _read_counter() != _VER:
+        load()
+
+
+def _bump_counter() -> int:
+    n = WorldCounter.query.filter_by(name=COUNTER).update({WorldCounter.value: WorldCounter.value + 1})
+    if not n:
+        db.session.add(WorldCounter(name=COUNTER, value=1))
+    try:
+        db.session.commit()
+    except IntegrityError:  # параллельный воркер успел создать строку
+        db.session.rollback()
+        WorldCounter.query.filter_by(name=COUNTER).update({WorldCounter.value: WorldCounter.value + 1})
+        db.session.commit()
+    return _read_counter()
+
+
+def touch(x: int, y: int):
+    """Вызывать ПОСЛЕ commit записи постройки/оверрайда в клетке (x, y)."""
+    global _VER
+    if not ENABLED:
+        return
+    with _LOCK:
+        prev = _VER
+        ver = _bump_counter()
+        STATS["touches"] += 1
+        if prev is None:
+            return
+        b = db.session.query(
+            WorldBuilding.id, WorldBuilding.x, WorldBuilding.y,
+            WorldBuilding.kind, WorldBuilding.owner_id, WorldBuilding.data_json
+        ).filter_by(x=x, y=y).first()
+        o = db.session.query(WorldOverride.x, WorldOverride.y, WorldOverride.tile_id).filter_by(x=x, y=y).first()
+        key = (x // CHUNK_SIZE, y // CHUNK_SIZE)
+        old = _BUCKETS.get(key) or ({}, {})
+        blds, ovrs = dict(old[0]), dict(old[1])
+        had = blds.pop((x, y), None) is not None
+        ovrs.pop((x, y), None)
+        if b is not None:
+            blds[(x, y)] = Bld(*b)
+        if o is not None:
+            ovrs[(x, y)] = Ovr(*o)
+        new = (blds, ovrs)
+        sat = dict(_SAT)
+        _sat_add(sat, key, old, new, x, y, (1 if b is not None else -1) if had != (b is not None) else 0)
+        buckets = dict(_BUCKETS)
+        buckets[key] = new
+        _publish(buckets, sat)
+        # кто-то ещё писал между нашими чтениями счётчика — доверять индексу нельзя
+        _VER = ver if ver == prev + 1 else None
+
+
+# ---------- чтение ----------
+def _buckets_in(x0: int, y0: int, x1: int, y1: int):
+    ensure_fresh()
+    buckets = _BUCKETS
+    for cy in range(y0 // CHUNK_SIZE, y1 // CHUNK_SIZE + 1):
+        for cx in range(x0 // CHUNK_SIZE, x1 // CHUNK_SIZE + 1):
+            b = buckets.get((cx, cy))
+            if b is not None:
+                yield b
+
+
+def buildings_in(x0: int, y0: int, x1: int, y1: int) -> List[Bld]:
+    out = []
+    for blds, _ in _buckets_in(x0, y0, x1, y1):
+        out.extend(b for (x, y), b in blds.items() if x0 <= x <= x1 and y0 <= y <= y1)
+    return out
+
+
+# ---------- summed-area table ----------
+def _sat_build(cx: int, cy: int, b):
+    n = CHUNK_SIZE
+    ox, oy = cx * n, cy * n
+    if NUMPY_OK:
+        grid = np.zeros((n + 1, n + 1), dtype=np.int32)
+        for (x, y) in (b[0] if b else ()):
+            grid[y - oy + 1, x - ox + 1] += 1
+        sat = grid.cumsum(axis=0).cumsum(axis=1)
+    else:
+        grid = [[0] * (n + 1) for _ in range(n + 1)]
+        for (x, y) in (b[0] if b else ()):
+            grid[y - oy + 1][x - ox + 1] += 1
+        for j in range(1, n + 1):
+            row, prev = grid[j], grid[j - 1]
+            acc = 0
+            for i in range(1, n + 1):
+                acc += row[i]
+                row[i] = prev[i] + acc
+        sat = grid
+    _SAT[(cx, cy)] = (b, sat)  # гонка с touch безвредна: запись привязана к своей корзине
+    return sat
+
+
+def _sat_of(cx: int, cy: int, b):
+    e = _SAT.get((cx, cy))
+    return e[1] if e is not None and e[0] is b else _sat_build(cx, cy, b)
+
+
+def _sat_add(sat_map: Dict, key, old, new, x: int, y: int, delta: int):
+    """Постройка в (x,y) появилась (+1) / исчезла (-1): копия таблицы старой корзины с инкрементом."""
+    e = sat_map.pop(key, None)
+    if e is None or e[0] is not old:
+        return  # соберётся лениво из новой корзины
+    sat = e[1]
+    i, j = x - key[0] * CHUNK_SIZE + 1, y - key[1] * CHUNK_SIZE + 1
+    if NUMPY_OK:
+        sat = sat.copy()
+        if delta:
+            sat[j:, i:] += delta
+    else:
+        sat = [list(row) for row in sat]
+        for row in (sat[j:] if delta else ()):
+            for k in range(i, CHUNK_SIZE + 1):
+                row[k] += delta
+    sat_map[key] = (new, sat)
+
+
+def count_buildings(x0: int, y0: int, x1: int, y1: int) -> int:
+    """Число построек в прямоугольнике (включительно): O(1) на каждый задетый чанк."""
+    ensure_fresh()
+    buckets = _BUCKETS
+    n = CHUNK_SIZE
+    total = 0
+    for cy in range(y0 // n, y1 // n + 1):
+        for cx in range(x0 // n, x1 // n + 1):
+            bk = buckets.get((cx, cy))
+            if bk is None:
+                continue
+            sat = _sat_of(cx, cy, bk)
+            ox, oy = cx * n, cy * n
+            a, b = max(x0, ox) - ox, max(y0, oy) - oy          # [a..c) × [b..d) в локальных
+            c, d = min(x1, ox + n - 1) - ox + 1, min(y1, oy + n - 1) - oy + 1
+            if NUMPY_OK:
+                total += int(sat[d, c] - sat[b, c] - sat[d, a] + sat[b, a])
+            else:
+                total += sat[d][c] - sat[b][c] - sat[d][a] + sat[b][a]
+    return total
+
+
+def influence(x0: int, y0: int, x1: int, y1: int) -> float:
+    """Плотность построек в прямоугольнике 0..1 (как services_world._player_influence)."""
+    area = max(1, (x1 - x0 + 1) * (y1 - y0 + 1))
+    return min(1.0, max(0.0, count_buildings(x0, y0, x1, y1) / area))
+
+
+def chunk_influence_grid(cx0: int, cy0: int, cx1: int, cy1: int):
+    """
+    Урбанизация каждого чанка региона разом (для пакетного расчёта погоды):
+    [cy1-cy0+1][cx1-cx0+1] — ndarray float64 при NumPy, иначе список списков.
+    """
+    ensure_fresh()
+    n = CHUNK_SIZE
+    h, w = cy1 - cy0 + 1, cx1 - cx0 + 1
+    counts = [[0] * w for _ in range(h)]
+    for (cx, cy), (blds, _) in _BUCKETS.items():  # снимок: словарь после публикации не меняется
+        if blds and cx0 <= cx <= cx1 and cy0 <= cy <= cy1:
+            counts[cy - cy0][cx - cx0] = len(blds)
+    if NUMPY_OK:
+        return np.clip(np.asarray(counts, dtype=np.float64) / float(n * n), 0.0, 1.0)
+    return [[min(1.0, c / float(n * n)) for c in row] for row in counts]
+
+
+def overlay_maps(x0: int, y0: int, x1: int, y1: int):
+    """(bmap, omap) как у services_world._rect_overlay_maps."""
+    bmap: Dict[Tuple[int, int], str] = {}
+    omap: Dict[Tuple[int, int], str] = {}
+    for blds, ovrs in _buckets_in(x0, y0, x1, y1):
+        for k, b in blds.items():
+            if x0 <= k[0] <= x1 and y0 <= k[1] <= y1:
+                bmap[k] = b.kind
+        for k, o in ovrs.items():
+            if x0 <= k[0] <= x1 and y0 <= k[1] <= y1:
+                omap[k] = o.tile_id
+    return bmap, omap
+
+
+def building_at(x: int, y: int) -> Optional[Bld]:
+    ensure_fresh()
+    b = _bucket(x, y)
+    return b[0].get((x, y)) if b is not None else None
+
+
+def override_at(x: int, y: int) -> Optional[Ovr]:
+    ensure_fresh()
+    b = _bucket(x, y)
+    return b[1].get((x, y)) if b is not None else None
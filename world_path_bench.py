@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+world_path_bench.py — сравнение обычного A* и HPA* (порталы чанков) на маршрутах разной длины:
+- для каждой дистанции (--dist 50,200,1000) — --samples целей в случайных направлениях от --center
+- цель сдвигается на ближайшую проходимую клетку (по сеткам цены шага)
+- по каждому планировщику: раскрыто узлов, время, длина и цена пути; «холодный» и «тёплый» прогон HPA*
+
+Пример:
+    python world_path_bench.py --dist 50,200,1000 --samples 3
+    DATABASE_URL=sqlite:////var/www/pocketkingdom/app.db python world_path_bench.py --center=-40,12
+"""
+
+import argparse
+import math
+import random
+import time
+from typing import Iterable, List, Optional, Tuple
+
+from flask import Flask
+
+from models import bind_db
+
+
+def _make_app(db_uri: Optional[str]) -> Flask:
+    app = Flask(__name__)
+    if db_uri:
+        app.config["SQLALCHEMY_DATABASE_URI"] = db_uri
+    bind_db(app)
+    return app
+
+
+def _passable_near(sw, ctx, x: int, y: int, r: int = 16) -> Optional[Tuple[int, int]]:
+    S = sw.CHUNK_SIZE
+    for d in range(r + 1):
+        for dx in range(-d, d + 1):
+            for dy in (-(d - abs(dx)), d - abs(dx)):
+                px, py = x + dx, y + dy
+                g = sw._chunk_cost_grid(ctx, px // S, py // S)
+                if g[(py - (py // S) * S) * S + (px - (px // S) * S)] != sw._INF:
+                    return px, py
+    return None
+
+
+def _path_cost(sw, ctx, path: List[Tuple[int, int]]) -> float:
+    S = sw.CHUNK_SIZE
+    return sum(sw._chunk_cost_grid(ctx, x // S, y // S)[(y - (y // S) * S) * S + (x - (x // S) * S)] for x, y in path)
+
+
+def run(center: Tuple[int, int], dists: List[int], samples: int, max_iter: int, seed: int):
+    import services_world as sw
+    from world_models import ensure_world_models
+    ensure_world_models()
+
+    rnd = random.Random(seed)
+    now = time.time()
+    ctx = sw._TileCtx(now_bucket=math.floor(now / 1800.0) * 1800.0, influence=0.0, bmap={}, omap={})
+    # как в планировщике: прочитанные чанки не пишутся в БД, иначе в замер попадают коммиты SQLite
+    with sw._readonly_chunks():
+        sx, sy = _passable_near(sw, ctx, *center) or center
+
+        print(f"{'dist':>5} {'planner':<9} {'nodes':>8} {'ms':>9} {'len':>6} {'cost':>9}")
+        for dist in dists:
+            for _ in range(samples):
+                a = rnd.uniform(0, 2 * math.pi)
+                goal = _passable_near(sw, ctx, sx + int(dist * math.cos(a)), sy + int(dist * math.sin(a)))
+                if goal is None:
+                    continue
+                tx, ty = goal
+
+                t0 = time.perf_counter()
+                path, n = sw._grid_search(ctx, {}, sx, sy, tx, ty, max_iter)
+                ms = (time.perf_counter() - t0) * 1000.0
+                print(f"{dist:>5} {'A*':<9} {n:>8} {ms:>9.1f} {len(path):>6} {_path_cost(sw, ctx, path):>9.1f}")
+
+                # «холодный» HPA* — без сеток цены и внутричанковых цен порталов от прошлых прогонов
+                sw._COST_GRID.clear()
+                sw._HPA_INTRA.clear()
+                for label in ("HPA*", "HPA*warm"):
+                    t0 = time.perf_counter()
+                    path, st = sw._hpa_path(ctx, sx, sy, tx, ty)
+                    ms = (time.perf_counter() - t0) * 1000.0
+                    n = st["abstract"] + st["refine"]
+                    print(f"{dist:>5} {label:<9} {n:>8} {ms:>9.1f} {len(path):>6} {_path_cost(sw, ctx, path):>9.1f}")
+
+def main(argv: Optional[Iterable[str]] = None):
+    parser = argparse.ArgumentParser(description="Бенчмарк A* против HPA* на маршрутах разной длины.")
+    parser.add_argument("--center", default="0,0", help="x,y старта (по умолчанию спавн 0,0)")
+    parser.add_argument("--dist", default="50,200,1000", help="дистанции в клетках через запятую")
+    parser.add_argument("--samples", type=int, default=3)
+    parser.add_argument("--max-iter", type=int, default=100000, help="предел раскрытий обычного A* (как в _astar)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", default=None, help="SQLALCHEMY_DATABASE_URI (по умолчанию DATABASE_URL / sqlite:///app.db)")
+    args = parser.parse_args(argv)
+
+    cx, cy = [int(v) for v in args.center.split(",")]
+    dists = [int(v) for v in args.dist.split(",") if v.strip()]
+    app = _make_app(args.db)
+    with app.app_context():
+        run((cx, cy), dists, max(1, args.samples), args.max_iter, args.seed)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+world_pregen.py — оффлайн-прогрев карты (до запуска, а не во время пиковой нагрузки):
+- прямоугольник чанков (--rect cx0,cy0,cx1,cy1) или радиус вокруг спавна (--radius N [--center cx,cy])
+- генерация блоками в ProcessPoolExecutor (world_gen.generate_region, векторно при наличии NumPy)
+- запись WorldChunk пачками в одной транзакции, конфликт (cx,cy) — молча пропускаем
+- возобновление: уже существующие (cx,cy) пропускаются ещё до генерации
+- --archive: убрать тайлы, совпадающие с эталоном из сида (строка без экологии удаляется целиком; для WORLD_CHUNK_STORAGE=delta)
+
+Пример:
+    python world_pregen.py --radius 24 --workers 8
+    python world_pregen.py --archive
+    DATABASE_URL=sqlite:////var/www/pocketkingdom/app.db python world_pregen.py --rect=-10,-10,10,10   # отрицательные — через "="
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from flask import Flask
+
+from models import db, bind_db
+from world_gen import generate_region
+from world_models import tiles_columns, archive_pristine_chunks, insert_chunk_rows
+
+CHUNK_SIZE = 32
+
+DEFAULT_WORKERS = os.cpu_count() or 4
+DEFAULT_BLOCK = 4      # сторона блока чанков на одну задачу воркера (4×4 = 16 чанков)
+DEFAULT_BATCH = 512    # чанков на одну транзакцию
+
+
+# ---------- воркер (отдельный процесс) ----------
+def _gen_block(block: Tuple[int, int, int, int], wanted: List[Tuple[int, int]]) -> List[dict]:
+    """Генерирует блок чанков и возвращает готовые к INSERT строки (кодируем тайлы тут же)."""
+    cx0, cy0, cx1, cy1 = block
+    region = generate_region(cx0, cy0, cx1, cy1, CHUNK_SIZE)
+    now = time.time()
+    rows = []
+    for (cx, cy) in wanted:
+        tiles, climate = region[(cx, cy)]
+        rows.append({
+            "cx": cx, "cy": cy, "size": CHUNK_SIZE,
+            **tiles_columns(tiles),
+            "climate_json": json.dumps(climate, separators=(",", ":")),
+            "created_at": now,
+            "eco_json": None,
+            "last_evolve_ts": 0.0,
+        })
+    return rows
+
+
+# ---------- план ----------
+def _parse_pair(s: str) -> Tuple[int, int]:
+    a, b = [int(v) for v in s.split(",")]
+    return a, b
+
+
+def _parse_rect(s: str) -> Tuple[int, int, int, int]:
+    cx0, cy0, cx1, cy1 = [int(v) for v in s.split(",")]
+    return min(cx0, cx1), min(cy0, cy1), max(cx0, cx1), max(cy0, cy1)
+
+
+def _existing_chunks(rect: Tuple[int, int, int, int]) -> Set[Tuple[int, int]]:
+    from world_models import WorldChunk
+    cx0, cy0, cx1, cy1 = rect
+    q = db.session.query(WorldChunk.cx, WorldChunk.cy).filter(
+        WorldChunk.cx >= cx0, WorldChunk.cx <= cx1,
+        WorldChunk.cy >= cy0, WorldChunk.cy <= cy1,
+    )
+    return {(int(cx), int(cy)) for cx, cy in q.all()}
+
+
+def build_blocks(rect: Tuple[int, int, int, int], existing: Set[Tuple[int, int]],
+                 block: int) -> List[Tuple[Tuple[int, int, int, int], List[Tuple[int, int]]]]:
+    """Режем прямоугольник на блоки block×block; в каждом — только недостающие чанки."""
+    cx0, cy0, cx1, cy1 = rect
+    jobs = []
+    for by in range(cy0, cy1 + 1, block):
+        for bx in range(cx0, cx1 + 1, block):
+            b = (bx, by, min(bx + block - 1, cx1), min(by + block - 1, cy1))
+            wanted = [(cx, cy)
+                      for cy in range(b[1], b[3] + 1)
+                      for cx in range(b[0], b[2] + 1)
+                      if (cx, cy) not in existing]
+            if wanted:
+                jobs.append((b, wanted))
+    # ближние к центру — раньше (если прервать, прогретым окажется самое нужное)
+    mx, my = (cx0 + cx1) / 2.0, (cy0 + cy1) / 2.0
+    jobs.sort(key=lambda jb: abs(jb[0][0] - mx) + abs(jb[0][1] - my))
+    return jobs
+
+
+# ---------- запись ----------
+def run_archive(batch: int) -> Dict[str, int]:
+    """Курсором по id прогоняем archive_pristine_chunks до конца таблицы."""
+    from world_models import ensure_world_models
+    ensure_world_models()
+    tot = {"scanned": 0, "deleted": 0, "stripped": 0}
+    last_id = 0
+    while True:
+        res = archive_pristine_chunks(limit=batch, after_id=last_id)
+        for k in tot:
+            tot[k] += res[k]
+        if not res["scanned"]:
+            break
+        last_id = res["last_id"]
+        print(f"[OK] просмотрено {tot['scanned']} • удалено {tot['deleted']} • очищено {tot['stripped']}")
+    return tot
+
+
+# ---------- main ----------
+def _make_app(db_uri: Optional[str]) -> Flask:
+    app = Flask(__name__)
+    if db_uri:
+        app.config["SQLALCHEMY_DATABASE_URI"] = db_uri
+    bind_db(app)
+    return app
+
+
+def run(rect: Tuple[int, int, int, int], workers: int, block: int, batch: int) -> Dict[str, float]:
+    from world_models import ensure_world_models
+    ensure_world_models()
+
+    total = (rect[2] - rect[0] + 1) * (rect[3] - rect[1] + 1)
+    existing = _existing_chunks(rect)
+    jobs = build_blocks(rect, existing, max(1, block))
+    todo = sum(len(w) for _, w in jobs)
+
+    print(f"[INFO] Прямоугольник чанков: {rect} • всего {total} • уже есть {len(existing)} • к генерации {todo}")
+    if not todo:
+        return {"total": total, "written": 0, "skipped": 0, "elapsed": 0.0, "rate": 0.0}
+
+    t0 = time.perf_counter()
+    pending: List[dict] = []
+    written = skipped = 0
+
+    def flush():
+        nonlocal pending, written, skipped
+        n = insert_chunk_rows(pending)
+        written += n
+        skipped += len(pending) - n  # (cx,cy) успел вставить кто-то другой
+        pending = []
+        dt = max(1e-6, time.perf_counter() - t0)
+        print(f"[OK] {written}/{todo} (пропущено {skipped}) • {written / dt:.1f} чанков/с")
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max(1, workers)) as ex:
+        futures = [ex.submit(_gen_block, b, w) for b, w in jobs]
+        for fut in concurrent.futures.as_completed(futures):
+            pending.extend(fut.result())
+            if len(pending) >= batch:
+                flush()
+    if pending:
+        flush()
+
+    elapsed = time.perf_counter() - t0
+    rate = written / max(1e-6, elapsed)
+    return {"total": total, "written": written, "skipped": skipped, "elapsed": elapsed, "rate": rate}
+
+
+def main(argv: Optional[Iterable[str]] = None):
+    parser = argparse.ArgumentParser(description="Предгенерация чанков мира в БД.")
+    g = parser.add_mutually_exclusive_group(required=True)
+    g.add_argument("--rect", help="cx0,cy0,cx1,cy1 (включительно, в чанках)")
+    g.add_argument("--radius", type=int, help="радиус в чанках вокруг --center")
+    g.add_argument("--archive", action="store_true", help="удалить нетронутые чанки (тайлы = эталон из сида)")
+    parser.add_argument("--center", default="0,0", help="cx,cy центра для --radius (по умолчанию спавн 0,0)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--block", type=int, default=DEFAULT_BLOCK)
+    parser.add_argument("--batch", type=int, default=DEFAULT_BATCH)
+    parser.add_argument("--db", default=None, help="SQLALCHEMY_DATABASE_URI (по умолчанию DATABASE_URL / sqlite:///app.db)")
+
+    args = parser.parse_args(argv)
+
+    if args.archive:
+        app = _make_app(args.db)
+        with app.app_context():
+            tot = run_archive(max(1, args.batch))
+        print(f"\n[SUMMARY] Просмотрено: {tot['scanned']} • удалено: {tot['deleted']} • очищено: {tot['stripped']}")
+        return 0
+
+    try:
+        if args.rect:
+            rect = _parse_rect(args.rect)
+        else:
+            ccx, ccy = _parse_pair(args.center)
+            r = max(0, int(args.radius))
+            rect = (ccx - r, ccy - r, ccx + r, ccy + r)
+    except Exception:
+        print("[ERR] Неверный формат --rect/--center", file=sys.stderr)
+        return 2
+
+    app = _make_app(args.db)
+    with app.app_context():
+        res = run(rect, workers=args.workers, block=args.block, batch=max(1, args.batch))
+
+    print(f"\n[SUMMARY] Записано: {res['written']} из {res['total']} (пропущено {res['skipped']}) • "
+          f"{res['elapsed']:.1f} с • {res['rate']:.1f} чанков/с")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
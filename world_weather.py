@@ -1,26 +1,37 @@
 # world_weather.py — пространственно связная погода с мягкими переходами
 
 from __future__ import annotations
-import math, random
-from typing import Dict, Optional
+import math, random, threading
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
 from collections import OrderedDict
 from world_tuning import weather_slot_seconds
 
+try:
+    import numpy as np
+    NUMPY_OK = True
+except Exception:
+    np = None  # type: ignore
+    NUMPY_OK = False
+
 # ---------------- small LRU ----------------
 _WEATHER_CACHE: "OrderedDict[tuple, Dict[str,object]]" = OrderedDict()
 _WEATHER_CACHE_MAX = 1024
+_WEATHER_LOCK = threading.Lock()  # общий для потоков запросов и пула планировщика
 
 def _cache_get(k: tuple):
-    v = _WEATHER_CACHE.get(k)
-    if v is not None:
-        _WEATHER_CACHE.move_to_end(k)
+    with _WEATHER_LOCK:
+        v = _WEATHER_CACHE.get(k)
+        if v is not None:
+            _WEATHER_CACHE.move_to_end(k)
     return v
 
 def _cache_put(k: tuple, v: Dict[str,object]):
-    _WEATHER_CACHE[k] = v
-    _WEATHER_CACHE.move_to_end(k)
-    if len(_WEATHER_CACHE) > _WEATHER_CACHE_MAX:
-        _WEATHER_CACHE.popitem(last=False)
+    with _WEATHER_LOCK:
+        _WEATHER_CACHE[k] = v
+        _WEATHER_CACHE.move_to_end(k)
+        while len(_WEATHER_CACHE) > _WEATHER_CACHE_MAX:
+            _WEATHER_CACHE.popitem(last=False)
 
 # ---------------- base utils ----------------
 def _clamp(v, a, b):
@@ -82,11 +93,95 @@ def _fbm2(x: float, y: float, slot:int, chan:int=0, octaves:int=2, lacunarity:fl
         freq *= lacunarity
     return s / max(1e-6, norm)
 
+# ------------- то же самое пачкой (NumPy) -------------
+# Формулы повторяют скалярные операция в операцию (float64, тот же порядок) — результат
+# совпадает бит в бит. Хеш в int64: x*374761393 и т.п. не переполняются для любых
+# реальных координат чанков, сдвиг >> арифметический, как у Python int.
+def _hash32_np(x, y, slot:int, chan:int):
+    c = (slot * 1442695040888963407 & 0xffffffff) ^ (chan*2654435761)
+    h = (x * 374761393) ^ (y * 668265263) ^ c
+    h = (h ^ (h >> 13)) & 0xffffffff
+    h = (h * 1274126177) & 0xffffffff
+    h = (h ^ (h >> 16)) & 0xffffffff
+    return h
+
+def _value_noise_np(x, y, slot:int, chan:int):
+    fl_x, fl_y = np.floor(x), np.floor(y)
+    fx, fy = x - fl_x, y - fl_y
+    sfx, sfy = fx * fx * (3.0 - 2.0 * fx), fy * fy * (3.0 - 2.0 * fy)
+    ix, iy = fl_x.astype(np.int64), fl_y.astype(np.int64)
+    v00 = _hash32_np(ix+0, iy+0, slot, chan) / 4294967296.0
+    v10 = _hash32_np(ix+1, iy+0, slot, chan) / 4294967296.0
+    v01 = _hash32_np(ix+0, iy+1, slot, chan) / 4294967296.0
+    v11 = _hash32_np(ix+1, iy+1, slot, chan) / 4294967296.0
+    vx0 = v00 + (v10 - v00) * sfx
+    vx1 = v01 + (v11 - v01) * sfx
+    return vx0 + (vx1 - vx0) * sfy
+
+def _fbm2_np(x, y, slot:int, chan:int):
+    """_fbm2 с octaves=2, lacunarity=2, gain=0.5."""
+    s = 0.0 + _value_noise_np(x * 1.0, y * 1.0, slot, chan) * 1.0
+    s = s + _value_noise_np(x * 2.0, y * 2.0, slot, chan) * 0.5
+    return s / 1.5
+
+# (масштаб, канал) полей: precip, storm, fog, tanom
+_FIELDS = ((4.0, 11), (5.0, 22), (4.0, 33), (8.0, 44))
+
+def _fields_scalar(cx:int, cy:int, slotA:int, slotB:int, alpha: float) -> Tuple[float, float, float, float]:
+    out = []
+    for scale, chan in _FIELDS:
+        ax = cx / scale
+        ay = cy / scale
+        fa = _fbm2(ax, ay, slotA, chan=chan, octaves=2)
+        fb = _fbm2(ax, ay, slotB, chan=chan, octaves=2)
+        out.append(_lerp(fa, fb, alpha))
+    return tuple(out)
+
+def weather_fields_grid(cxs, cys, slotA:int, slotB:int, alpha: float):
+    """
+    Поля (precip, storm, fog, tanom) для массивов координат чанков при данных (slotA, slotB, alpha).
+    Возвращает четыре ndarray той же формы; без NumPy — списки, посчитанные по одному.
+    """
+    if not NUMPY_OK:
+        cols = list(zip(*[_fields_scalar(int(x), int(y), slotA, slotB, alpha) for x, y in zip(cxs, cys)]))
+        return tuple(list(c) for c in cols) if cols else ([], [], [], [])
+    cx = np.asarray(cxs, dtype=np.int64)
+    cy = np.asarray(cys, dtype=np.int64)
+    out = []
+    for scale, chan in _FIELDS:
+        ax = cx / scale
+        ay = cy / scale
+        fa = _fbm2_np(ax, ay, slotA, chan)
+        fb = _fbm2_np(ax, ay, slotB, chan)
+        out.append(fa + (fb - fa) * alpha)
+    return tuple(out)
+
+@lru_cache(maxsize=4096)
+def _pick_draw(seed: int) -> float:
+    """Первое random() генератора с этим сидом: сид зависит только от климата и слота, не от чанка."""
+    return random.Random(seed).random()
+
 def _q(x: float, step: float) -> int:
     """Квантование для ключа кэша (стабильно и дешево)."""
     return int(_clamp(x, 0.0, 1.0) / step) if step > 0 else int(x)
 
 # ---------------- main picker ----------------
+def _slots(now_bucket: float, now_ts: Optional[float]) -> Tuple[int, int, float]:
+    slot0 = int(now_bucket // WEATHER_SLOT_SEC)
+    if now_ts is None:
+        return slot0, slot0, 0.0
+    start = math.floor(now_ts / WEATHER_SLOT_SEC) * WEATHER_SLOT_SEC
+    frac  = _clamp((now_ts - start) / WEATHER_SLOT_SEC, 0.0, 1.0)
+    return slot0, slot0 + 1, _smoothstep(frac)
+
+def _cache_key(cx:int, cy:int, slotA:int, slotB:int, alpha: float, climate: Dict[str,float], urbanization: float) -> tuple:
+    return (
+        cx, cy, slotA, slotB, _q(alpha, 0.05),
+        _q(float(climate.get("temp", 0.5)), 0.02), _q(float(climate.get("moist", 0.5)), 0.02),
+        _q(float(climate.get("height_mean", 0.5)), 0.02), _q(float(climate.get("forest_density", 0.0)), 0.02),
+        _q(float(urbanization or 0.0), 0.1)
+    )
+
 def pick_weather_for_chunk(climate: Dict[str,float],
                            urbanization: float,
                            now_bucket: float,
@@ -98,6 +193,62 @@ def pick_weather_for_chunk(climate: Dict[str,float],
     Возвращает погодное состояние с коррелированными по пространству полями.
     КЭШИРУЕТСЯ по (cx,cy, slotA/slotB, alpha_q, климату и урбанизации).
     """
+    _cx = int(cx) if cx is not None else 0
+    _cy = int(cy) if cy is not None else 0
+    slotA, slotB, alpha = _slots(now_bucket, now_ts)
+
+    # --- попробуем кэш ---
+    key = _cache_key(_cx, _cy, slotA, slotB, alpha, climate, urbanization)
+    cached = _cache_get(key)
+    if cached is not None:
+        # возвращаем копию, чтобы никто не портил кэш
+        return dict(cached)
+
+    out = _weather_from_fields(climate, urbanization, now_bucket, _fields_scalar(_cx, _cy, slotA, slotB, alpha))
+    _cache_put(key, out)
+    return dict(out)
+
+def pick_weather_for_chunks(coords: Iterable[Tuple[int,int]],
+                            climate_of: Callable[[int, int], Dict[str,float]],
+                            urbanization: Union[float, Callable[[int, int], float]],
+                            now_bucket: float,
+                            now_ts: Optional[float]=None) -> Dict[Tuple[int,int], Dict[str, object]]:
+    """
+    Пакетный pick_weather_for_chunk для набора чанков (прямоугольник патча, коридор маршрута):
+    шумовые поля всех промахов кэша — одним проходом NumPy, дальше та же скалярная часть.
+    Ответы и кэш — те же, что дали бы поштучные вызовы с этим now_ts.
+    urbanization — число на всех или функция (cx, cy) -> урбанизация чанка.
+    """
+    slotA, slotB, alpha = _slots(now_bucket, now_ts)
+    urb_of = urbanization if callable(urbanization) else (lambda cx, cy, u=urbanization: u)
+    out: Dict[Tuple[int,int], Dict[str, object]] = {}
+    miss: List[Tuple[Tuple[int,int], Dict[str,float], float, tuple]] = []
+    for cx, cy in coords:
+        c = (int(cx), int(cy))
+        if c in out:
+            continue
+        climate = climate_of(*c)
+        urb = urb_of(*c)
+        key = _cache_key(c[0], c[1], slotA, slotB, alpha, climate, urb)
+        cached = _cache_get(key)
+        if cached is not None:
+            out[c] = dict(cached)
+        else:
+            out[c] = None  # type: ignore
+            miss.append((c, climate, urb, key))
+    if not miss:
+        return out
+
+    fields = weather_fields_grid([m[0][0] for m in miss], [m[0][1] for m in miss], slotA, slotB, alpha)
+    cols = [f.tolist() if NUMPY_OK else f for f in fields]
+    for i, (c, climate, urb, key) in enumerate(miss):
+        w = _weather_from_fields(climate, urb, now_bucket, (cols[0][i], cols[1][i], cols[2][i], cols[3][i]))
+        _cache_put(key, w)
+        out[c] = dict(w)
+    return out
+
+def _weather_from_fields(climate: Dict[str,float], urbanization: float, now_bucket: float,
+                         fields: Tuple[float, float, float, float]) -> Dict[str, object]:
     t  = float(climate.get("temp", 0.5))
     m  = float(climate.get("moist", 0.5))
     h  = float(climate.get("height_mean", 0.5))
@@ -109,48 +260,7 @@ def pick_weather_for_chunk(climate: Dict[str,float],
     t_eff = t + 0.35*seas + 0.08*dn - 0.35*h + 0.10*float(urbanization or 0.0)
     t_eff = _clamp(t_eff, 0.0, 1.0)
 
-    _cx = int(cx) if cx is not None else 0
-    _cy = int(cy) if cy is not None else 0
-
-    SCALE_PRECIP = 4.0
-    SCALE_STORM  = 5.0
-    SCALE_FOG    = 4.0
-    SCALE_TEMP   = 8.0
-
-    slot0 = int(now_bucket // WEATHER_SLOT_SEC)
-    if now_ts is None:
-        alpha = 0.0
-        slotA = slot0
-        slotB = slot0
-    else:
-        start = math.floor(now_ts / WEATHER_SLOT_SEC) * WEATHER_SLOT_SEC
-        frac  = _clamp((now_ts - start) / WEATHER_SLOT_SEC, 0.0, 1.0)
-        alpha = _smoothstep(frac)
-        slotA = slot0
-        slotB = slot0 + 1
-
-    # --- попробуем кэш ---
-    key = (
-        _cx, _cy, slotA, slotB, _q(alpha, 0.05),
-        _q(t, 0.02), _q(m, 0.02), _q(h, 0.02), _q(f, 0.02),
-        _q(float(urbanization or 0.0), 0.1)
-    )
-    cached = _cache_get(key)
-    if cached is not None:
-        # возвращаем копию, чтобы никто не портил кэш
-        return dict(cached)
-
-    def field(scale: float, chan:int) -> float:
-        ax = _cx / scale
-        ay = _cy / scale
-        fa = _fbm2(ax, ay, slotA, chan=chan, octaves=2)
-        fb = _fbm2(ax, ay, slotB, chan=chan, octaves=2)
-        return _lerp(fa, fb, alpha)
-
-    precip_field = field(SCALE_PRECIP, 11)
-    storm_field  = field(SCALE_STORM,  22)
-    fog_field    = field(SCALE_FOG,    33)
-    temp_anom    = field(SCALE_TEMP,   44)
+    precip_field, storm_field, fog_field, temp_anom = fields
 
     t_eff2 = _clamp(t_eff + (temp_anom - 0.5)*0.16, 0.0, 1.0)
 
@@ -196,12 +306,11 @@ def pick_weather_for_chunk(climate: Dict[str,float],
         "heat":  w_heat,
     }
 
-    rnd = random.Random(_seed_from(climate, now_bucket))
     total = sum(max(0.0,w) for w in weights.values())
     if total <= 1e-6:
         key_choice = "clear"
     else:
-        r = rnd.random() * total
+        r = _pick_draw(_seed_from(climate, now_bucket)) * total
         acc = 0.0
         key_choice = "clear"
         for k, w in weights.items():
@@ -250,5 +359,4 @@ def pick_weather_for_chunk(climate: Dict[str,float],
         }
     }
 
-    _cache_put(key, out)
-    return dict(out)
+    return out